@@ -0,0 +1,76 @@
+import fcntl
+import os
+from pathlib import Path
+from typing import Optional
+
+
+class FileLock:
+    """
+    Advisory inter-process lock backed by `flock` on a lock file.
+    The lock is exclusive by default; `shared=True` takes a shared (reader) lock instead.
+    With `create=False`, the lock file is opened read-only and never created: acquiring raises FileNotFoundError
+    if it doesn't exist, which lets a lock be probed without side effects, e.g. on a read-only folder.
+
+    Example:
+        >>> with FileLock(Path('/tmp/my.lock')):
+        ...     # only one process at a time gets here
+        ...     pass
+    """
+
+    def __init__(self, path: str | Path, shared: bool = False, create: bool = True):
+        self._path = Path(path)
+        self._shared = shared
+        self._create = create
+        self._fd: Optional[int] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def is_locked(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Acquire the lock. Returns False if `blocking` is False and the lock is held by someone else."""
+        if self._fd is not None:
+            raise RuntimeError(f"Lock is already acquired: {self._path}")
+
+        if self._create:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o666)
+        else:
+            fd = os.open(self._path, os.O_RDONLY)
+        operation = fcntl.LOCK_SH if self._shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+
+        try:
+            fcntl.flock(fd, operation)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+
+        fd, self._fd = self._fd, None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+        return False
@@ -0,0 +1,253 @@
+import io
+import os
+import struct
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Deque, List, Optional, Tuple
+
+from dstools.compression.compressor import Compressor
+from dstools.compression.registry import get_compressor
+
+# container layout:
+#   header:  magic, format version (u8), inner codec name length (u8), inner codec name
+#   frames:  per block, compressed length (u32), uncompressed length (u32), compressed block; a (0, 0) frame ends them
+#   index:   per block, offset of the compressed block (u64), compressed length (u32), uncompressed length (u32)
+#   trailer: index offset (u64), block count (u32), index magic
+BLOCK_CONTAINER_MAGIC = b'DSBP'
+BLOCK_INDEX_MAGIC = b'DSBI'
+BLOCK_CONTAINER_VERSION = 1
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+_MAX_BLOCK_SIZE = 2 ** 32 - 1
+
+_FRAME = struct.Struct('<II')
+_INDEX_ENTRY = struct.Struct('<QII')
+_TRAILER = struct.Struct('<QI4s')
+
+
+@dataclass(frozen=True)
+class BlockIndexEntry:
+    offset: int
+    compressed_size: int
+    size: int
+
+
+def _read_exactly(stream: BinaryIO, n: int) -> bytes:
+    data = stream.read(n)
+    while len(data) < n:
+        chunk = stream.read(n - len(data))
+        if not chunk:
+            raise ValueError(f"Truncated block container: expected {n} bytes, got {len(data)}")
+        data += chunk
+    return data
+
+
+def _read_header(stream: BinaryIO) -> Tuple[str, int]:
+    """Return the inner codec name and the header length."""
+    prefix = _read_exactly(stream, len(BLOCK_CONTAINER_MAGIC) + 2)
+    if not prefix.startswith(BLOCK_CONTAINER_MAGIC):
+        raise ValueError("Not a block container: bad magic")
+
+    version, name_length = prefix[len(BLOCK_CONTAINER_MAGIC)], prefix[len(BLOCK_CONTAINER_MAGIC) + 1]
+    if version != BLOCK_CONTAINER_VERSION:
+        raise ValueError(f"Unsupported block container version: {version}")
+    return _read_exactly(stream, name_length).decode('ascii'), len(prefix) + name_length
+
+
+def read_block_index(data: bytes) -> Tuple[str, List[BlockIndexEntry]]:
+    """Return the inner codec name and the block index of a block container."""
+    codec_name, _ = _read_header(io.BytesIO(data[:len(BLOCK_CONTAINER_MAGIC) + 2 + 255]))
+    index_offset, n_blocks, magic = _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+    if magic != BLOCK_INDEX_MAGIC:
+        raise ValueError("Block container has no index: bad trailer magic")
+
+    entries = [
+        BlockIndexEntry(*_INDEX_ENTRY.unpack_from(data, index_offset + i * _INDEX_ENTRY.size))
+        for i in range(n_blocks)
+    ]
+    return codec_name, entries
+
+
+class _ContainerWriter:
+    """Writes frames to `raw` while keeping track of the block index."""
+
+    def __init__(self, raw: BinaryIO, codec_name: str):
+        self._raw = raw
+        self._offset = 0
+        self._index: List[BlockIndexEntry] = []
+        name = codec_name.encode('ascii')
+        self._write(BLOCK_CONTAINER_MAGIC + bytes([BLOCK_CONTAINER_VERSION, len(name)]) + name)
+
+    def _write(self, data: bytes):
+        self._raw.write(data)
+        self._offset += len(data)
+
+    def write_block(self, compressed: bytes, size: int):
+        self._write(_FRAME.pack(len(compressed), size))
+        self._index.append(BlockIndexEntry(self._offset, len(compressed), size))
+        self._write(compressed)
+
+    def finish(self):
+        self._write(_FRAME.pack(0, 0))
+        index_offset = self._offset
+        self._write(b''.join(_INDEX_ENTRY.pack(e.offset, e.compressed_size, e.size) for e in self._index))
+        self._write(_TRAILER.pack(index_offset, len(self._index), BLOCK_INDEX_MAGIC))
+
+
+class BlockParallelCompressor(Compressor):
+    """
+    Splits the input into independent blocks of `block_size` bytes and compresses them with `codec` on a pool of
+    `max_workers` threads. zlib, lzma and snappy release the GIL, so blocks are compressed on multiple cores.
+
+    The output is a framed container with a trailing block index, decompressed in parallel as well. It records the
+    inner codec name, so any BlockParallelCompressor decompresses it regardless of its own codec.
+    The ratio is slightly lower than compressing the whole input at once, since blocks don't share history.
+    """
+
+    name = 'block'
+
+    def __init__(
+            self,
+            codec: Optional[Compressor] = None,
+            block_size: int = DEFAULT_BLOCK_SIZE,
+            max_workers: Optional[int] = None
+    ):
+        codec = codec or get_compressor('zlib')
+        if not codec.name:
+            raise ValueError(f"Compressor {type(codec).__name__} has no codec name, it can't be used for blocks")
+        if not 0 < block_size <= _MAX_BLOCK_SIZE:
+            raise ValueError(f"block_size must be between 1 and {_MAX_BLOCK_SIZE}, got {block_size}")
+
+        self._codec = codec
+        self._block_size = block_size
+        self._max_workers = max_workers or os.cpu_count() or 1
+
+    def _inner_codec(self, name: str) -> Compressor:
+        return self._codec if name == self._codec.name else get_compressor(name)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='block-compress')
+
+    def compress(self, data: bytes) -> bytes:
+        view = memoryview(data)
+        blocks = [view[i:i + self._block_size] for i in range(0, len(view), self._block_size)]
+        out = io.BytesIO()
+        writer = _ContainerWriter(out, self._codec.name)
+        with self._executor() as pool:
+            for block, compressed in zip(blocks, pool.map(self._codec.compress, blocks)):
+                writer.write_block(compressed, len(block))
+        writer.finish()
+        return out.getvalue()
+
+    def decompress(self, data: bytes) -> bytes:
+        codec_name, entries = read_block_index(data)
+        codec = self._inner_codec(codec_name)
+        view = memoryview(data)
+        blocks = [view[e.offset:e.offset + e.compressed_size] for e in entries]
+        with self._executor() as pool:
+            return b''.join(pool.map(codec.decompress, blocks))
+
+    def compress_writer(self, raw: BinaryIO) -> BinaryIO:
+        return _BlockCompressingWriter(raw, self._codec, self._block_size, self._executor(), self._max_workers)
+
+    def decompress_reader(self, raw: BinaryIO) -> BinaryIO:
+        codec_name, _ = _read_header(raw)
+        return io.BufferedReader(
+            _BlockDecompressingReader(raw, self._inner_codec(codec_name), self._executor(), self._max_workers),
+            buffer_size=self._block_size
+        )
+
+
+class _BlockCompressingWriter(io.RawIOBase):
+    """Compresses full blocks on the executor while writing finished ones in order, with bounded read-ahead."""
+
+    def __init__(self, raw: BinaryIO, codec: Compressor, block_size: int, executor: ThreadPoolExecutor, workers: int):
+        super().__init__()
+        self._writer = _ContainerWriter(raw, codec.name)
+        self._codec = codec
+        self._block_size = block_size
+        self._executor = executor
+        self._max_pending = 2 * workers
+        self._pending: Deque[Tuple[int, Future]] = deque()
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed stream")
+
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return len(data)
+
+    def _submit(self, block: bytes):
+        self._pending.append((len(block), self._executor.submit(self._codec.compress, block)))
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def _write_next(self):
+        size, future = self._pending.popleft()
+        self._writer.write_block(future.result(), size)
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                    self._buffer.clear()
+                while self._pending:
+                    self._write_next()
+                self._writer.finish()
+            finally:
+                self._executor.shutdown(cancel_futures=True)
+        super().close()
+
+
+class _BlockDecompressingReader(io.RawIOBase):
+    """Reads frames sequentially and decompresses up to `2 * workers` blocks ahead on the executor."""
+
+    def __init__(self, raw: BinaryIO, codec: Compressor, executor: ThreadPoolExecutor, workers: int):
+        super().__init__()
+        self._raw = raw
+        self._codec = codec
+        self._executor = executor
+        self._max_pending = 2 * workers
+        self._pending: Deque[Future] = deque()
+        self._frames_done = False
+        self._block = b''
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self):
+        while not self._frames_done and len(self._pending) < self._max_pending:
+            compressed_size, size = _FRAME.unpack(_read_exactly(self._raw, _FRAME.size))
+            if compressed_size == 0 and size == 0:
+                # the index and trailer follow, sequential reads don't need them
+                self._frames_done = True
+                break
+            self._pending.append(self._executor.submit(self._codec.decompress, _read_exactly(self._raw, compressed_size)))
+
+    def readinto(self, b) -> int:
+        while self._offset >= len(self._block):
+            self._fill()
+            if not self._pending:
+                return 0
+            self._block = self._pending.popleft().result()
+            self._offset = 0
+
+        n = min(len(b), len(self._block) - self._offset)
+        b[:n] = self._block[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._executor.shutdown(cancel_futures=True)
+        super().close()
@@ -0,0 +1,200 @@
+"""
+Codec benchmark and selection.
+
+Samples a payload or a folder, measures the compression ratio and compress/decompress throughput of candidate codec
+specs ("name" or "name:level", see dstools.compression.registry), and recommends the codec that moves the data fastest
+end to end for a given transfer bandwidth: compress time + transfer time of the compressed bytes + decompress time.
+The codec name is written into the headers of compressed artifacts, so readers never need to know which was chosen.
+
+Usage:
+    python -m dstools.compression.codec_benchmark path/to/folder_or_file --bandwidth 100 --json results.json
+"""
+import argparse
+import io
+import json
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from dstools.compression.registry import get_compressor
+
+DEFAULT_CANDIDATES = ('snappy', 'zlib:1', 'zlib:6', 'zlib:9', 'lzma:0', 'lzma:6')
+DEFAULT_SAMPLE_SIZE = 16 * 1024 * 1024
+_SAMPLE_SLICES = 16
+
+
+@dataclass(frozen=True)
+class CodecResult:
+    spec: str
+    original_bytes: int
+    compressed_bytes: int
+    compress_seconds: float
+    decompress_seconds: float
+
+    @property
+    def ratio(self) -> float:
+        return self.original_bytes / self.compressed_bytes if self.compressed_bytes else float('inf')
+
+    @property
+    def compress_mb_per_second(self) -> float:
+        return self.original_bytes / self.compress_seconds / 1024 ** 2 if self.compress_seconds else float('inf')
+
+    @property
+    def decompress_mb_per_second(self) -> float:
+        return self.original_bytes / self.decompress_seconds / 1024 ** 2 if self.decompress_seconds else float('inf')
+
+    def estimate_seconds(self, size: int, bandwidth_mb_per_second: float) -> float:
+        """Estimated time to compress, transfer and decompress `size` bytes of similar data."""
+        scale = size / self.original_bytes if self.original_bytes else 0.0
+        transfer_seconds = size / self.ratio / (bandwidth_mb_per_second * 1024 ** 2)
+        return scale * (self.compress_seconds + self.decompress_seconds) + transfer_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            **asdict(self),
+            'ratio': self.ratio,
+            'compress_mb_per_second': self.compress_mb_per_second,
+            'decompress_mb_per_second': self.decompress_mb_per_second,
+        }
+
+
+def sample_bytes(data: bytes, sample_size: int = DEFAULT_SAMPLE_SIZE) -> bytes:
+    """Evenly spaced slices of `data`, `sample_size` bytes in total, so the sample covers the whole payload."""
+    if len(data) <= sample_size:
+        return data
+
+    slice_size = sample_size // _SAMPLE_SLICES
+    step = len(data) // _SAMPLE_SLICES
+    return b''.join(data[i * step:i * step + slice_size] for i in range(_SAMPLE_SLICES))
+
+
+def sample_file(path: Path, sample_size: int = DEFAULT_SAMPLE_SIZE) -> bytes:
+    """`sample_bytes` of a file's content, reading only the sampled slices."""
+    with open(path, 'rb') as f:
+        size = f.seek(0, io.SEEK_END)
+        if size <= sample_size:
+            f.seek(0)
+            return f.read()
+
+        slice_size = sample_size // _SAMPLE_SLICES
+        step = size // _SAMPLE_SLICES
+        chunks = []
+        for i in range(_SAMPLE_SLICES):
+            f.seek(i * step)
+            chunks.append(f.read(slice_size))
+    return b''.join(chunks)
+
+
+def sample_folder(folder: Path, sample_size: int = DEFAULT_SAMPLE_SIZE) -> bytes:
+    """Leading bytes of the files in a folder, with an equal share for every file (sorted, so samples are stable)."""
+    files = sorted(path for path in Path(folder).rglob('*') if path.is_file())
+    if not files:
+        return b''
+
+    share = max(sample_size // len(files), 4096)
+    chunks = []
+    total = 0
+    for path in files:
+        with open(path, 'rb') as f:
+            chunk = f.read(min(share, sample_size - total))
+        chunks.append(chunk)
+        total += len(chunk)
+        if total >= sample_size:
+            break
+    return b''.join(chunks)
+
+
+def sample_path(path: Path, sample_size: int = DEFAULT_SAMPLE_SIZE) -> bytes:
+    path = Path(path)
+    if path.is_dir():
+        return sample_folder(path, sample_size)
+    return sample_file(path, sample_size)
+
+
+def _best_of(repeat: int, func) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_codec(sample: bytes, spec: str, repeat: int = 3) -> CodecResult:
+    compressor = get_compressor(spec)
+    compressed = compressor.compress(sample)
+    if compressor.decompress(compressed) != sample:
+        raise ValueError(f"Codec {spec} failed to round-trip the sample")
+
+    return CodecResult(
+        spec=spec,
+        original_bytes=len(sample),
+        compressed_bytes=len(compressed),
+        compress_seconds=_best_of(repeat, lambda: compressor.compress(sample)),
+        decompress_seconds=_best_of(repeat, lambda: compressor.decompress(compressed)),
+    )
+
+
+def benchmark_codecs(sample: bytes, candidates: Sequence[str] = DEFAULT_CANDIDATES, repeat: int = 3) -> List[CodecResult]:
+    return [benchmark_codec(sample, spec, repeat) for spec in candidates]
+
+
+def recommend_codec(
+        results: Sequence[CodecResult],
+        bandwidth_mb_per_second: float,
+        min_compress_mb_per_second: Optional[float] = None
+) -> CodecResult:
+    """
+    The codec with the lowest estimated compress + transfer + decompress time at the given bandwidth.
+    `min_compress_mb_per_second` excludes codecs that are too CPU hungry for the writer; if none qualifies,
+    the fastest compressor is returned.
+    """
+    if not results:
+        raise ValueError("No codec results to recommend from")
+
+    eligible = [
+        result for result in results
+        if min_compress_mb_per_second is None or result.compress_mb_per_second >= min_compress_mb_per_second
+    ]
+    if not eligible:
+        return max(results, key=lambda result: result.compress_mb_per_second)
+
+    size = max(result.original_bytes for result in results)
+    return min(eligible, key=lambda result: result.estimate_seconds(size, bandwidth_mb_per_second))
+
+
+def format_results(results: Sequence[CodecResult], bandwidth_mb_per_second: float) -> str:
+    header = f"{'codec':<10}{'ratio':>8}{'comp MB/s':>12}{'decomp MB/s':>13}{'est. s/GB':>11}"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        lines.append(
+            f"{result.spec:<10}{result.ratio:>8.2f}{result.compress_mb_per_second:>12.1f}"
+            f"{result.decompress_mb_per_second:>13.1f}{result.estimate_seconds(1024 ** 3, bandwidth_mb_per_second):>11.2f}"
+        )
+    return '\n'.join(lines)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Benchmark compression codecs on a sample of a file or folder')
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--bandwidth', type=float, default=100.0, help='transfer bandwidth (MB/s) to optimize for')
+    parser.add_argument('--min-compress-speed', type=float, help='minimal acceptable compression speed (MB/s)')
+    parser.add_argument('--codecs', nargs='*', default=list(DEFAULT_CANDIDATES), help='codec specs, e.g. zlib:6')
+    parser.add_argument('--sample-size', type=int, default=DEFAULT_SAMPLE_SIZE)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', type=Path, help='write the results to this json file')
+    parsed = parser.parse_args(args)
+
+    sample = sample_path(parsed.path, parsed.sample_size)
+    results = benchmark_codecs(sample, parsed.codecs, parsed.repeat)
+    best = recommend_codec(results, parsed.bandwidth, parsed.min_compress_speed)
+    print(format_results(results, parsed.bandwidth))
+    print(f"\nrecommended codec at {parsed.bandwidth} MB/s: {best.spec}")
+    if parsed.json:
+        with open(parsed.json, 'w') as f:
+            json.dump({'recommended': best.spec, 'results': [r.to_dict() for r in results]}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
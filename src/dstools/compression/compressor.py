@@ -1,9 +1,22 @@
-
-
+import io
+import shutil
 from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional
+
+from dstools.compression.streams import (
+    BufferedCompressingWriter,
+    CompressingWriter,
+    DecompressingReader,
+    IncrementalCompressor,
+    IncrementalDecompressor,
+    DEFAULT_STREAM_CHUNK_SIZE,
+)
 
 
 class Compressor(ABC):
+    # registry name of the codec (see dstools.compression.registry), used to tag compressed payloads
+    name: Optional[str] = None
+
     @abstractmethod
     def compress(self, data: bytes) -> bytes:
         raise NotImplementedError()
@@ -11,3 +24,42 @@ class Compressor(ABC):
     @abstractmethod
     def decompress(self, data: bytes) -> bytes:
         raise NotImplementedError()
+
+    def compressobj(self) -> Optional[IncrementalCompressor]:
+        """New incremental compression object (`compress(chunk)` / `flush()`), or None if the codec can't stream."""
+        return None
+
+    def decompressobj(self) -> Optional[IncrementalDecompressor]:
+        """New incremental decompression object for the output of `compressobj`, or None if the codec can't stream."""
+        return None
+
+    def compress_writer(self, raw: BinaryIO) -> BinaryIO:
+        """
+        Writable stream that compresses into `raw`; closing it finishes the compressed stream and leaves `raw` open.
+        The stream format may differ from `compress` output, it is only guaranteed to be readable by `decompress_reader`.
+        Without incremental support, the whole content is buffered and compressed on close.
+        """
+        compressobj = self.compressobj()
+        if compressobj is None:
+            return BufferedCompressingWriter(raw, self.compress)
+        return CompressingWriter(raw, compressobj)
+
+    def decompress_reader(self, raw: BinaryIO) -> BinaryIO:
+        """
+        Readable stream of the decompressed content of a stream written by `compress_writer`.
+        Without incremental support, the whole stream is read and decompressed at once.
+        """
+        decompressobj = self.decompressobj()
+        if decompressobj is None:
+            return io.BytesIO(self.decompress(raw.read()))
+        return io.BufferedReader(DecompressingReader(raw, decompressobj), buffer_size=DEFAULT_STREAM_CHUNK_SIZE)
+
+    def compress_stream(self, source: BinaryIO, destination: BinaryIO, chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE):
+        """Compress everything read from `source` into `destination`, with constant memory for streaming codecs."""
+        with self.compress_writer(destination) as writer:
+            shutil.copyfileobj(source, writer, chunk_size)
+
+    def decompress_stream(self, source: BinaryIO, destination: BinaryIO, chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE):
+        """Decompress a stream written by `compress_stream` or `compress_writer` into `destination`."""
+        with self.decompress_reader(source) as reader:
+            shutil.copyfileobj(reader, destination, chunk_size)
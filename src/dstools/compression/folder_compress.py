@@ -1,36 +1,150 @@
-from typing import Literal, Optional
+from typing import BinaryIO, Literal, Optional
 from pathlib import Path
 import tarfile
 import io
 
 from dstools.compression.compressor import Compressor
+from dstools.compression.indexed_archive import IndexedArchiveReader, write_indexed_archive, INDEXED_ARCHIVE_MAGIC
+from dstools.compression.registry import get_compressor
 
 _TarCompressionMode = Literal['gz', 'bz2', 'xz']
 
+# header of streamed archives: magic, format version, codec name length (1 byte), codec name.
+# archives without it are in the legacy format: `bytes_compressor.compress` of a whole (possibly gz) tar.
+# indexed archives (see dstools.compression.indexed_archive) start with their own magic.
+ARCHIVE_MAGIC = b'DSFC'
+ARCHIVE_FORMAT_VERSION = 1
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
 
 class FolderCompressor:
 
-    def __init__(self, bytes_compressor: Compressor, mode: Optional[_TarCompressionMode] = None):
+    def __init__(
+            self,
+            bytes_compressor: Compressor,
+            mode: Optional[_TarCompressionMode] = None,
+            legacy_compressor: Optional[Compressor] = None,
+            indexed: bool = False,
+            large_file_compressor: Optional[Compressor] = None,
+            skip_prefix: Optional[str] = None
+    ):
         """
         bytes_compressor: (Compressor) compressor implementation to use
         mode: (str) according to the described modes: https://docs.python.org/3.10/library/tarfile.html#tarfile.open
+            only used for reading legacy archives; new archives are plain tars compressed once by the bytes_compressor
+        legacy_compressor: (Compressor) compressor of legacy archives, if it differs from the bytes_compressor
+        indexed: (bool) write indexed archives, whose files can be listed and extracted one by one
+        large_file_compressor: (Compressor) compressor of large files in indexed archives, e.g. a block-parallel one
+        skip_prefix: (str) files and folders whose name starts with it are left out of the archives
         """
         self._bytes_compressor = bytes_compressor
         self._mode = mode
+        self._legacy_compressor = legacy_compressor or bytes_compressor
+        self._indexed = indexed
+        self._large_file_compressor = large_file_compressor
+        self._skip_prefix = skip_prefix
+
+    def _header(self) -> bytes:
+        name = (self._bytes_compressor.name or '').encode('ascii')
+        return ARCHIVE_MAGIC + bytes([ARCHIVE_FORMAT_VERSION, len(name)]) + name
+
+    def _read_header(self, stream: BinaryIO) -> tuple[Optional[Compressor], bytes]:
+        """Return the compressor of a streamed archive (None for legacy archives) and the bytes read past it."""
+        prefix = stream.read(len(ARCHIVE_MAGIC) + 2)
+        if not prefix.startswith(ARCHIVE_MAGIC) or len(prefix) < len(ARCHIVE_MAGIC) + 2:
+            return None, prefix
+
+        version, name_length = prefix[len(ARCHIVE_MAGIC)], prefix[len(ARCHIVE_MAGIC) + 1]
+        if version != ARCHIVE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported folder archive format version: {version}")
+
+        name = stream.read(name_length).decode('ascii')
+        if not name or name == self._bytes_compressor.name:
+            return self._bytes_compressor, b''
+        return get_compressor(name), b''
+
+    def compress_folder_to_stream(self, folder_path: Path, stream: BinaryIO):
+        """Write the compressed archive of a folder to a binary stream, in a single pass and without buffering it."""
+        if self._indexed:
+            write_indexed_archive(
+                folder_path, stream, self._bytes_compressor, self._large_file_compressor,
+                skip_prefix=self._skip_prefix
+            )
+            return
+
+        stream.write(self._header())
+        writer = self._bytes_compressor.compress_writer(stream)
+        try:
+            with tarfile.open(fileobj=writer, mode='w|') as tar:
+                tar.add(folder_path, arcname=folder_path.name, filter=self._tar_filter)
+        finally:
+            writer.close()
+
+    def _tar_filter(self, info: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+        if self._skip_prefix and Path(info.name).name.startswith(self._skip_prefix):
+            return None
+        return info
+
+    def compress_folder_to_file(self, folder_path: Path, file_path: Path):
+        with open(file_path, 'wb') as f:
+            self.compress_folder_to_stream(folder_path, f)
 
     def compress_folder(self, folder_path: Path) -> bytes:
         """Compress the contents of a folder into bytes."""
-        tar_buffer = io.BytesIO()
-        mode = f'w:{self._mode}'
-        with tarfile.open(fileobj=tar_buffer, mode=mode) as tar:
-            tar.add(folder_path, arcname=folder_path.name)
+        buffer = io.BytesIO()
+        self.compress_folder_to_stream(folder_path, buffer)
+        return buffer.getvalue()
+
+    def decompress_stream_to_folder(self, stream: BinaryIO, destination_folder: Path):
+        """
+        Extract a compressed archive from a binary stream. Legacy archives, and indexed archives in streams that
+        can't seek, are read into memory first.
+        """
+        if self._is_indexed_archive(stream):
+            if not stream.seekable():
+                stream = io.BytesIO(stream.read())
+            IndexedArchiveReader.from_stream(stream).extract_all(destination_folder)
+            return
+
+        compressor, prefix = self._read_header(stream)
+        if compressor is None:
+            self._decompress_legacy(prefix + stream.read(), destination_folder)
+            return
 
-        return self._bytes_compressor.compress(tar_buffer.getvalue())
+        with compressor.decompress_reader(stream) as reader:
+            with tarfile.open(fileobj=reader, mode='r|') as tar:
+                tar.extractall(path=destination_folder)
+
+    def decompress_file_to_folder(self, file_path: Path, destination_folder: Path):
+        with open(file_path, 'rb') as f:
+            is_indexed = f.read(len(INDEXED_ARCHIVE_MAGIC)) == INDEXED_ARCHIVE_MAGIC
+        if is_indexed:
+            with IndexedArchiveReader.from_file(file_path) as reader:
+                reader.extract_all(destination_folder)
+            return
+
+        with open(file_path, 'rb', buffering=_COPY_CHUNK_SIZE) as f:
+            self.decompress_stream_to_folder(f, destination_folder)
 
     def decompress_to_folder(self, data: bytes, destination_folder: Path):
         """Decompress bytes and extract a folder to the destination."""
-        decompressed_data = self._bytes_compressor.decompress(data)
+        self.decompress_stream_to_folder(io.BytesIO(data), destination_folder)
+
+    @staticmethod
+    def _is_indexed_archive(stream: BinaryIO) -> bool:
+        if not stream.seekable():
+            peek = getattr(stream, 'peek', None)
+            return peek is not None and peek(len(INDEXED_ARCHIVE_MAGIC)).startswith(INDEXED_ARCHIVE_MAGIC)
+
+        position = stream.tell()
+        magic = stream.read(len(INDEXED_ARCHIVE_MAGIC))
+        stream.seek(position)
+        return magic == INDEXED_ARCHIVE_MAGIC
+
+    def _decompress_legacy(self, data: bytes, destination_folder: Path):
+        decompressed_data = self._legacy_compressor.decompress(data)
         tar_buffer = io.BytesIO(decompressed_data)
-        mode = f'r:{self._mode}'
+        mode = f'r:{self._mode}' if self._mode else 'r'
         with tarfile.open(fileobj=tar_buffer, mode=mode) as tar:
             tar.extractall(path=destination_folder)
@@ -0,0 +1,315 @@
+"""
+Indexed archive of a folder: every file is compressed independently, and a trailing index records where each
+compressed member lives, so a reader can list the archive and extract single files with ranged reads.
+
+Layout:
+    header:  magic, format version (u8)
+    members: the compressed stream (`Compressor.compress_writer`) of each file, back to back
+    index:   utf-8 json: {"root": <folder name>, "dirs": [...], "entries": [<ArchiveEntry fields>, ...]}
+    trailer: index offset (u64), index length (u64), index magic
+"""
+import io
+import json
+import os
+import shutil
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from dstools.compression.compressor import Compressor
+from dstools.compression.registry import get_compressor
+
+INDEXED_ARCHIVE_MAGIC = b'DSIA'
+INDEXED_ARCHIVE_VERSION = 1
+INDEX_MAGIC = b'DSIX'
+
+_TRAILER = struct.Struct('<QQ4s')
+# bytes read from the end of an archive when opening it, usually enough to get the index in the same request
+_TAIL_READ_SIZE = 64 * 1024
+_COPY_CHUNK_SIZE = 1024 * 1024
+# bytes requested per pread, below the ~2 GiB a single read returns on Linux
+_PREAD_CHUNK_SIZE = 1024 * 1024 * 1024
+# bytes of a compressed member fetched per range read while it is decompressed: local reads are cheap,
+# storage reads are requests, so large members are fetched in few large windows
+_LOCAL_WINDOW_SIZE = 1024 * 1024
+_STORAGE_WINDOW_SIZE = 32 * 1024 * 1024
+
+# (start, end) -> bytes of the archive in [start, end)
+RangeReader = Callable[[int, int], bytes]
+
+
+@dataclass(frozen=True)
+class ArchiveEntry:
+    path: str  # posix path relative to the archive root
+    offset: int
+    compressed_size: int
+    size: int
+    codec: str
+    mode: int
+    mtime: float
+
+
+def _pread_range(fd: int, start: int, end: int) -> bytes:
+    """Bytes [start, end) of a file, in bounded preads, since a single one may return fewer bytes than asked."""
+    chunks = []
+    position = start
+    while position < end:
+        chunk = os.pread(fd, min(end - position, _PREAD_CHUNK_SIZE), position)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        position += len(chunk)
+    return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+
+class _RangeStream(io.RawIOBase):
+    """Read-only stream of the bytes [start, end) of an archive, fetched through the range reader as they are read."""
+
+    def __init__(self, read_range: RangeReader, start: int, end: int):
+        super().__init__()
+        self._read_range = read_range
+        self._position = start
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), self._end - self._position)
+        if n <= 0:
+            return 0
+
+        data = self._read_range(self._position, self._position + n)
+        b[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class _CountingWriter:
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self.position = 0
+
+    def write(self, data) -> int:
+        self._raw.write(data)
+        self.position += len(data)
+        return len(data)
+
+
+def _check_archive_path(path: str) -> str:
+    """The path of an archive member, rejected if extracting it could write outside of the destination folder."""
+    parts = PurePosixPath(path).parts
+    if not parts or PurePosixPath(path).is_absolute() or '..' in parts:
+        raise ValueError(f"Unsafe path in the archive: {path!r}")
+    return path
+
+
+def write_indexed_archive(
+        folder: Path,
+        stream: BinaryIO,
+        compressor: Compressor,
+        large_file_compressor: Optional[Compressor] = None,
+        large_file_threshold: int = 64 * 1024 * 1024,
+        skip_prefix: Optional[str] = None
+):
+    """
+    Write an indexed archive of `folder` to a binary stream, streaming every file through the compressor.
+    Files of at least `large_file_threshold` bytes use `large_file_compressor` if given (e.g. a block-parallel one).
+    Files and folders whose name starts with `skip_prefix` are left out.
+    """
+    folder = Path(folder)
+    for codec in filter(None, (compressor, large_file_compressor)):
+        if not codec.name:
+            raise ValueError(f"Compressor {type(codec).__name__} has no codec name, it can't be used for archives")
+
+    out = _CountingWriter(stream)
+    out.write(INDEXED_ARCHIVE_MAGIC + bytes([INDEXED_ARCHIVE_VERSION]))
+    dirs = []
+    entries = []
+    for path in sorted(folder.rglob('*')):
+        relative_path = path.relative_to(folder).as_posix()
+        if skip_prefix and any(part.startswith(skip_prefix) for part in path.relative_to(folder).parts):
+            continue
+        if path.is_dir():
+            dirs.append(relative_path)
+            continue
+        if not path.is_file():
+            continue
+
+        stat = path.stat()
+        use_large = large_file_compressor is not None and stat.st_size >= large_file_threshold
+        codec = large_file_compressor if use_large else compressor
+        offset = out.position
+        with open(path, 'rb') as f:
+            codec.compress_stream(f, out)
+        entries.append(ArchiveEntry(
+            path=relative_path,
+            offset=offset,
+            compressed_size=out.position - offset,
+            size=stat.st_size,
+            codec=codec.name,
+            mode=stat.st_mode & 0o777,
+            mtime=stat.st_mtime,
+        ))
+
+    index = json.dumps({'root': folder.name, 'dirs': dirs, 'entries': [asdict(e) for e in entries]}).encode('utf-8')
+    index_offset = out.position
+    out.write(index)
+    out.write(_TRAILER.pack(index_offset, len(index), INDEX_MAGIC))
+
+
+class IndexedArchiveReader:
+    """
+    Lists and extracts members of an indexed archive through a range reader, so only the index and the requested
+    members are read. Use `from_file`, `from_stream` or `from_storage` to open an archive.
+    """
+
+    def __init__(
+            self,
+            read_range: RangeReader,
+            size: int,
+            close: Optional[Callable[[], None]] = None,
+            window_size: int = _LOCAL_WINDOW_SIZE
+    ):
+        """window_size: bytes of a compressed member fetched per range read while it is decompressed"""
+        self._read_range = read_range
+        self._close = close
+        self._window_size = window_size
+        self._compressors: Dict[str, Compressor] = {}
+        if size < len(INDEXED_ARCHIVE_MAGIC) + 1 + _TRAILER.size:
+            raise ValueError("Not an indexed archive: too short")
+
+        tail_start = max(0, size - _TAIL_READ_SIZE)
+        tail = read_range(tail_start, size)
+        index_offset, index_length, magic = _TRAILER.unpack_from(tail, len(tail) - _TRAILER.size)
+        if magic != INDEX_MAGIC:
+            raise ValueError("Not an indexed archive: bad index magic")
+
+        if index_offset >= tail_start:
+            index_bytes = tail[index_offset - tail_start:index_offset - tail_start + index_length]
+        else:
+            index_bytes = read_range(index_offset, index_offset + index_length)
+
+        index = json.loads(index_bytes)
+        self.root: str = index['root']
+        self._dirs: List[str] = index['dirs']
+        self._entries: Dict[str, ArchiveEntry] = {e['path']: ArchiveEntry(**e) for e in index['entries']}
+
+    @staticmethod
+    def from_file(path: str | Path) -> 'IndexedArchiveReader':
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            return IndexedArchiveReader(
+                lambda start, end: _pread_range(fd, start, end), os.fstat(fd).st_size, close=lambda: os.close(fd)
+            )
+        except BaseException:
+            os.close(fd)
+            raise
+
+    @staticmethod
+    def from_stream(stream: BinaryIO) -> 'IndexedArchiveReader':
+        """Reader over a seekable binary stream; reads are serialized, the stream is left open."""
+        lock = threading.Lock()
+
+        def read_range(start: int, end: int) -> bytes:
+            with lock:
+                stream.seek(start)
+                return stream.read(end - start)
+
+        with lock:
+            size = stream.seek(0, io.SEEK_END)
+        return IndexedArchiveReader(read_range, size)
+
+    @staticmethod
+    def from_storage(handler, remote_relative_path: str) -> 'IndexedArchiveReader':
+        """
+        Reader over an archive in storage (a StorageHandler), using ranged downloads. Handlers without real ranged
+        reads would download the whole archive on every read, so the archive is downloaded once instead.
+        """
+        if not handler.supports_ranged_reads:
+            stream = handler.open_read(remote_relative_path)
+            try:
+                reader = IndexedArchiveReader.from_stream(stream)
+            except BaseException:
+                stream.close()
+                raise
+            reader._close = stream.close
+            return reader
+
+        return IndexedArchiveReader(
+            lambda start, end: handler.download_range(remote_relative_path, start, end),
+            handler.size(remote_relative_path),
+            window_size=_STORAGE_WINDOW_SIZE
+        )
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def __enter__(self) -> 'IndexedArchiveReader':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def entries(self) -> List[ArchiveEntry]:
+        return list(self._entries.values())
+
+    def entry(self, path: str) -> ArchiveEntry:
+        entry = self._entries.get(path)
+        if entry is None:
+            raise KeyError(f"No such file in the archive: {path}")
+        return entry
+
+    def _compressor(self, codec: str) -> Compressor:
+        compressor = self._compressors.get(codec)
+        if compressor is None:
+            compressor = self._compressors.setdefault(codec, get_compressor(codec))
+        return compressor
+
+    def _open_member(self, entry: ArchiveEntry) -> BinaryIO:
+        # the compressed member is fetched in bounded windows as it is decompressed, not loaded whole;
+        # members smaller than a window take a single range read
+        compressed = io.BufferedReader(
+            _RangeStream(self._read_range, entry.offset, entry.offset + entry.compressed_size),
+            buffer_size=max(1, min(self._window_size, entry.compressed_size))
+        )
+        return self._compressor(entry.codec).decompress_reader(compressed)
+
+    def read(self, path: str) -> bytes:
+        with self._open_member(self.entry(path)) as reader:
+            return reader.read()
+
+    def extract(self, path: str, destination_folder: Path) -> Path:
+        """Extract a single file to `destination_folder/<root>/<path>`, atomically, and return its local path."""
+        entry = self.entry(path)
+        target = Path(destination_folder) / _check_archive_path(self.root) / _check_archive_path(entry.path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_target = target.with_name(f".{target.name}.{threading.get_ident()}.part")
+        try:
+            with self._open_member(entry) as reader, open(tmp_target, 'wb') as f:
+                shutil.copyfileobj(reader, f, _COPY_CHUNK_SIZE)
+            os.chmod(tmp_target, entry.mode)
+            os.utime(tmp_target, (entry.mtime, entry.mtime))
+            os.replace(tmp_target, target)
+        except BaseException:
+            tmp_target.unlink(missing_ok=True)
+            raise
+        return target
+
+    def extract_all(self, destination_folder: Path, max_workers: int = 8):
+        """Extract every file to `destination_folder/<root>`, fetching and decompressing members concurrently."""
+        root = Path(destination_folder) / _check_archive_path(self.root)
+        for path in [*self._dirs, *self._entries]:
+            _check_archive_path(path)
+
+        root.mkdir(parents=True, exist_ok=True)
+        for directory in self._dirs:
+            (root / directory).mkdir(parents=True, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='archive-extract') as pool:
+            list(pool.map(lambda path: self.extract(path, destination_folder), self._entries))
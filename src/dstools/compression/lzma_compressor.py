@@ -0,0 +1,27 @@
+import lzma
+
+from dstools.compression.compressor import Compressor
+from dstools.compression.streams import IncrementalCompressor, IncrementalDecompressor
+
+
+class LzmaCompressor(Compressor):
+    """xz format; streams are the same format as `compress` output."""
+
+    name = 'lzma'
+
+    def __init__(self, preset: int = 6):
+        if not 0 <= preset <= 9:
+            raise ValueError(f"lzma preset must be between 0 and 9, got {preset}")
+        self._preset = preset
+
+    def compress(self, data: bytes) -> bytes:
+        return lzma.compress(data, preset=self._preset)
+
+    def decompress(self, data: bytes) -> bytes:
+        return lzma.decompress(data)
+
+    def compressobj(self) -> IncrementalCompressor:
+        return lzma.LZMACompressor(preset=self._preset)
+
+    def decompressobj(self) -> IncrementalDecompressor:
+        return lzma.LZMADecompressor()
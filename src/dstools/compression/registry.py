@@ -0,0 +1,77 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from dstools.compression.compressor import Compressor
+
+# called with no arguments for the default level, or with the level of a "name:level" codec spec
+_CompressorFactory = Callable[..., Compressor]
+
+_COMPRESSORS: Dict[str, _CompressorFactory] = {}
+_LEVELS: Dict[str, Tuple[int, ...]] = {}
+
+
+def register_compressor(name: str, factory: _CompressorFactory, levels: Sequence[int] = ()):
+    """
+    Register a compressor factory under a codec name. Registering an existing name replaces it.
+    `levels` lists the compression levels the factory accepts, which makes specs like "zlib:9" valid.
+    """
+    _COMPRESSORS[name.lower()] = factory
+    _LEVELS[name.lower()] = tuple(levels)
+
+
+def parse_codec_spec(spec: str) -> Tuple[str, Optional[int]]:
+    """Split a codec spec of the form "name" or "name:level"."""
+    name, _, level = spec.lower().partition(':')
+    if not level:
+        return name, None
+
+    try:
+        return name, int(level)
+    except ValueError:
+        raise ValueError(f"Invalid compression level in codec spec: {spec}")
+
+
+def get_compressor(spec: str) -> Compressor:
+    name, level = parse_codec_spec(spec)
+    factory = _COMPRESSORS.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown compression codec: {name}. Available codecs: {available_compressors()}")
+
+    if level is None:
+        return factory()
+    if level not in _LEVELS[name]:
+        raise ValueError(f"Codec {name} does not support level {level}. Supported levels: {list(_LEVELS[name])}")
+    return factory(level)
+
+
+def available_compressors() -> List[str]:
+    return sorted(_COMPRESSORS)
+
+
+def compressor_levels(name: str) -> List[int]:
+    return list(_LEVELS.get(name.lower(), ()))
+
+
+def _snappy() -> Compressor:
+    from dstools.compression.snappy_compressor import SnappyCompressor
+    return SnappyCompressor()
+
+
+def _zlib(level: int = 6) -> Compressor:
+    from dstools.compression.zlib_compressor import ZlibCompressor
+    return ZlibCompressor(level)
+
+
+def _lzma(level: int = 6) -> Compressor:
+    from dstools.compression.lzma_compressor import LzmaCompressor
+    return LzmaCompressor(level)
+
+
+def _block() -> Compressor:
+    from dstools.compression.block_parallel_compressor import BlockParallelCompressor
+    return BlockParallelCompressor()
+
+
+register_compressor('snappy', _snappy)
+register_compressor('zlib', _zlib, levels=range(-1, 10))
+register_compressor('lzma', _lzma, levels=range(0, 10))
+register_compressor('block', _block)
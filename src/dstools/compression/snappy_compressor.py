@@ -1,12 +1,22 @@
 import snappy
 
 from dstools.compression.compressor import Compressor
+from dstools.compression.streams import IncrementalCompressor, IncrementalDecompressor
 
 
 class SnappyCompressor(Compressor):
+    """Raw snappy for bytes, and the snappy framing format for streams."""
+
+    name = 'snappy'
 
     def compress(self, data: bytes) -> bytes:
         return snappy.compress(data)
 
     def decompress(self, data: bytes) -> bytes:
-        return snappy.uncompress(data)
\ No newline at end of file
+        return snappy.uncompress(data)
+
+    def compressobj(self) -> IncrementalCompressor:
+        return snappy.StreamCompressor()
+
+    def decompressobj(self) -> IncrementalDecompressor:
+        return snappy.StreamDecompressor()
@@ -0,0 +1,145 @@
+import io
+from typing import BinaryIO, Optional, Protocol
+
+DEFAULT_STREAM_CHUNK_SIZE = 1024 * 1024
+# compressed bytes fed to a decompressor at once; small, since highly compressible input expands a lot
+DEFAULT_DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+
+class IncrementalCompressor(Protocol):
+    """Incremental compression object, like the ones returned by `zlib.compressobj`."""
+
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class IncrementalDecompressor(Protocol):
+    """Incremental decompression object, like the ones returned by `zlib.decompressobj`."""
+
+    def decompress(self, data: bytes) -> bytes: ...
+
+
+class CompressingWriter(io.RawIOBase):
+    """
+    Write-only stream that compresses everything written to it into `raw`.
+    Writes are gathered into `chunk_size` chunks before they are compressed, so codecs that compress every call
+    independently still get reasonably sized inputs. Closing the writer flushes the compressor but leaves `raw` open.
+    """
+
+    def __init__(self, raw: BinaryIO, compressor: IncrementalCompressor, chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE):
+        super().__init__()
+        self._raw = raw
+        self._compressor = compressor
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed stream")
+
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self._compress_buffer()
+        return len(data)
+
+    def _compress_buffer(self):
+        if self._buffer:
+            self._raw.write(self._compressor.compress(bytes(self._buffer)))
+            self._buffer.clear()
+
+    def close(self):
+        if not self.closed:
+            self._compress_buffer()
+            self._raw.write(self._compressor.flush())
+        super().close()
+
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Read-only stream of the decompressed content of `raw`, decompressing `chunk_size` compressed bytes at a time.
+    Decompressors that can bound their output (zlib's `unconsumed_tail`, lzma's `needs_input`) produce at most
+    `max_output` bytes per step, so memory stays constant even for highly compressible content.
+    """
+
+    def __init__(
+            self,
+            raw: BinaryIO,
+            decompressor: IncrementalDecompressor,
+            chunk_size: int = DEFAULT_DECOMPRESS_CHUNK_SIZE,
+            max_output: int = DEFAULT_STREAM_CHUNK_SIZE
+    ):
+        super().__init__()
+        self._raw = raw
+        self._decompressor = decompressor
+        self._chunk_size = chunk_size
+        self._max_output = max_output
+        self._buffer = b''
+        self._offset = 0
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _finish(self) -> bytes:
+        self._eof = True
+        flush = getattr(self._decompressor, 'flush', None)
+        return flush() if flush is not None else b''
+
+    def _next_output(self) -> bytes:
+        decompressor = self._decompressor
+        if hasattr(decompressor, 'unconsumed_tail'):
+            compressed = decompressor.unconsumed_tail or self._raw.read(self._chunk_size)
+            if not compressed:
+                return self._finish()
+            return decompressor.decompress(compressed, self._max_output)
+
+        if hasattr(decompressor, 'needs_input'):
+            if decompressor.eof:
+                return self._finish()
+            compressed = self._raw.read(self._chunk_size) if decompressor.needs_input else b''
+            if not compressed and decompressor.needs_input:
+                return self._finish()
+            return decompressor.decompress(compressed, self._max_output)
+
+        compressed = self._raw.read(self._chunk_size)
+        if not compressed:
+            return self._finish()
+        return decompressor.decompress(compressed)
+
+    def readinto(self, b) -> int:
+        while self._offset >= len(self._buffer) and not self._eof:
+            self._buffer = self._next_output()
+            self._offset = 0
+
+        n = min(len(b), len(self._buffer) - self._offset)
+        b[:n] = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return n
+
+
+class BufferedCompressingWriter(io.RawIOBase):
+    """Fallback writer for compressors without incremental support: compresses the whole content on close."""
+
+    def __init__(self, raw: BinaryIO, compress):
+        super().__init__()
+        self._raw = raw
+        self._compress = compress
+        self._buffer: Optional[io.BytesIO] = io.BytesIO()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("write to closed stream")
+        return self._buffer.write(data)
+
+    def close(self):
+        if not self.closed:
+            self._raw.write(self._compress(self._buffer.getvalue()))
+            self._buffer = None
+        super().close()
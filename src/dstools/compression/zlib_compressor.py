@@ -0,0 +1,27 @@
+import zlib
+
+from dstools.compression.compressor import Compressor
+from dstools.compression.streams import IncrementalCompressor, IncrementalDecompressor
+
+
+class ZlibCompressor(Compressor):
+    """zlib format; streams are the same format as `compress` output."""
+
+    name = 'zlib'
+
+    def __init__(self, level: int = 6):
+        if not -1 <= level <= 9:
+            raise ValueError(f"zlib compression level must be between -1 and 9, got {level}")
+        self._level = level
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self._level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+    def compressobj(self) -> IncrementalCompressor:
+        return zlib.compressobj(self._level)
+
+    def decompressobj(self) -> IncrementalDecompressor:
+        return zlib.decompressobj()
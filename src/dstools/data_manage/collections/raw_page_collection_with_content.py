@@ -9,6 +9,7 @@ from dstools.data_manage.collections import AsyncDBCollectionWithContent, AsyncD
 from dstools.data_manage.firestore import FirestoreCollectionClient
 from dstools.data_manage.schema import RawPageMetadataRecord, RawPageRecord, LocationType
 from dstools.storage.handlers.async_handler import AsyncStorageHandler
+from dstools.storage.handlers.content_addressed_handler import ContentAddressedStorageHandler
 
 
 class RawPageCollectionWithContent(AsyncDBCollectionWithContent[RawPageMetadataRecord, RawPageRecord]):
@@ -17,9 +18,15 @@ class RawPageCollectionWithContent(AsyncDBCollectionWithContent[RawPageMetadataR
             self,
             name: str,
             firestore_client: FirestoreCollectionClient,
-            async_storage: AsyncStorageHandler
+            async_storage: AsyncStorageHandler,
+            content_store: Optional[ContentAddressedStorageHandler] = None
     ):
+        """
+        content_store: (optional) when given, page images are stored by content hash through it, so identical images
+            are uploaded once and their metadata records point at the shared blob.
+        """
         self._async_storage = async_storage
+        self._content_store = content_store
         self._metadata_collection = GeneralAsyncFirestoreCollection[RawPageMetadataRecord](
             name,
             RawPageMetadataRecord,
@@ -36,27 +43,33 @@ class RawPageCollectionWithContent(AsyncDBCollectionWithContent[RawPageMetadataR
 
 
     async def _insert_items_content(self, input_items: Sequence[RawPageRecord]) -> Sequence[RawPageMetadataRecord]:
-        async def insert_item_content(item: RawPageRecord) -> RawPageMetadataRecord:
-            content = await self._get_content(item)
-            content_path = f"{self.name}/{item.id}.{item.image.format}"
-            await self._async_storage.upload(content, content_path)
-            return RawPageMetadataRecord(item.id, item.page_id, item.page_hash, item.size, item.image.format, LocationType.GCS, content_path)
-
-        tasks = list(map(insert_item_content, input_items))
-        return await asyncio.gather(*tasks)
+        contents = await asyncio.gather(*map(self._get_content, input_items))
+        if self._content_store is not None:
+            suffixes = [f".{item.image.format}" for item in input_items]
+            content_paths = await self._content_store.put_many_async(self._async_storage, contents, suffixes)
+        else:
+            content_paths = [f"{self.name}/{item.id}.{item.image.format}" for item in input_items]
+            await self._async_storage.upload_many(zip(contents, content_paths))
+        return [
+            RawPageMetadataRecord(item.id, item.page_id, item.page_hash, item.size, item.image.format, LocationType.GCS, content_path)
+            for item, content_path in zip(input_items, content_paths)
+        ]
 
 
     async def _fetch_items_content(self, items_metadata: Iterable[RawPageMetadataRecord], content_fields: Optional[list[str]] = None) -> Iterable[RawPageRecord]:
-        async def fetch_item_content(item: RawPageMetadataRecord) -> RawPageRecord:
+        items_metadata = list(items_metadata)
+        locations = [item.content_location for item in items_metadata if item.content_location]
+        contents = iter(await self._async_storage.download_many(locations))
+
+        records = []
+        for item in items_metadata:
             image: Optional[Image] = None
             if item.content_location:
-                content = await self._async_storage.download(item.content_location)
-                image = image_from_bytes(content)
+                image = image_from_bytes(next(contents))
 
-            return RawPageRecord(item.id, item.page_id, item.page_hash, item.size, item.image_format, image)
+            records.append(RawPageRecord(item.id, item.page_id, item.page_hash, item.size, item.image_format, image))
 
-        tasks = list(map(fetch_item_content, items_metadata))
-        return await asyncio.gather(*tasks)
+        return records
 
     @staticmethod
     async def _get_content(record: RawPageRecord) -> Optional[bytes]:
@@ -1,23 +1,88 @@
+import functools
 import inspect
+import os
+import shutil
+import tempfile
+import threading
 from abc import ABCMeta, ABC
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 from globalog import LOG
 
+from dstools.common.file_lock import FileLock
+from dstools.compression.block_parallel_compressor import BlockParallelCompressor
 from dstools.compression.folder_compress import FolderCompressor
+from dstools.compression.indexed_archive import IndexedArchiveReader
 from dstools.compression.snappy_compressor import SnappyCompressor
 from dstools.resource_management.resource_storage.resource_downloader import ResourceDownloader
 from dstools.resource_management.resource_storage.resource_uploader import ResourceUploader
 from dstools.resource_management.resource_config import ResourceConfig
+from dstools.resource_management.resource_manifest import (
+    LOCAL_MANIFEST_NAME,
+    RVS_FILE_PREFIX,
+    ResourceManifest,
+    install_from_manifest,
+    resource_files,
+    upload_manifest,
+    verify_folder,
+)
 from dstools.resource_management.resource_utils import locate_rvs_config_file
+from dstools.storage.handlers.storage_handler import StorageHandler
 
 
-CONFIG_PATH = locate_rvs_config_file()
-if CONFIG_PATH is None:
-    _CONFIG = ResourceConfig.default()
-else:
-    _CONFIG = ResourceConfig.from_path(CONFIG_PATH)
+# resources are lazy when constructed, whatever their class args, if this environment variable is set to 1
+LAZY_ENV_VAR = 'RVS_LAZY'
+
+
+@functools.cache
+def get_config() -> ResourceConfig:
+    """The resource config, located and read on first use rather than at import time."""
+    config_path = locate_rvs_config_file()
+    if config_path is None:
+        return ResourceConfig.default()
+    return ResourceConfig.from_path(config_path)
+
+
+_background_executor: Optional[ThreadPoolExecutor] = None
+_background_executor_lock = threading.Lock()
+
+
+def _get_background_executor() -> ThreadPoolExecutor:
+    global _background_executor
+    with _background_executor_lock:
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='resource-preload')
+        return _background_executor
+
+
+def preload(*resource_classes: type) -> List[Future]:
+    """
+    Start loading the given resource classes on background threads, e.g. at the start of a service.
+    Resources are also constructed there, since non-lazy ones load in their constructor.
+    """
+    executor = _get_background_executor()
+    return [executor.submit(lambda cls=resource_class: cls().load()) for resource_class in resource_classes]
+
+
+# written last into a resource folder once it is completely installed; a folder without it is partial
+COMPLETE_MARKER = '.rvs-complete'
+VERIFY_MODES = ('quick', 'full')
+NPY_SUFFIX = '.npy'
+
+
+def install_lock_path(local_path: Path) -> Path:
+    """Lock file held exclusively while a resource version is installed or repaired."""
+    return local_path.parent / f".{local_path.name}.install.lock"
+
+
+def use_lock_path(local_path: Path) -> Path:
+    """
+    Lock file held shared by every process using a resource version, and exclusively while it is evicted;
+    its mtime is the last access time of the version.
+    """
+    return local_path.parent / f".{local_path.name}.use.lock"
 
 
 def is_abstract(cls: type, bases: tuple[type, ...]) -> bool:
@@ -29,10 +94,16 @@ def is_abstract(cls: type, bases: tuple[type, ...]) -> bool:
 
 class ResourceMeta(ABCMeta):
     _instances = {}
+    # per-resource locks, so concurrent constructions of a resource load it once, while different resources load in parallel
+    _instance_locks = {}
+    _locks_lock = threading.Lock()
 
     def __new__(mcs, name, bases, namespace, **kwargs):
         resource_name: Optional[str] = kwargs.pop('resource_name', None)
         version: Optional[str] = kwargs.pop('version', None)
+        manifest: bool = kwargs.pop('manifest', False)
+        lazy: bool = kwargs.pop('lazy', False)
+        verify: Optional[str] = kwargs.pop('verify', None)
 
         cls = super().__new__(mcs, name, bases, namespace)
 
@@ -42,19 +113,39 @@ class ResourceMeta(ABCMeta):
 
             cls._resource_name = resource_name
             cls._version = version
-            cls._local_path = Path(_CONFIG.resources_root).expanduser() / resource_name / f'V{version}'
-            cls._remote_relative_path = f"{_CONFIG.remote_root}/{resource_name}/V{version}"
+            cls._manifest_mode = manifest
+            cls._lazy = lazy
+            if verify is not None and verify not in VERIFY_MODES:
+                raise ValueError(f"Unknown verify mode: {verify}. Expected one of {VERIFY_MODES}")
+            cls._verify_mode = verify
 
         return cls
 
     def __call__(cls, *args, **kwargs):
         # Singleton logic based on resource name and version
         key = (cls._resource_name, cls._version)
-        if key not in cls._instances:
-            instance = super().__call__(*args, **kwargs)
-            cls._instances[key] = instance
+        instance = cls._instances.get(key)
+        if instance is not None:
+            return instance
+
+        with ResourceMeta._locks_lock:
+            lock = ResourceMeta._instance_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in cls._instances:
+                instance = super().__call__(*args, **kwargs)
+                cls._instances[key] = instance
         return cls._instances[key]
 
+    def _resource_local_path(cls) -> Path:
+        return Path(get_config().resources_root).expanduser() / cls._resource_name / f'V{cls._version}'
+
+    def _resource_remote_root(cls) -> str:
+        return f"{get_config().remote_root}/{cls._resource_name}"
+
+    def is_installed(cls) -> bool:
+        """Whether the resource is fully present locally, without constructing (and so loading) it."""
+        return (cls._resource_local_path() / COMPLETE_MARKER).exists()
+
 
 class Resource(ABC, metaclass=ResourceMeta):
     """
@@ -63,6 +154,27 @@ class Resource(ABC, metaclass=ResourceMeta):
 
     Example Usage:
 
+    With `manifest=True` in the class args, every file is stored once, content-addressed, under
+    `<remote_root>/<name>/blobs`, and each version is a manifest of file hashes: uploads push only new files,
+    and loads reuse files of other installed versions.
+
+    With `lazy=True` (or RVS_LAZY=1), constructing a resource doesn't load it: it is loaded on first access to
+    `local_path`, by `load()`/`load_async()`, or by `preload()`, and `fetch_file` fetches single files meanwhile.
+    Lazy subclasses that compute paths in `__init__` should do it from properties instead, since reading
+    `local_path` in `__init__` loads the resource.
+
+    Uploads record a checksum manifest of the files. With `verify='quick'` (sizes, and hashes of files whose mtime
+    changed) or `verify='full'` (hashes of all files), loading an installed resource verifies it against that
+    manifest and re-fetches only the damaged files; `verify()` does the same on demand.
+
+    Constructed resources hold a shared use lock on their version until the process exits, so the local store
+    (see `resource_store`) never evicts them; with `disk_budget` in rvs.json, installs evict the least recently
+    used versions beyond the budget. On a read-only resources root, where the use lock can't be created, resources
+    load without it and installs never evict anything.
+
+    `array(path)` exposes a `.npy` file of the resource as a read-only numpy memory map (numpy is imported on use):
+    worker processes mapping the same file share its pages in the page cache instead of each copying it to its heap.
+
     ..  code-block:: python
     class ExampleResource(Resource, resource_name='example', version='1.0'):
     def __init__(self):
@@ -76,40 +188,345 @@ class Resource(ABC, metaclass=ResourceMeta):
     """
 
     def __init__(self):
+        cls = type(self)
         self.name = self._resource_name
         self.version = self._version
-        self.local_path = self._local_path
-        self.remote_relative_path = self._remote_relative_path
+        self._local_path = cls._resource_local_path()
+        self.remote_relative_path = f"{cls._resource_remote_root()}/V{self.version}"
+        self._remote_manifest_path = f"{self.remote_relative_path}.manifest.json"
+        self._remote_blobs_prefix = f"{cls._resource_remote_root()}/blobs"
         self._loaded = False
-        self.load()
+        self._load_lock = threading.RLock()
+        # held for the life of the process, so the local store never evicts a version in use
+        self._use_lock = self._acquire_use_lock()
+        self._arrays = {}
+        if not (self._lazy or os.environ.get(LAZY_ENV_VAR) == '1'):
+            self.load()
+
+    @property
+    def local_path(self) -> Path:
+        """The local folder of the resource; lazy resources are loaded on first access."""
+        if not self._loaded:
+            self.load()
+        return self._local_path
 
     def load(self) -> 'Resource':
         if self._loaded:
             LOG.debug(f"Resource already loaded: {self.name}:{self.version} ")
             return self
 
-        self._loaded = True
-        if self.local_path.exists():
+        with self._load_lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+        return self
+
+    def load_async(self) -> Future:
+        """Load the resource on a background thread; the future's result is the resource."""
+        return _get_background_executor().submit(self.load)
+
+    def _load(self):
+        if self._is_installed():
             LOG.info(f"Resource {self.name} v{self.version} exists")
-            return self
+            if self._verify_mode is not None:
+                self.verify(full=self._verify_mode == 'full')
+            return
 
-        LOG.info(f"Resource {self.name} v{self.version} not found locally, fetching from remote")
-        downloader = ResourceDownloader(_CONFIG.remote_storage_type, _CONFIG.storage_config)
-        compressed_bytes = downloader.download(self.remote_relative_path)
+        # processes installing the same resource wait for the first one, then find it installed
+        with self._install_lock():
+            if self._is_installed():
+                LOG.info(f"Resource {self.name} v{self.version} was installed by another process")
+                return
 
-        # Decompress into a folder
-        LOG.info(f"Decompressed content to {self.local_path.parent}")
-        compressor = self._get_folder_compressor()
-        compressor.decompress_to_folder(compressed_bytes, self.local_path.parent)
-        return self
+            if self._local_path.exists() and not self._remote_exists():
+                LOG.warning(f"Resource {self.name} v{self.version} exists only locally, using it as is")
+                return
+
+            if self._local_path.exists():
+                LOG.info(f"Resource {self.name} v{self.version} is partially installed, repairing it from remote")
+            else:
+                LOG.info(f"Resource {self.name} v{self.version} not found locally, fetching from remote")
+
+            if self._manifest_mode:
+                self._install_from_manifest()
+            else:
+                self._install_from_archive()
+            (self._local_path / COMPLETE_MARKER).touch()
+
+        self._enforce_disk_budget()
+
+    def _acquire_use_lock(self) -> Optional[FileLock]:
+        """The shared use lock of the version, or None if it can't be created (e.g. on a read-only resources root)."""
+        use_lock = FileLock(use_lock_path(self._local_path), shared=True)
+        try:
+            use_lock.acquire()
+            use_lock.path.touch()
+        except OSError as e:
+            use_lock.release()
+            LOG.warning(f"Resource {self.name} v{self.version} can't create its use lock ({e}), "
+                        f"its resources root is not garbage collected by this process")
+            return None
+        return use_lock
+
+    def _enforce_disk_budget(self):
+        budget = get_config().disk_budget
+        if budget is None:
+            return
+        if self._use_lock is None:
+            # without a use lock, the root is read-only or unmanaged: its versions are never evicted from here
+            return
+
+        from dstools.resource_management.resource_store import ResourceStore
+        ResourceStore(get_config().resources_root).gc(budget)
+
+    def _install_lock(self) -> FileLock:
+        return FileLock(install_lock_path(self._local_path))
+
+    def _remote_exists(self) -> bool:
+        remote_path = self._remote_manifest_path if self._manifest_mode else self.remote_relative_path
+        try:
+            return self._storage_handler().exists(remote_path)
+        except NotImplementedError:
+            return True
+
+    def _install_from_archive(self):
+        """Extract into a staging folder and move it into place in one rename, replacing any partial install."""
+        parent = self._local_path.parent
+        parent.mkdir(parents=True, exist_ok=True)
+        # leftovers of crashed installs; nobody else installs this resource while the install lock is held
+        for stale_staging in parent.glob(f".{self._local_path.name}.install-*"):
+            shutil.rmtree(stale_staging, ignore_errors=True)
+
+        downloader = ResourceDownloader(get_config().remote_storage_type, get_config().storage_config)
+        with tempfile.TemporaryDirectory(dir=parent, prefix=f".{self._local_path.name}.install-") as staging:
+            staging = Path(staging)
+            archive_path = staging / 'archive'
+            downloader.download_to_file(self.remote_relative_path, archive_path)
+
+            # Decompress into a folder
+            self._get_folder_compressor().decompress_file_to_folder(archive_path, staging / 'extracted')
+            archive_path.unlink()
+            installed = staging / 'extracted' / self._local_path.name
+            manifest = self._fetch_integrity_manifest()
+            if manifest is not None:
+                manifest.with_local_mtimes(installed).save(installed / LOCAL_MANIFEST_NAME)
+            (installed / COMPLETE_MARKER).touch()
+            if self._local_path.exists():
+                self._local_path.rename(staging / 'previous')
+            installed.rename(self._local_path)
+            LOG.info(f"Decompressed content to {self._local_path}")
+
+    def _storage_handler(self) -> StorageHandler:
+        return ResourceDownloader(get_config().remote_storage_type, get_config().storage_config).handler
+
+    def _fetch_manifest(self) -> ResourceManifest:
+        return ResourceManifest.from_json(self._storage_handler().download(self._remote_manifest_path))
+
+    def _fetch_integrity_manifest(self) -> Optional[ResourceManifest]:
+        # archives uploaded before checksum manifests were recorded have none
+        if not self._manifest_mode:
+            try:
+                if not self._storage_handler().exists(self._remote_manifest_path):
+                    return None
+            except NotImplementedError:
+                # storages without existence checks can't tell a missing manifest from a failed download
+                LOG.debug(f"Resource {self.name} v{self.version} storage can't check for a checksum manifest")
+                return None
+        return self._fetch_manifest()
+
+    def _local_manifest(self) -> Optional[ResourceManifest]:
+        manifest_path = self._local_path / LOCAL_MANIFEST_NAME
+        if manifest_path.exists():
+            return ResourceManifest.load(manifest_path)
+        return self._fetch_integrity_manifest()
+
+    def verify(self, full: bool = False, repair: bool = True) -> List[str]:
+        """
+        Check the installed files against the checksum manifest and return the damaged ones (missing, resized or with
+        another hash), re-fetching only those if `repair`. The quick check trusts files whose size and mtime are
+        as installed; `full` hashes all of them.
+        """
+        manifest = self._local_manifest()
+        if manifest is None:
+            LOG.warning(f"Resource {self.name} v{self.version} has no checksum manifest, it can't be verified")
+            return []
+
+        damaged = verify_folder(self._local_path, manifest, full)
+        if damaged and repair:
+            self._repair(damaged, manifest)
+        elif not damaged:
+            # record the current mtimes, so the next quick check hashes nothing; rewritten only if one changed
+            refreshed = manifest.with_local_mtimes(self._local_path)
+            if refreshed != manifest:
+                with self._install_lock():
+                    refreshed.save(self._local_path / LOCAL_MANIFEST_NAME)
+        return damaged
+
+    def _repair(self, damaged: List[str], manifest: ResourceManifest):
+        LOG.warning(f"Resource {self.name} v{self.version} has {len(damaged)} damaged files, re-fetching them")
+        with self._install_lock():
+            # the folder is partial until the damaged files are replaced
+            (self._local_path / COMPLETE_MARKER).unlink(missing_ok=True)
+            for path in damaged:
+                (self._local_path / path).unlink(missing_ok=True)
+
+            if self._manifest_mode:
+                damaged_files = ResourceManifest(self.name, self.version, {path: manifest.files[path] for path in damaged})
+                install_from_manifest(
+                    self._storage_handler(), damaged_files, self._local_path, self._remote_blobs_prefix,
+                    save_manifest=False
+                )
+            else:
+                try:
+                    archive = self._open_remote_archive()
+                except ValueError:
+                    archive = None
+
+                if archive is None:
+                    LOG.info(f"Resource {self.name} v{self.version} archive has no index, reinstalling it")
+                    self._install_from_archive()
+                else:
+                    with archive:
+                        for path in damaged:
+                            archive.extract(path, self._local_path.parent)
+
+            manifest.with_local_mtimes(self._local_path).save(self._local_path / LOCAL_MANIFEST_NAME)
+            (self._local_path / COMPLETE_MARKER).touch()
+
+    def _install_from_manifest(self):
+        # files are installed one by one atomically, so a partial install is repaired in place, keeping what it has
+        other_versions = [
+            path for path in self._local_path.parent.glob('V*')
+            if path.is_dir() and path != self._local_path and (path / COMPLETE_MARKER).exists()
+        ] if self._local_path.parent.exists() else []
+        install_from_manifest(
+            self._storage_handler(),
+            self._fetch_manifest(),
+            self._local_path,
+            self._remote_blobs_prefix,
+            reuse_folders=other_versions
+        )
+
+    def _is_installed(self) -> bool:
+        return type(self).is_installed()
+
+    def _open_remote_archive(self) -> IndexedArchiveReader:
+        return IndexedArchiveReader.from_storage(self._storage_handler(), self.remote_relative_path)
+
+    def list_files(self) -> List[str]:
+        """Relative paths of the resource files; read from the remote archive index if the resource isn't installed."""
+        if not self._is_installed() and self._manifest_mode:
+            return sorted(self._fetch_manifest().files)
+
+        if not self._is_installed():
+            try:
+                with self._open_remote_archive() as archive:
+                    return sorted(entry.path for entry in archive.entries())
+            except ValueError:
+                LOG.info(f"Resource {self.name} v{self.version} archive has no index, loading it to list its files")
+                self.load()
+
+        return [path.relative_to(self._local_path).as_posix() for path in resource_files(self._local_path)]
+
+    def fetch_file(self, relative_path: str) -> Path:
+        """
+        Local path of a single resource file. If the resource isn't installed, only this file is fetched (its blob,
+        or ranged reads of the remote archive); the folder stays partial, so a later `load` installs everything.
+        """
+        local_file = self._local_path / relative_path
+        if self._is_installed() or local_file.exists():
+            return local_file
+
+        with self._install_lock():
+            if self._is_installed() or local_file.exists():
+                return local_file
+
+            if self._manifest_mode:
+                entry = self._fetch_manifest().files[relative_path]
+                single_file = ResourceManifest(self.name, self.version, {relative_path: entry})
+                install_from_manifest(
+                    self._storage_handler(), single_file, self._local_path, self._remote_blobs_prefix, save_manifest=False
+                )
+                return local_file
+
+            try:
+                archive = self._open_remote_archive()
+            except ValueError:
+                archive = None
+
+            if archive is not None:
+                with archive:
+                    return archive.extract(relative_path, self._local_path.parent)
+
+        LOG.info(f"Resource {self.name} v{self.version} archive has no index, loading it to fetch {relative_path}")
+        return self.load().local_path / relative_path
+
+    def array(self, relative_path: str, mmap: bool = True):
+        """
+        A numpy array stored as a `.npy` file in the resource, by default a read-only memory map, cached per resource,
+        whose bytes are read on access into the page cache, shared by all the processes that map the file.
+        With `mmap=False` the array is read into memory. A lazy resource that isn't installed fetches only this file.
+        """
+        if not relative_path.endswith(NPY_SUFFIX):
+            raise ValueError(f"Only {NPY_SUFFIX} files can be loaded as arrays, got: {relative_path}")
+
+        if not mmap:
+            return self._load_array(self.fetch_file(relative_path), mmap_mode=None)
+
+        with self._load_lock:
+            array = self._arrays.get(relative_path)
+            if array is None:
+                array = self._arrays[relative_path] = self._load_array(self.fetch_file(relative_path), mmap_mode='r')
+        return array
+
+    def arrays(self, mmap: bool = True) -> dict:
+        """All the `.npy` files of the resource as arrays, by relative path."""
+        return {path: self.array(path, mmap) for path in self.list_files() if path.endswith(NPY_SUFFIX)}
+
+    @staticmethod
+    def _load_array(path: Path, mmap_mode: Optional[str]):
+        try:
+            import numpy as np
+        except ImportError as e:
+            raise ImportError("numpy is required to load resource arrays, install it with: pip install numpy") from e
+        # pickled object arrays can't be memory mapped, and loading them runs arbitrary code
+        return np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
 
     def upload(self):
-        compressed_bytes = self._get_folder_compressor().compress_folder(self.local_path)
-        ResourceUploader(_CONFIG.remote_storage_type, _CONFIG.storage_config)\
-            .upload(compressed_bytes, self.remote_relative_path)
+        manifest = ResourceManifest.from_folder(self._local_path, self.name, self.version)
+        if self._manifest_mode:
+            stats = upload_manifest(
+                self._storage_handler(), self._local_path, manifest, self._remote_manifest_path, self._remote_blobs_prefix
+            )
+            LOG.info(f"Uploaded {self.name} v{self.version} manifest: {stats.to_dict()}")
+        else:
+            with tempfile.TemporaryDirectory(prefix='dstools-resource-') as tmp_dir:
+                archive_path = Path(tmp_dir) / 'archive'
+                self._get_folder_compressor().compress_folder_to_file(self._local_path, archive_path)
+                uploader = ResourceUploader(get_config().remote_storage_type, get_config().storage_config)
+                if uploader.upload_from_file(archive_path, self.remote_relative_path) is False:
+                    # without its archive, the version must not be published by its manifest nor marked complete
+                    raise IOError(f"Failed to upload the archive of {self.name} v{self.version}")
+            # the checksum manifest of the archive, to verify installs
+            if self._storage_handler().upload(manifest.to_json(), self._remote_manifest_path) is False:
+                raise IOError(f"Failed to upload the checksum manifest of {self.name} v{self.version}")
+
+        # the uploaded folder is a complete install too, verifiable and whose files other versions can reuse
+        manifest.save(self._local_path / LOCAL_MANIFEST_NAME)
+
+        (self._local_path / COMPLETE_MARKER).touch()
 
     @staticmethod
     def _get_folder_compressor() -> FolderCompressor:
-        bytes_compressor = SnappyCompressor()
-        compressor = FolderCompressor(bytes_compressor, mode='gz')
+        # indexed archives: files are compressed independently, large ones in blocks on all cores.
+        # archives uploaded before the streaming format are gz tars in raw snappy
+        compressor = FolderCompressor(
+            SnappyCompressor(),
+            mode='gz',
+            legacy_compressor=SnappyCompressor(),
+            indexed=True,
+            large_file_compressor=BlockParallelCompressor(SnappyCompressor()),
+            # markers and manifests describe the local install, they are not part of the resource
+            skip_prefix=RVS_FILE_PREFIX
+        )
         return compressor
@@ -1,6 +1,7 @@
 
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 
 from dstools.common.json_io import read_json
@@ -19,6 +20,8 @@ class ResourceConfig:
     remote_root: str
     remote_storage_type: str
     storage_config: dict
+    # bytes of resources_root kept after installs, evicting least recently used versions; unlimited if None
+    disk_budget: Optional[int] = None
 
     @staticmethod
     def from_path(path: Path) -> 'ResourceConfig':
@@ -29,7 +32,8 @@ class ResourceConfig:
             resources_root=str(resources_root_path),
             remote_root=config_data.get("remote_root"),
             remote_storage_type=storage.get("remote_storage_type"),
-            storage_config=storage.get("storage_config")
+            storage_config=storage.get("storage_config"),
+            disk_budget=config_data.get("disk_budget")
         )
 
     @staticmethod
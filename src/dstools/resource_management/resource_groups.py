@@ -0,0 +1,121 @@
+"""
+Concurrent prefetch of resource groups.
+
+`resource-groups.json` (next to rvs.json, see `locate_resource_groups_file`) maps a group name (prod, research, ...)
+to the dotted paths of its resource classes. Prefetching a group imports the classes and constructs them concurrently,
+so every missing resource is downloaded and extracted in parallel and a cold start takes about as long as the largest
+resource rather than the sum of all of them.
+
+Usage:
+    python -m dstools.resource_management.resource_groups research --workers 8
+"""
+import argparse
+import importlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from globalog import LOG
+
+from dstools.common.json_io import read_json
+from dstools.resource_management.resource_utils import locate_resource_groups_file
+
+DEFAULT_PREFETCH_WORKERS = 8
+
+
+@dataclass(frozen=True)
+class PrefetchResult:
+    class_path: str
+    status: str  # 'loaded', 'cached' or 'failed'
+    seconds: float
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def load_resource_groups(path: Optional[str | Path] = None) -> Dict[str, List[str]]:
+    path = path or locate_resource_groups_file()
+    if path is None:
+        raise FileNotFoundError("Could not locate resource-groups.json, set RVS_CONFIG_FOLDER or pass its path")
+    return read_json(path)
+
+
+def import_resource_class(class_path: str) -> type:
+    module_name, _, class_name = class_path.rpartition('.')
+    if not module_name:
+        raise ValueError(f"Expected a dotted path of a resource class, got: {class_path}")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def _prefetch_one(class_path: str) -> PrefetchResult:
+    start = time.perf_counter()
+    try:
+        resource_class = import_resource_class(class_path)
+        was_installed = resource_class.is_installed()
+        # lazy resources aren't loaded by their construction
+        resource_class().load()
+    except Exception as e:
+        LOG.error(f"Failed to prefetch {class_path}", exc_info=e)
+        return PrefetchResult(class_path, 'failed', time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+    return PrefetchResult(class_path, 'cached' if was_installed else 'loaded', time.perf_counter() - start)
+
+
+def prefetch_resources(
+        class_paths: Sequence[str],
+        max_workers: int = DEFAULT_PREFETCH_WORKERS
+) -> List[PrefetchResult]:
+    """Import and load the given resource classes concurrently; failures are reported, not raised."""
+    class_paths = list(dict.fromkeys(class_paths))
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='resource-prefetch') as pool:
+        futures = {pool.submit(_prefetch_one, class_path): class_path for class_path in class_paths}
+        for i, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results[result.class_path] = result
+            LOG.info(f"[{i}/{len(class_paths)}] {result.status} {result.class_path} in {result.seconds:.2f}s")
+
+    return [results[class_path] for class_path in class_paths]
+
+
+def prefetch_group(
+        group: str,
+        groups_path: Optional[str | Path] = None,
+        max_workers: int = DEFAULT_PREFETCH_WORKERS
+) -> List[PrefetchResult]:
+    groups = load_resource_groups(groups_path)
+    if group not in groups:
+        raise ValueError(f"Unknown resource group: {group}. Available groups: {sorted(groups)}")
+    return prefetch_resources(groups[group], max_workers)
+
+
+def format_summary(results: Sequence[PrefetchResult], total_seconds: float) -> str:
+    lines = [f"{result.status:<8}{result.seconds:>9.2f}s  {result.class_path}" for result in results]
+    counts = {status: sum(result.status == status for result in results) for status in ('loaded', 'cached', 'failed')}
+    slowest = max((result.seconds for result in results), default=0.0)
+    lines.append(
+        f"{len(results)} resources in {total_seconds:.2f}s (slowest {slowest:.2f}s): "
+        f"{counts['loaded']} loaded, {counts['cached']} cached, {counts['failed']} failed"
+    )
+    return '\n'.join(lines)
+
+
+def main(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Download and extract all the missing resources of a group')
+    parser.add_argument('group', help='group name in resource-groups.json, e.g. prod')
+    parser.add_argument('--groups-file', type=Path, help='path of resource-groups.json')
+    parser.add_argument('--workers', type=int, default=DEFAULT_PREFETCH_WORKERS)
+    parsed = parser.parse_args(args)
+
+    start = time.perf_counter()
+    results = prefetch_group(parsed.group, parsed.groups_file, parsed.workers)
+    print(format_summary(results, time.perf_counter() - start))
+    return 1 if any(result.status == 'failed' for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import dataclasses
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from globalog import LOG
+
+from dstools.storage.handlers.content_addressed_handler import ContentAddressedStorageHandler, DedupStats
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+# files of the resource management itself inside a resource folder (markers, manifests), never part of the resource
+RVS_FILE_PREFIX = '.rvs-'
+LOCAL_MANIFEST_NAME = '.rvs-manifest.json'
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        # hashlib releases the GIL on large updates, so files are hashed in parallel by threads
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resource_files(folder: Path) -> List[Path]:
+    """Files of a resource folder, without the resource management files."""
+    return sorted(
+        path for path in folder.rglob('*')
+        if path.is_file() and not path.name.startswith(RVS_FILE_PREFIX)
+    )
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    sha256: str
+    size: int
+    mode: int
+    # of the local file, recorded after install so quick verification can skip hashing unchanged files
+    mtime: Optional[float] = None
+
+
+@dataclass
+class ResourceManifest:
+    """The files of a resource version: relative path -> sha256, size and permission bits."""
+    name: str
+    version: str
+    files: Dict[str, ManifestEntry]
+    dirs: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'version': self.version,
+            'files': {path: asdict(entry) for path, entry in sorted(self.files.items())},
+            'dirs': self.dirs,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> 'ResourceManifest':
+        return ResourceManifest(
+            name=data['name'],
+            version=data['version'],
+            files={path: ManifestEntry(**entry) for path, entry in data['files'].items()},
+            dirs=data.get('dirs', []),
+        )
+
+    def to_json(self) -> bytes:
+        return json.dumps(self.to_dict(), indent=2).encode('utf-8')
+
+    @staticmethod
+    def from_json(data: bytes) -> 'ResourceManifest':
+        return ResourceManifest.from_dict(json.loads(data))
+
+    def save(self, path: Path):
+        # a unique temp file per writer, so concurrent saves never write into each other's file
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{path.name}.", suffix='.tmp', dir=path.parent)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.to_json())
+            # mkstemp creates the file private to its owner, the manifest is read by every user of the resource
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def load(path: Path) -> 'ResourceManifest':
+        return ResourceManifest.from_json(path.read_bytes())
+
+    @property
+    def total_size(self) -> int:
+        return sum(entry.size for entry in self.files.values())
+
+    @staticmethod
+    def from_folder(folder: Path, name: str, version: str, max_workers: int = 8) -> 'ResourceManifest':
+        """Build the manifest of a folder, hashing its files in parallel."""
+        folder = Path(folder)
+        files = resource_files(folder)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='manifest-hash') as pool:
+            digests = list(pool.map(file_sha256, files))
+
+        entries = {}
+        for path, digest in zip(files, digests):
+            stat = path.stat()
+            entries[path.relative_to(folder).as_posix()] = ManifestEntry(
+                digest, stat.st_size, stat.st_mode & 0o777, stat.st_mtime
+            )
+
+        dirs = sorted(path.relative_to(folder).as_posix() for path in folder.rglob('*') if path.is_dir())
+        return ResourceManifest(name, version, entries, dirs)
+
+    def with_local_mtimes(self, folder: Path) -> 'ResourceManifest':
+        """A copy recording the mtimes of the files as installed under `folder`."""
+        files = {}
+        for path, entry in self.files.items():
+            local_file = Path(folder) / path
+            files[path] = dataclasses.replace(entry, mtime=local_file.stat().st_mtime if local_file.is_file() else None)
+        return ResourceManifest(self.name, self.version, files, list(self.dirs))
+
+
+def verify_folder(folder: Path, manifest: ResourceManifest, full: bool = False, max_workers: int = 8) -> List[str]:
+    """
+    Relative paths of the manifest files that are missing or corrupted under `folder`.
+    The quick check compares sizes and hashes only the files whose mtime differs from the manifest;
+    the full check hashes every file. Files are hashed in parallel.
+    """
+    start = time.perf_counter()
+    folder = Path(folder)
+    damaged = []
+    to_hash = []
+    for path, entry in manifest.files.items():
+        try:
+            stat = (folder / path).stat()
+        except FileNotFoundError:
+            damaged.append(path)
+            continue
+
+        if stat.st_size != entry.size:
+            damaged.append(path)
+        elif full or entry.mtime is None or stat.st_mtime != entry.mtime:
+            to_hash.append(path)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='manifest-verify') as pool:
+        digests = list(pool.map(lambda path: file_sha256(folder / path), to_hash))
+    damaged.extend(path for path, digest in zip(to_hash, digests) if digest != manifest.files[path].sha256)
+
+    LOG.info(
+        f"Verified {len(manifest.files)} files of {manifest.name} v{manifest.version} ({len(to_hash)} hashed) "
+        f"in {time.perf_counter() - start:.2f}s: {len(damaged)} damaged"
+    )
+    return sorted(damaged)
+
+
+@dataclass
+class InstallStats:
+    downloaded: int = 0
+    downloaded_bytes: int = 0
+    reused: int = 0
+    reused_bytes: int = 0
+    kept: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def upload_manifest(
+        handler: StorageHandler,
+        folder: Path,
+        manifest: ResourceManifest,
+        remote_manifest_path: str,
+        blobs_prefix: str,
+        max_workers: int = 16
+) -> DedupStats:
+    """
+    Upload the files of a folder as content-addressed blobs under `blobs_prefix`, pushing only blobs that aren't
+    stored yet, and then the manifest itself, so a manifest is never visible before all its blobs are.
+    """
+    store = ContentAddressedStorageHandler(handler, prefix=blobs_prefix, max_workers=max_workers)
+    paths = list(manifest.files)
+    store.put_files([Path(folder) / path for path in paths], [manifest.files[path].sha256 for path in paths])
+    if handler.upload(manifest.to_json(), remote_manifest_path) is False:
+        raise IOError(f"Failed to upload the manifest of {manifest.name} v{manifest.version} to {remote_manifest_path}")
+    return store.stats
+
+
+def _local_copies(folders: Iterable[Path]) -> Dict[str, Path]:
+    """
+    sha256 -> a local file with that content, from the manifests of installed resource folders.
+    Only files still as their manifest recorded them (same size and mtime) are trusted to have that content.
+    """
+    copies = {}
+    for folder in folders:
+        manifest_path = folder / LOCAL_MANIFEST_NAME
+        if not manifest_path.exists():
+            continue
+
+        for path, entry in ResourceManifest.load(manifest_path).files.items():
+            if entry.sha256 in copies or entry.mtime is None:
+                continue
+            try:
+                stat = (folder / path).stat()
+            except FileNotFoundError:
+                continue
+            if stat.st_size == entry.size and stat.st_mtime == entry.mtime:
+                copies[entry.sha256] = folder / path
+    return copies
+
+
+def install_from_manifest(
+        handler: StorageHandler,
+        manifest: ResourceManifest,
+        local_path: Path,
+        blobs_prefix: str,
+        reuse_folders: Iterable[Path] = (),
+        max_workers: int = 16,
+        save_manifest: bool = True
+) -> InstallStats:
+    """
+    Materialize the files of a manifest under `local_path`. Files already there with the right content are kept,
+    files whose content exists in one of `reuse_folders` (e.g. other installed versions) are copied locally,
+    and only the rest is downloaded, in parallel. Every file is checked against its sha256 before it is put in place. The manifest is saved in the folder last (unless `save_manifest` is off,
+    for partial installs).
+    """
+    store = ContentAddressedStorageHandler(handler, prefix=blobs_prefix)
+    copies = _local_copies(reuse_folders)
+    stats = InstallStats()
+    stats_lock = threading.Lock()
+
+    local_path.mkdir(parents=True, exist_ok=True)
+    for directory in manifest.dirs:
+        (local_path / directory).mkdir(parents=True, exist_ok=True)
+
+    def install(item):
+        path, entry = item
+        target = local_path / path
+        # a file of the right size may still be a truncated or corrupted one, e.g. of an interrupted install
+        if target.is_file() and target.stat().st_size == entry.size and file_sha256(target) == entry.sha256:
+            with stats_lock:
+                stats.kept += 1
+            return
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_target = target.with_name(f".{target.name}.part")
+        source = copies.get(entry.sha256)
+        try:
+            if source is not None:
+                shutil.copyfile(source, tmp_target)
+                if file_sha256(tmp_target) != entry.sha256:
+                    LOG.warning(f"Local copy {source} of {path} doesn't match its manifest, downloading it instead")
+                    source = None
+            if source is None:
+                blob_path = store.digest_path(entry.sha256)
+                handler.download_to_file(blob_path, tmp_target)
+                digest = file_sha256(tmp_target)
+                if digest != entry.sha256:
+                    raise IOError(f"Checksum mismatch of {blob_path} for {path}: sha256 {digest}, expected {entry.sha256}")
+            os.chmod(tmp_target, entry.mode)
+            os.replace(tmp_target, target)
+        except BaseException:
+            tmp_target.unlink(missing_ok=True)
+            raise
+
+        with stats_lock:
+            if source is not None:
+                stats.reused += 1
+                stats.reused_bytes += entry.size
+            else:
+                stats.downloaded += 1
+                stats.downloaded_bytes += entry.size
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='manifest-install') as pool:
+        list(pool.map(install, manifest.files.items()))
+
+    if save_manifest:
+        manifest.with_local_mtimes(local_path).save(local_path / LOCAL_MANIFEST_NAME)
+    LOG.info(f"Installed {manifest.name} v{manifest.version} from its manifest: {stats.to_dict()}")
+    return stats
@@ -1,3 +1,4 @@
+from pathlib import Path
 
 from dstools.storage.handlers.storage_handler import StorageHandlerFactory
 
@@ -9,3 +10,6 @@ class ResourceDownloader:
     def download(self, remote_relative_path: str) -> bytes:
         content = self.handler.download(remote_relative_path)
         return content
+
+    def download_to_file(self, remote_relative_path: str, local_path: Path):
+        self.handler.download_to_file(remote_relative_path, local_path)
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 from globalog import LOG
 
 from dstools.storage.handlers.storage_handler import StorageHandlerFactory
@@ -7,7 +9,16 @@ class ResourceUploader:
         self._storage_type = storage_type
         self.handler = StorageHandlerFactory.get_handler(storage_type, storage_config)
 
-    def upload(self, content: bytes, remote_relative_path: str):
+    def upload(self, content: bytes, remote_relative_path: str) -> bool:
         LOG.debug(f"Upload {len(content)} bytes to {self._storage_type} at {remote_relative_path}")
-        self.handler.upload(content, remote_relative_path)
-        LOG.debug(f"Uploaded {remote_relative_path} to {self._storage_type}.")
+        status = self.handler.upload(content, remote_relative_path)
+        if status is not False:
+            LOG.debug(f"Uploaded {remote_relative_path} to {self._storage_type}.")
+        return status
+
+    def upload_from_file(self, local_path: Path, remote_relative_path: str) -> bool:
+        LOG.debug(f"Upload {local_path} to {self._storage_type} at {remote_relative_path}")
+        status = self.handler.upload_from_file(local_path, remote_relative_path)
+        if status is not False:
+            LOG.debug(f"Uploaded {remote_relative_path} to {self._storage_type}.")
+        return status
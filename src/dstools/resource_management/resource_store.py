@@ -0,0 +1,239 @@
+"""
+Local resource store: disk usage and garbage collection of the installed resource versions.
+
+Every version is installed under `resources_root/<name>/V<version>` and stays there until evicted. Processes using a
+version hold a shared lock on `.V<version>.use.lock` next to it (see `Resource`), whose mtime is the last access time
+of the version. Garbage collection evicts the least recently used versions until the store fits in a disk budget,
+skipping the versions locked by live processes.
+
+Usage:
+    python -m dstools.resource_management.resource_store du
+    python -m dstools.resource_management.resource_store gc --budget 50G --dry-run
+"""
+import argparse
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from globalog import LOG
+
+from dstools.common.file_lock import FileLock
+from dstools.resource_management.resource import COMPLETE_MARKER, get_config, install_lock_path, use_lock_path
+
+GC_LOCK_NAME = '.rvs-gc.lock'
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(text: str) -> int:
+    """Bytes of a size like 1048576, 512M or 50G (binary units)."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?', text.strip().upper())
+    if match is None:
+        raise ValueError(f"Invalid size: {text}. Expected bytes or a number with a K/M/G/T unit, e.g. 50G")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size}B"
+    for unit in ('K', 'M', 'G', 'T'):
+        size /= 1024
+        if size < 1024 or unit == 'T':
+            return f"{size:.1f}{unit}"
+
+
+def _folder_size(folder: Path) -> int:
+    total = 0
+    for dir_path, _, file_names in os.walk(folder):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+
+@dataclass(frozen=True)
+class StoredVersion:
+    name: str
+    version: str
+    path: Path
+    size: int
+    last_access: float
+    complete: bool
+    in_use: bool
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'path': str(self.path)}
+
+
+class ResourceStore:
+    """The installed resource versions under a resources root (by default the one of the rvs config)."""
+
+    def __init__(self, root: Optional[str | Path] = None):
+        self._root = Path(root if root is not None else get_config().resources_root).expanduser()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def versions(self) -> List[StoredVersion]:
+        if not self._root.exists():
+            return []
+
+        versions = []
+        for resource_folder in sorted(self._root.iterdir()):
+            if not resource_folder.is_dir() or resource_folder.name.startswith('.'):
+                continue
+
+            for path in sorted(resource_folder.glob('V*')):
+                if not path.is_dir():
+                    continue
+
+                lock_path = use_lock_path(path)
+                # read before probing the use lock, so that the probe can never look like an access
+                last_access = (lock_path if lock_path.exists() else path).stat().st_mtime
+                versions.append(StoredVersion(
+                    name=resource_folder.name,
+                    version=path.name[1:],
+                    path=path,
+                    size=_folder_size(path),
+                    last_access=last_access,
+                    complete=(path / COMPLETE_MARKER).exists(),
+                    in_use=self._in_use(path),
+                ))
+        return versions
+
+    @staticmethod
+    def _in_use(path: Path) -> bool:
+        # probed without creating the lock file: its mtime is the last access time, and the root may be read-only
+        lock = FileLock(use_lock_path(path), create=False)
+        try:
+            if not lock.acquire(blocking=False):
+                return True
+        except FileNotFoundError:
+            # no process ever held a use lock on it
+            return False
+        lock.release()
+        return False
+
+    def disk_usage(self) -> Dict[str, int]:
+        """Bytes used by each resource, all versions included."""
+        usage = {}
+        for version in self.versions():
+            usage[version.name] = usage.get(version.name, 0) + version.size
+        return usage
+
+    def evict(self, version: StoredVersion) -> bool:
+        """Delete an installed version, unless a process is using or installing it. Returns whether it was deleted."""
+        use_lock = FileLock(use_lock_path(version.path))
+        try:
+            if not use_lock.acquire(blocking=False):
+                return False
+        except OSError as e:
+            LOG.warning(f"Can't evict {version.name} v{version.version} from {self._root}: {e}")
+            return False
+
+        try:
+            install_lock = FileLock(install_lock_path(version.path))
+            if not install_lock.acquire(blocking=False):
+                return False
+
+            try:
+                # without the marker, a deletion interrupted midway leaves a partial install, repaired on next load
+                (version.path / COMPLETE_MARKER).unlink(missing_ok=True)
+                shutil.rmtree(version.path, ignore_errors=True)
+            finally:
+                install_lock.release()
+        finally:
+            use_lock.release()
+
+        LOG.info(f"Evicted {version.name} v{version.version} ({format_size(version.size)}) from {self._root}")
+        return True
+
+    def gc(self, budget: int, dry_run: bool = False) -> List[StoredVersion]:
+        """
+        Evict the least recently used versions, across all resources, until the store fits in `budget` bytes.
+        Versions in use are skipped. Returns the evicted versions (the ones that would be, if `dry_run`).
+        """
+        if budget < 0:
+            raise ValueError(f"budget must be a non-negative number of bytes, got {budget}")
+
+        gc_lock = FileLock(self._root / GC_LOCK_NAME)
+        try:
+            gc_lock.acquire()
+        except OSError as e:
+            LOG.warning(f"Can't garbage collect the resource store {self._root}: {e}")
+            return []
+
+        try:
+            versions = self.versions()
+            total_size = sum(version.size for version in versions)
+            evicted = []
+            for version in sorted(versions, key=lambda v: v.last_access):
+                if total_size <= budget:
+                    break
+                if version.in_use:
+                    continue
+
+                if dry_run or self.evict(version):
+                    evicted.append(version)
+                    total_size -= version.size
+        finally:
+            gc_lock.release()
+
+        if total_size > budget:
+            LOG.warning(
+                f"Resource store {self._root} uses {format_size(total_size)} after gc, over its budget of "
+                f"{format_size(budget)}: the remaining versions are in use"
+            )
+        return evicted
+
+
+def format_usage(versions: List[StoredVersion]) -> str:
+    now = time.time()
+    lines = [f"{'size':>8}  {'idle':>8}  {'state':<10}resource"]
+    by_name = {}
+    for version in versions:
+        by_name.setdefault(version.name, []).append(version)
+
+    for name, name_versions in by_name.items():
+        total = sum(version.size for version in name_versions)
+        lines.append(f"{format_size(total):>8}  {'':>8}  {'':<10}{name}")
+        for version in sorted(name_versions, key=lambda v: v.last_access, reverse=True):
+            state = 'in use' if version.in_use else ('complete' if version.complete else 'partial')
+            idle_days = (now - version.last_access) / 86400
+            lines.append(f"{format_size(version.size):>8}  {idle_days:>7.1f}d  {state:<10}  V{version.version}")
+
+    lines.append(f"{format_size(sum(version.size for version in versions)):>8}  total")
+    return '\n'.join(lines)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Disk usage and garbage collection of the local resource store')
+    parser.add_argument('--root', type=Path, help='resources root, by default the one of rvs.json')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('du', help='disk usage of every resource and version')
+    gc_parser = commands.add_parser('gc', help='evict least recently used versions to fit in a disk budget')
+    gc_parser.add_argument('--budget', type=parse_size, required=True, help='e.g. 50G')
+    gc_parser.add_argument('--dry-run', action='store_true', help='only print the versions that would be evicted')
+    parsed = parser.parse_args(args)
+
+    store = ResourceStore(parsed.root)
+    if parsed.command == 'du':
+        print(format_usage(store.versions()))
+        return
+
+    evicted = store.gc(parsed.budget, parsed.dry_run)
+    action = 'would evict' if parsed.dry_run else 'evicted'
+    for version in evicted:
+        print(f"{action} {version.name} V{version.version} ({format_size(version.size)})")
+    print(f"{action} {len(evicted)} versions, {format_size(sum(version.size for version in evicted))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 import os
 from pathlib import Path
+from typing import Optional
 
 from globalog import LOG
 
 RESOURCES_FOLDER_NAME = 'resources'
+RESOURCE_GROUPS_FILE_NAME = 'resource-groups.json'
 _RESOURCES_DIR = Path(__file__).parents[1] / RESOURCES_FOLDER_NAME
 
 
@@ -32,3 +34,18 @@ def locate_rvs_config_file() -> Path:
     LOG.warning('Could not locate rvs.json')
     return None
 
+
+
+def locate_resource_groups_file() -> Optional[Path]:
+    """Locate resource-groups.json the same way as rvs.json: $RVS_CONFIG_FOLDER, then the cwd, then cwd/rvs."""
+    env_var = os.environ.get('RVS_CONFIG_FOLDER')
+    if env_var:
+        return Path(env_var) / RESOURCE_GROUPS_FILE_NAME
+
+    for folder in (Path.cwd(), Path.cwd() / 'rvs'):
+        groups_file = folder / RESOURCE_GROUPS_FILE_NAME
+        if groups_file.exists():
+            return groups_file
+
+    LOG.warning(f'Could not locate {RESOURCE_GROUPS_FILE_NAME}')
+    return None
@@ -0,0 +1,200 @@
+"""
+Offline storage throughput benchmarks.
+
+Measures single-object, batched (thread pool), async and large-object throughput for the local handler and a
+GCSHandler over a FakeBucket with simulated latency and bandwidth, each with and without the compression wrapper.
+
+Usage:
+    python -m dstools.storage.benchmark --objects 200 --object-size 65536 --latency 0.01 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from dstools.compression.registry import get_compressor
+from dstools.storage.handlers.async_handler import AsyncStorageHandler
+from dstools.storage.handlers.compressing_handler import CompressingStorageHandler
+from dstools.storage.handlers.fake_gcs import FakeBucket
+from dstools.storage.handlers.gcs_handler import GCSHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+
+@dataclass(frozen=True)
+class BenchmarkConfig:
+    objects: int = 200
+    object_size: int = 64 * 1024
+    large_object_size: int = 64 * 1024 * 1024
+    concurrency: int = 16
+    latency: float = 0.005
+    bandwidth: Optional[float] = 200 * 1024 * 1024
+    part_size: int = 8 * 1024 * 1024
+    compressible_ratio: float = 0.5
+    seed: int = 0
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    handler: str
+    mode: str
+    direction: str
+    objects: int
+    bytes: int
+    seconds: float
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.bytes / self.seconds / 1024 ** 2 if self.seconds else float('inf')
+
+    @property
+    def objects_per_second(self) -> float:
+        return self.objects / self.seconds if self.seconds else float('inf')
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'mb_per_second': self.mb_per_second, 'objects_per_second': self.objects_per_second}
+
+
+def make_payload(size: int, compressible_ratio: float, rng: random.Random) -> bytes:
+    """Payload with a mix of repetitive text (compressible) and random bytes (incompressible)."""
+    compressible_size = int(size * compressible_ratio)
+    line = b'{"page_id": "0123456789", "text": "lorem ipsum dolor sit amet", "score": 0.5}\n'
+    compressible = (line * (compressible_size // len(line) + 1))[:compressible_size]
+    return compressible + rng.randbytes(size - compressible_size)
+
+
+def _timed(func: Callable[[], None]) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def bench_single(handler: StorageHandler, payloads: Dict[str, bytes]) -> List[tuple]:
+    upload = _timed(lambda: [handler.upload(content, path) for path, content in payloads.items()])
+    download = _timed(lambda: [handler.download(path) for path in payloads])
+    return [('upload', upload), ('download', download)]
+
+
+def bench_batched(handler: StorageHandler, payloads: Dict[str, bytes], concurrency: int) -> List[tuple]:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        upload = _timed(lambda: list(pool.map(lambda item: handler.upload(item[1], item[0]), payloads.items())))
+        download = _timed(lambda: list(pool.map(handler.download, payloads)))
+    return [('upload', upload), ('download', download)]
+
+
+def bench_async(handler: StorageHandler, payloads: Dict[str, bytes], concurrency: int) -> List[tuple]:
+    async def run() -> List[tuple]:
+        async with AsyncStorageHandler(handler, max_concurrency=concurrency) as async_handler:
+            start = time.perf_counter()
+            await async_handler.upload_many((content, path) for path, content in payloads.items())
+            upload = time.perf_counter() - start
+            start = time.perf_counter()
+            await async_handler.download_many(list(payloads))
+            download = time.perf_counter() - start
+        return [('upload', upload), ('download', download)]
+
+    return asyncio.run(run())
+
+
+def bench_large(handler: StorageHandler, path: str, content: bytes, work_dir: Path) -> List[tuple]:
+    local_file = work_dir / 'large-object'
+    local_file.write_bytes(content)
+    upload = _timed(lambda: handler.upload_from_file(local_file, path))
+    download = _timed(lambda: handler.download_to_file(path, work_dir / 'large-object-downloaded'))
+    return [('upload', upload), ('download', download)]
+
+
+def build_handlers(config: BenchmarkConfig, work_dir: Path) -> Dict[str, StorageHandler]:
+    fake_gcs_config = {'bucket': 'benchmark', 'part_size': config.part_size, 'parallel_threshold': 2 * config.part_size}
+    handlers = {
+        'local': LocalStorageHandler(work_dir / 'local'),
+        'fake-gcs': GCSHandler(
+            fake_gcs_config,
+            bucket=FakeBucket(latency=config.latency, bandwidth=config.bandwidth, name='benchmark')
+        ),
+    }
+    for name, handler in list(handlers.items()):
+        handlers[f'{name}+snappy'] = CompressingStorageHandler(handler, get_compressor('snappy'))
+    return handlers
+
+
+def run_benchmarks(config: BenchmarkConfig, handler_names: Optional[List[str]] = None) -> List[BenchmarkResult]:
+    rng = random.Random(config.seed)
+    payloads = {
+        f"bench/object-{i:06d}.json": make_payload(config.object_size, config.compressible_ratio, rng)
+        for i in range(config.objects)
+    }
+    large_payload = make_payload(config.large_object_size, config.compressible_ratio, rng)
+    total_bytes = sum(map(len, payloads.values()))
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='dstools-storage-bench-') as tmp:
+        work_dir = Path(tmp)
+        for name, handler in build_handlers(config, work_dir).items():
+            if handler_names and name not in handler_names:
+                continue
+
+            modes = {
+                'single': lambda: bench_single(handler, payloads),
+                'batched': lambda: bench_batched(handler, payloads, config.concurrency),
+                'async': lambda: bench_async(handler, payloads, config.concurrency),
+            }
+            for mode, bench in modes.items():
+                for direction, seconds in bench():
+                    results.append(BenchmarkResult(name, mode, direction, len(payloads), total_bytes, seconds))
+
+            for direction, seconds in bench_large(handler, 'bench/large-object.bin', large_payload, work_dir):
+                results.append(BenchmarkResult(name, 'large', direction, 1, len(large_payload), seconds))
+
+    return results
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    header = f"{'handler':<16}{'mode':<9}{'direction':<10}{'objects':>9}{'MB/s':>10}{'objects/s':>12}"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        lines.append(
+            f"{result.handler:<16}{result.mode:<9}{result.direction:<10}{result.objects:>9}"
+            f"{result.mb_per_second:>10.1f}{result.objects_per_second:>12.1f}"
+        )
+    return '\n'.join(lines)
+
+
+def main(args: Optional[List[str]] = None):
+    defaults = BenchmarkConfig()
+    parser = argparse.ArgumentParser(description='Storage throughput benchmarks')
+    parser.add_argument('--objects', type=int, default=defaults.objects)
+    parser.add_argument('--object-size', type=int, default=defaults.object_size)
+    parser.add_argument('--large-object-size', type=int, default=defaults.large_object_size)
+    parser.add_argument('--concurrency', type=int, default=defaults.concurrency)
+    parser.add_argument('--latency', type=float, default=defaults.latency, help='fake GCS latency per request (s)')
+    parser.add_argument('--bandwidth', type=float, default=defaults.bandwidth, help='fake GCS bandwidth (bytes/s)')
+    parser.add_argument('--part-size', type=int, default=defaults.part_size)
+    parser.add_argument('--handlers', nargs='*', help='subset of handlers to benchmark')
+    parser.add_argument('--json', type=Path, help='write the results to this json file')
+    parsed = parser.parse_args(args)
+
+    config = BenchmarkConfig(
+        objects=parsed.objects,
+        object_size=parsed.object_size,
+        large_object_size=parsed.large_object_size,
+        concurrency=parsed.concurrency,
+        latency=parsed.latency,
+        bandwidth=parsed.bandwidth,
+        part_size=parsed.part_size,
+    )
+    results = run_benchmarks(config, parsed.handlers)
+    print(format_results(results))
+    if parsed.json:
+        with open(parsed.json, 'w') as f:
+            json.dump({'config': asdict(config), 'results': [r.to_dict() for r in results]}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import base64
+from pathlib import Path
+
+import google_crc32c
+
+_READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def crc32c_bytes(data: bytes) -> str:
+    """crc32c of the data, base64 encoded like the `crc32c` property of GCS blobs."""
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode('ascii')
+
+
+def crc32c_file(path: str | Path) -> str:
+    """crc32c of a file's content, base64 encoded like the `crc32c` property of GCS blobs."""
+    checksum = google_crc32c.Checksum()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode('ascii')
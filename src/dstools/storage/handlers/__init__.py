@@ -6,3 +6,9 @@ from dstools.storage.handlers.ssh_handler import SSHStorageHandler
 from dstools.storage.handlers.async_handler import AsyncStorageHandler
 from dstools.storage.handlers.storage_handler import StorageHandlerFactory
 from dstools.storage.handlers.storage_handler_config import StorageHandlerConfig
+from dstools.storage.handlers.delegating_handler import DelegatingStorageHandler
+from dstools.storage.handlers.caching_handler import CachingStorageHandler
+from dstools.storage.handlers.hedged_handler import HedgedAsyncStorageHandler
+from dstools.storage.handlers.content_addressed_handler import ContentAddressedStorageHandler
+from dstools.storage.handlers.compressing_handler import CompressingStorageHandler
+from dstools.storage.handlers.instrumented_handler import InstrumentedStorageHandler, StorageMetrics
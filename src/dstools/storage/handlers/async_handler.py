@@ -1,29 +1,152 @@
 import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple, TypeVar
 
+from dstools.storage.handlers.instrumented_handler import StorageMetrics, track_optional
 from dstools.storage.handlers.storage_handler import StorageHandler, StorageHandlerFactory
 
+_T = TypeVar('_T')
+
+DEFAULT_MAX_CONCURRENCY = 32
+
 
 class AsyncStorageHandler:
-    def __init__(self, handler: StorageHandler):
+    """
+    Async facade over a blocking StorageHandler.
+
+    Calls run on a thread pool owned by this handler (never the loop's default executor), and at most
+    `max_concurrency` calls of an event loop are in flight at once; the rest wait on a semaphore instead of piling up
+    in the executor queue. The handler can be reused across event loops (e.g. successive `asyncio.run` calls).
+
+    If `metrics` is given, the async operations are recorded into it as 'async_<operation>', with latencies that
+    include the time spent waiting for a free slot.
+    """
+
+    def __init__(
+            self,
+            handler: StorageHandler,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            executor: Optional[ThreadPoolExecutor] = None,
+            metrics: Optional[StorageMetrics] = None
+    ):
         if not isinstance(handler, StorageHandler):
             raise TypeError("handler must be an instance of StorageHandler")
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be a positive integer, got {max_concurrency}")
+
         self.handler = handler
+        self._max_concurrency = max_concurrency
+        self._owns_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix='async-storage'
+        )
+        # asyncio semaphores bind to the loop that first waits on them, so each running loop gets its own
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+        self._metrics = metrics
+
+    @property
+    def max_concurrency(self) -> int:
+        return self._max_concurrency
+
+    @property
+    def metrics(self) -> Optional[StorageMetrics]:
+        return self._metrics
+
+    def _semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self._max_concurrency)
+            return semaphore
+
+    async def run(self, func: Callable[..., _T], *args) -> _T:
+        """Run a blocking call on the handler's executor, respecting the concurrency limit (per event loop)."""
+        return await self._run_in_slot(self._semaphore(asyncio.get_running_loop()), self._executor, func, *args)
+
+    @staticmethod
+    async def _run_in_slot(semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor, func: Callable[..., _T], *args) -> _T:
+        """
+        Run a blocking call on the executor within a slot of the semaphore. The slot is released when the call
+        returns on its thread, not when the awaiting task is cancelled: a cancelled call keeps running until it does.
+        """
+        loop = asyncio.get_running_loop()
+        await semaphore.acquire()
+        try:
+            future = executor.submit(func, *args)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # the loop is closed, and its semaphore with it
+                pass
+
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future, loop=loop)
 
     async def download(self, remote_relative_path: str) -> bytes:
         """Download content asynchronously."""
-        loop = asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, self.handler.download, remote_relative_path)
-        return data
+        with track_optional(self._metrics, 'async_download') as tracker:
+            content = await self.run(self.handler.download, remote_relative_path)
+            tracker.add_bytes(len(content))
+        return content
+
+    async def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        """Download the bytes in [start, end) of the remote object asynchronously."""
+        with track_optional(self._metrics, 'async_download_range') as tracker:
+            content = await self.run(self.handler.download_range, remote_relative_path, start, end)
+            tracker.add_bytes(len(content))
+        return content
 
     async def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
         """Upload content asynchronously."""
-        loop = asyncio.get_event_loop()
-        status = await loop.run_in_executor(None, self.handler.upload, compressed_data, remote_relative_path)
+        with track_optional(self._metrics, 'async_upload') as tracker:
+            status = await self.run(self.handler.upload, compressed_data, remote_relative_path)
+            tracker.add_status(status, len(compressed_data))
         return status
 
+    async def download_many(self, remote_relative_paths: Iterable[str]) -> List[bytes]:
+        """Download multiple objects concurrently. Results are returned in the order of the given paths."""
+        tasks = [self.download(path) for path in remote_relative_paths]
+        return await asyncio.gather(*tasks)
+
+    async def upload_many(self, items: Iterable[Tuple[bytes, str]]) -> List[bool]:
+        """
+        Upload multiple (content, remote_relative_path) pairs concurrently.
+        Statuses are returned in the order of the given items.
+        """
+        tasks = [self.upload(content, path) for content, path in items]
+        return await asyncio.gather(*tasks)
+
+    def close(self, wait: bool = True):
+        """Shut down the executor if it is owned by this handler."""
+        if self._owns_executor:
+            self._executor.shutdown(wait=wait)
+
+    async def __aenter__(self) -> 'AsyncStorageHandler':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
 
 class AsyncStorageHandlerFactory:
     @staticmethod
-    def get_async_handler(storage_type: str, storage_config: dict) -> AsyncStorageHandler:
+    def get_async_handler(
+            storage_type: str,
+            storage_config: dict,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ) -> AsyncStorageHandler:
+        if storage_type.upper() == "GCS" and "pool_size" not in storage_config:
+            # one pooled connection per concurrent call, so that connections are reused rather than discarded
+            storage_config = {**storage_config, "pool_size": max_concurrency}
+
         handler = StorageHandlerFactory.get_handler(storage_type, storage_config)
-        return AsyncStorageHandler(handler)
+        return AsyncStorageHandler(handler, max_concurrency=max_concurrency)
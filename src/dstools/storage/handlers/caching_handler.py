@@ -0,0 +1,263 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from globalog import LOG
+
+from dstools.common.file_lock import FileLock
+from dstools.storage.handlers.delegating_handler import DelegatingStorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler, DEFAULT_CHUNK_SIZE, check_range
+
+DEFAULT_CACHE_MAX_BYTES = 10 * 1024 ** 3
+
+# after eviction the cache is trimmed down to this fraction of the budget, so that not every write evicts
+_EVICTION_LOW_WATERMARK = 0.9
+# the cache is rescanned after each process wrote this fraction of the budget, since other processes write too
+_RESCAN_FRACTION = 0.05
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    evicted_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'hit_rate': self.hit_rate}
+
+
+class CachingStorageHandler(DelegatingStorageHandler):
+    """
+    Read-through on-disk cache in front of another StorageHandler.
+
+    Downloaded objects are stored under `cache_dir`, keyed by the hash of their remote path. The total size of the
+    cache is kept under `max_bytes` by evicting the least recently used entries (recency is tracked with the file
+    mtime, which is bumped on every hit). Entries are written to a temporary file and atomically renamed into place,
+    and eviction is serialized with a file lock, so several processes can share one cache directory. Each process
+    rescans the cache size after writing `_RESCAN_FRACTION` of the budget, so processes sharing a directory exceed
+    the budget by at most that fraction each.
+    Uploads go to the wrapped handler and invalidate the cached entry of the same path, before and after the upload,
+    so that a read racing with the upload doesn't keep the old content cached.
+    Hit/miss counters are per process.
+    """
+
+    def __init__(self, handler: StorageHandler, cache_dir: str | Path, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        super().__init__(handler)
+        if max_bytes <= 0:
+            raise ValueError(f"max_bytes must be a positive integer, got {max_bytes}")
+
+        self._cache_dir = Path(cache_dir).expanduser()
+        self._objects_dir = self._cache_dir / 'objects'
+        self._tmp_dir = self._cache_dir / 'tmp'
+        self._objects_dir.mkdir(parents=True, exist_ok=True)
+        self._tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._eviction_lock_path = self._cache_dir / '.eviction.lock'
+
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._approx_size = self._scan_size()
+        # bytes this process wrote since it last scanned the cache
+        self._unscanned_bytes = 0
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._cache_dir
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**asdict(self._stats))
+
+    def _entry_path(self, remote_relative_path: str) -> Path:
+        key = hashlib.sha256(remote_relative_path.encode('utf-8')).hexdigest()
+        return self._objects_dir / key[:2] / key
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self._stats.hits += 1
+            else:
+                self._stats.misses += 1
+
+    def _open_entry(self, remote_relative_path: str) -> Optional[BinaryIO]:
+        """Open the cached entry and mark it as recently used, or return None if it is not cached."""
+        entry_path = self._entry_path(remote_relative_path)
+        try:
+            f = open(entry_path, 'rb')
+        except FileNotFoundError:
+            self._count(hit=False)
+            return None
+
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # evicted by another process after we opened it; the open handle is still readable
+            pass
+
+        self._count(hit=True)
+        return f
+
+    def _commit_entry(self, tmp_path: Path, remote_relative_path: str):
+        """Atomically move a fully written temporary file into the cache."""
+        size = tmp_path.stat().st_size
+        if size > self._max_bytes:
+            tmp_path.unlink()
+            return
+
+        entry_path = self._entry_path(remote_relative_path)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, entry_path)
+        with self._lock:
+            self._approx_size += size
+            self._unscanned_bytes += size
+            should_check = (
+                self._approx_size > self._max_bytes or self._unscanned_bytes >= self._max_bytes * _RESCAN_FRACTION
+            )
+
+        if should_check:
+            self._evict()
+
+    def _fetch_to_cache(self, remote_relative_path: str) -> BinaryIO:
+        """Download the object into the cache and return an open handle to it."""
+        fd, tmp_name = tempfile.mkstemp(dir=self._tmp_dir)
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        try:
+            self._handler.download_to_file(remote_relative_path, tmp_path)
+            # the handle stays readable even if the entry is not kept or gets evicted right away
+            f = open(tmp_path, 'rb')
+            try:
+                self._commit_entry(tmp_path, remote_relative_path)
+            except BaseException:
+                f.close()
+                raise
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+        return f
+
+    def _iter_entries(self) -> Iterator[Tuple[os.stat_result, Path]]:
+        for shard in self._objects_dir.iterdir():
+            try:
+                entry_paths = list(shard.iterdir())
+            except FileNotFoundError:
+                continue
+
+            for entry_path in entry_paths:
+                try:
+                    yield entry_path.stat(), entry_path
+                except FileNotFoundError:
+                    continue
+
+    def _scan_size(self) -> int:
+        return sum(stat.st_size for stat, _ in self._iter_entries())
+
+    def _evict(self):
+        """Rescan the cache, whose size includes the writes of other processes, and evict if it is over budget."""
+        with FileLock(self._eviction_lock_path):
+            entries = sorted(self._iter_entries(), key=lambda entry: entry[0].st_mtime)
+            total_size = sum(stat.st_size for stat, _ in entries)
+            # within budget, the rescan only refreshes the size
+            target_size = total_size
+            if total_size > self._max_bytes:
+                target_size = int(self._max_bytes * _EVICTION_LOW_WATERMARK)
+            evictions, evicted_bytes = 0, 0
+            for stat, entry_path in entries:
+                if total_size <= target_size:
+                    break
+
+                try:
+                    entry_path.unlink()
+                except FileNotFoundError:
+                    pass
+                else:
+                    evictions += 1
+                    evicted_bytes += stat.st_size
+
+                total_size -= stat.st_size
+
+        with self._lock:
+            self._approx_size = total_size
+            self._unscanned_bytes = 0
+            self._stats.evictions += evictions
+            self._stats.evicted_bytes += evicted_bytes
+
+        if not evictions:
+            return
+        LOG.debug(f"Evicted {evictions} entries ({evicted_bytes} bytes) from cache at {self._cache_dir}")
+
+    def invalidate(self, remote_relative_path: str):
+        self._entry_path(remote_relative_path).unlink(missing_ok=True)
+
+    def clear(self):
+        with FileLock(self._eviction_lock_path):
+            shutil.rmtree(self._objects_dir, ignore_errors=True)
+            self._objects_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._approx_size = 0
+
+    def download(self, remote_relative_path: str) -> bytes:
+        with self.open_read(remote_relative_path) as f:
+            return f.read()
+
+    def open_read(self, remote_relative_path: str) -> BinaryIO:
+        f = self._open_entry(remote_relative_path)
+        if f is None:
+            f = self._fetch_to_cache(remote_relative_path)
+        return f
+
+    def iter_download(self, remote_relative_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        return StorageHandler.iter_download(self, remote_relative_path, chunk_size)
+
+    def download_to_file(self, remote_relative_path: str, local_path: str | Path):
+        with self.open_read(remote_relative_path) as f, open(local_path, 'wb') as dst:
+            shutil.copyfileobj(f, dst)
+
+    def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        check_range(start, end)
+        f = self._open_entry(remote_relative_path)
+        if f is None:
+            # partial reads are not cached
+            return self._handler.download_range(remote_relative_path, start, end)
+
+        with f:
+            f.seek(start)
+            return f.read() if end is None else f.read(max(end - start, 0))
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        self.invalidate(remote_relative_path)
+        try:
+            return self._handler.upload(compressed_data, remote_relative_path)
+        finally:
+            # a read during the upload may have cached the previous content again
+            self.invalidate(remote_relative_path)
+
+    def upload_from_stream(self, stream: BinaryIO, remote_relative_path: str) -> bool:
+        self.invalidate(remote_relative_path)
+        try:
+            return self._handler.upload_from_stream(stream, remote_relative_path)
+        finally:
+            self.invalidate(remote_relative_path)
+
+    def upload_from_file(self, local_path: str | Path, remote_relative_path: str) -> bool:
+        self.invalidate(remote_relative_path)
+        try:
+            return self._handler.upload_from_file(local_path, remote_relative_path)
+        finally:
+            self.invalidate(remote_relative_path)
@@ -0,0 +1,154 @@
+import struct
+from pathlib import PurePosixPath
+from typing import FrozenSet, Optional, Tuple
+
+from dstools.compression.compressor import Compressor
+from dstools.compression.registry import get_compressor
+from dstools.storage.handlers.delegating_handler import DelegatingStorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+# header of compressed objects: magic, codec name length (u8), codec name, decoded size (u64)
+CODEC_HEADER_MAGIC = b'DSZ2'
+_DECODED_SIZE = struct.Struct('<Q')
+# enough leading bytes of an object to hold any header
+MAX_HEADER_LENGTH = len(CODEC_HEADER_MAGIC) + 1 + 255 + _DECODED_SIZE.size
+
+DEFAULT_MIN_SIZE = 1024
+
+# extensions of formats that are already compressed
+DEFAULT_SKIP_EXTENSIONS = frozenset({
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.tif', '.tiff',
+    '.gz', '.tgz', '.bz2', '.xz', '.zip', '.zst', '.lz4', '.snappy', '.sz',
+    '.mp3', '.mp4', '.avi', '.mov', '.pdf',
+})
+
+# leading bytes of formats that are already compressed, for objects without a telling extension
+_COMPRESSED_SIGNATURES: Tuple[bytes, ...] = (
+    b'\x89PNG',  # png
+    b'\xff\xd8\xff',  # jpeg
+    b'GIF8',  # gif
+    b'\x1f\x8b',  # gzip
+    b'PK\x03\x04',  # zip
+    b'BZh',  # bz2
+    b'\xfd7zXZ\x00',  # xz
+    b'\x28\xb5\x2f\xfd',  # zstd
+    b'\xff\x06\x00\x00sNaPpY',  # framed snappy
+)
+
+# codec name of content stored as-is behind a header, for content that happens to start with the header magic
+_IDENTITY_CODEC = 'none'
+
+
+def encode_codec_header(codec_name: str, decoded_size: int) -> bytes:
+    name = codec_name.encode('ascii')
+    if len(name) > 255:
+        raise ValueError(f"Codec name is too long: {codec_name}")
+    return CODEC_HEADER_MAGIC + bytes([len(name)]) + name + _DECODED_SIZE.pack(decoded_size)
+
+
+def decode_codec_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """Return the codec name, the header length and the decoded size, or None if the data has no codec header."""
+    if not data.startswith(CODEC_HEADER_MAGIC) or len(data) <= len(CODEC_HEADER_MAGIC):
+        return None
+
+    name_start = len(CODEC_HEADER_MAGIC) + 1
+    name_end = name_start + data[len(CODEC_HEADER_MAGIC)]
+    codec_name = data[name_start:name_end].decode('ascii')
+    header_end = name_end + _DECODED_SIZE.size
+    return codec_name, header_end, _DECODED_SIZE.unpack_from(data, name_end)[0]
+
+
+def is_compressed_format(data: bytes) -> bool:
+    return data.startswith(_COMPRESSED_SIGNATURES)
+
+
+class CompressingStorageHandler(DelegatingStorageHandler):
+    """
+    Transparently compresses objects on upload and decompresses them on download.
+
+    Compressed objects start with a small header that names the codec, so downloads pick the right decompressor
+    (from dstools.compression.registry) regardless of the compressor this handler uploads with, and objects that
+    were stored uncompressed are returned as-is. Content is stored uncompressed when it is smaller than `min_size`,
+    when its path extension or leading bytes show an already-compressed format (png, jpeg, gzip, ...),
+    or when compression does not make it smaller.
+
+    Ranged and streaming reads are served from the whole decompressed object. The header also records the decoded
+    size, so `size` reports the decoded size, consistent with ranged reads, from the first bytes of the object.
+    """
+
+    def __init__(
+            self,
+            handler: StorageHandler,
+            compressor: Compressor,
+            min_size: int = DEFAULT_MIN_SIZE,
+            skip_extensions: FrozenSet[str] = DEFAULT_SKIP_EXTENSIONS
+    ):
+        super().__init__(handler)
+        if not compressor.name:
+            raise ValueError(f"Compressor {type(compressor).__name__} has no codec name, it can't be used for tagging")
+
+        self._compressor = compressor
+        self._header_length = len(encode_codec_header(compressor.name, 0))
+        self._min_size = min_size
+        self._skip_extensions = frozenset(ext.lower() for ext in skip_extensions)
+
+    def _should_compress(self, content: bytes, remote_relative_path: str) -> bool:
+        if len(content) < self._min_size:
+            return False
+
+        if PurePosixPath(remote_relative_path).suffix.lower() in self._skip_extensions:
+            return False
+
+        return not is_compressed_format(content)
+
+    def encode(self, content: bytes, remote_relative_path: str) -> bytes:
+        if content.startswith(CODEC_HEADER_MAGIC):
+            return encode_codec_header(_IDENTITY_CODEC, len(content)) + content
+
+        if not self._should_compress(content, remote_relative_path):
+            return content
+
+        compressed = self._compressor.compress(content)
+        if len(compressed) + self._header_length >= len(content):
+            return content
+
+        return encode_codec_header(self._compressor.name, len(content)) + compressed
+
+    def decode(self, stored: bytes) -> bytes:
+        header = decode_codec_header(stored)
+        if header is None:
+            return stored
+
+        codec_name, header_length, _ = header
+        if codec_name == _IDENTITY_CODEC:
+            return stored[header_length:]
+
+        if codec_name == self._compressor.name:
+            compressor = self._compressor
+        else:
+            compressor = get_compressor(codec_name)
+        return compressor.decompress(stored[header_length:])
+
+    def download(self, remote_relative_path: str) -> bytes:
+        return self.decode(self._handler.download(remote_relative_path))
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        return self._handler.upload(self.encode(compressed_data, remote_relative_path), remote_relative_path)
+
+    def size(self, remote_relative_path: str) -> int:
+        """The decoded size of the object, the one `download` and `download_range` see."""
+        head = self._handler.download_range(remote_relative_path, 0, MAX_HEADER_LENGTH)
+        header = decode_codec_header(head)
+        if header is None:
+            return self._handler.size(remote_relative_path)
+
+        _, _, decoded_size = header
+        return decoded_size
+
+    # the wrapped handler only sees the stored bytes, so reads and writes go through download/upload
+    download_range = StorageHandler.download_range
+    open_read = StorageHandler.open_read
+    iter_download = StorageHandler.iter_download
+    download_to_file = StorageHandler.download_to_file
+    upload_from_stream = StorageHandler.upload_from_stream
+    upload_from_file = StorageHandler.upload_from_file
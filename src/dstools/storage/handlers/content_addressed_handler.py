@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, TypeVar, TYPE_CHECKING
+
+from globalog import LOG
+
+from dstools.storage.handlers.delegating_handler import DelegatingStorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+if TYPE_CHECKING:
+    from dstools.storage.handlers.async_handler import AsyncStorageHandler
+
+DEFAULT_CAS_PREFIX = 'cas'
+
+_T = TypeVar('_T')
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@dataclass
+class DedupStats:
+    uploaded: int = 0
+    skipped: int = 0
+    uploaded_bytes: int = 0
+    skipped_bytes: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ContentAddressedStorageHandler(DelegatingStorageHandler):
+    """
+    Deduplicating storage layer that stores blobs under the sha256 of their content.
+
+    `put`/`put_many` upload content to `<prefix>/<hh>/<sha256><suffix>` and return that path, skipping blobs that
+    already exist. Existence is first checked against a local index of known hashes (kept in memory, and appended
+    to `index_path` if given), and only unknown hashes are checked remotely, in parallel.
+    `put_many_async` does the same from async code, with every remote call on the bounded executor of an
+    AsyncStorageHandler instead of threads of its own.
+    The index assumes stored blobs are never deleted; remove the index file if they are.
+
+    All other operations (including plain `upload`/`download` by path) are forwarded to the wrapped handler.
+    """
+
+    def __init__(
+            self,
+            handler: StorageHandler,
+            prefix: str = DEFAULT_CAS_PREFIX,
+            index_path: Optional[str | Path] = None,
+            max_workers: int = 16,
+            executor: Optional[ThreadPoolExecutor] = None
+    ):
+        """
+        executor: (optional) pool shared by the remote checks and uploads of every call, bounding their concurrency
+            across calls; by default each call uses a pool of its own, of `max_workers` threads.
+        """
+        super().__init__(handler)
+        self._prefix = prefix.rstrip('/')
+        self._index_path = Path(index_path).expanduser() if index_path else None
+        self._max_workers = max_workers
+        self._executor = executor
+        self._known_paths: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = DedupStats()
+        if self._index_path is not None and self._index_path.exists():
+            with open(self._index_path) as f:
+                self._known_paths.update(line.strip() for line in f if line.strip())
+            LOG.debug(f"Loaded {len(self._known_paths)} known blobs from {self._index_path}")
+
+    @property
+    def stats(self) -> DedupStats:
+        with self._lock:
+            return DedupStats(**asdict(self._stats))
+
+    def content_path(self, content: bytes, suffix: str = '') -> str:
+        return self.digest_path(content_hash(content), suffix)
+
+    def digest_path(self, digest: str, suffix: str = '') -> str:
+        return f"{self._prefix}/{digest[:2]}/{digest}{suffix}"
+
+    def _remember(self, paths: Iterable[str]):
+        paths = [path for path in paths if path not in self._known_paths]
+        if not paths:
+            return
+
+        with self._lock:
+            self._known_paths.update(paths)
+            if self._index_path is not None:
+                self._index_path.parent.mkdir(parents=True, exist_ok=True)
+                # appends of whole lines keep the index usable when several processes share it
+                with open(self._index_path, 'a') as f:
+                    f.write(''.join(f"{path}\n" for path in paths))
+
+    def _map(self, func: Callable[[str], _T], paths: Sequence[str], thread_name_prefix: str) -> List[_T]:
+        if self._executor is not None:
+            return list(self._executor.map(func, paths))
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=thread_name_prefix) as pool:
+            return list(pool.map(func, paths))
+
+    def exists_many(self, remote_relative_paths: Sequence[str]) -> List[bool]:
+        """Check the existence of multiple objects, using the local index first and parallel remote checks for the rest."""
+        unknown = [path for path in set(remote_relative_paths) if path not in self._known_paths]
+        if unknown:
+            exists = self._map(self._handler.exists, unknown, 'cas-exists')
+            existing = [path for path, path_exists in zip(unknown, exists) if path_exists]
+            self._remember(existing)
+
+        return [path in self._known_paths for path in remote_relative_paths]
+
+    def put(self, content: bytes, suffix: str = '') -> str:
+        """Store the content under its hash (unless it is already stored) and return its path."""
+        return self.put_many([content], [suffix])[0]
+
+    def put_many(self, contents: Sequence[bytes], suffixes: Optional[Sequence[str]] = None) -> List[str]:
+        """Store multiple contents under their hashes and return their paths, in the order of the given contents."""
+        suffixes = suffixes or [''] * len(contents)
+        if len(suffixes) != len(contents):
+            raise ValueError(f"Got {len(suffixes)} suffixes for {len(contents)} contents")
+
+        paths, unique = self._content_paths(contents, suffixes)
+        unique_paths = list(unique)
+        missing = [path for path, exists in zip(unique_paths, self.exists_many(unique_paths)) if not exists]
+        if missing:
+            statuses = self._map(lambda path: self._handler.upload(unique[path], path), missing, 'cas-upload')
+            self._check_uploads(missing, statuses)
+
+        self._record_stats(paths, [len(content) for content in contents], missing)
+        return paths
+
+    async def put_many_async(
+            self,
+            async_storage: 'AsyncStorageHandler',
+            contents: Sequence[bytes],
+            suffixes: Optional[Sequence[str]] = None
+    ) -> List[str]:
+        """`put_many` with every remote check and upload run through `async_storage`, within its concurrency limit."""
+        suffixes = suffixes or [''] * len(contents)
+        if len(suffixes) != len(contents):
+            raise ValueError(f"Got {len(suffixes)} suffixes for {len(contents)} contents")
+
+        paths, unique = self._content_paths(contents, suffixes)
+        unknown = [path for path in unique if path not in self._known_paths]
+        exists = await asyncio.gather(*(async_storage.run(self._handler.exists, path) for path in unknown))
+        self._remember([path for path, path_exists in zip(unknown, exists) if path_exists])
+
+        missing = [path for path in unique if path not in self._known_paths]
+        if missing:
+            statuses = await asyncio.gather(
+                *(async_storage.run(self._handler.upload, unique[path], path) for path in missing)
+            )
+            self._check_uploads(missing, statuses)
+
+        self._record_stats(paths, [len(content) for content in contents], missing)
+        return paths
+
+    def _content_paths(self, contents: Sequence[bytes], suffixes: Sequence[str]):
+        """The path of each content, and the content to upload for each distinct path (its first occurrence)."""
+        paths = [self.content_path(content, suffix) for content, suffix in zip(contents, suffixes)]
+        unique: Dict[str, bytes] = {}
+        for path, content in zip(paths, contents):
+            unique.setdefault(path, content)
+        return paths, unique
+
+    def _check_uploads(self, paths: Sequence[str], statuses: Sequence[Optional[bool]]):
+        failed = [path for path, status in zip(paths, statuses) if status is False]
+        if failed:
+            raise IOError(f"Failed to upload {len(failed)} content-addressed blobs, e.g. {failed[0]}")
+        self._remember(paths)
+
+    def put_files(self, local_paths: Sequence[str | Path], digests: Sequence[str], suffix: str = '') -> List[str]:
+        """
+        Store local files under their sha256 digests (computed by the caller, e.g. while building a manifest),
+        streaming the missing ones with `upload_from_file`, and return their paths in the order of the given files.
+        """
+        if len(digests) != len(local_paths):
+            raise ValueError(f"Got {len(digests)} digests for {len(local_paths)} files")
+
+        paths = [self.digest_path(digest, suffix) for digest in digests]
+        unique = {}
+        for path, local_path in zip(paths, local_paths):
+            unique.setdefault(path, local_path)
+
+        unique_paths = list(unique)
+        missing = [path for path, exists in zip(unique_paths, self.exists_many(unique_paths)) if not exists]
+        if missing:
+            statuses = self._map(lambda path: self._handler.upload_from_file(unique[path], path), missing, 'cas-upload')
+            self._check_uploads(missing, statuses)
+
+        self._record_stats(paths, [os.path.getsize(local_path) for local_path in local_paths], missing)
+        return paths
+
+    def _record_stats(self, paths: Sequence[str], sizes: Sequence[int], uploaded: Sequence[str]):
+        uploaded = set(uploaded)
+        with self._lock:
+            for path, size in zip(paths, sizes):
+                if path in uploaded:
+                    # only the first occurrence of a path was uploaded
+                    uploaded.discard(path)
+                    self._stats.uploaded += 1
+                    self._stats.uploaded_bytes += size
+                else:
+                    self._stats.skipped += 1
+                    self._stats.skipped_bytes += size
@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from dstools.storage.handlers.storage_handler import StorageHandler, ObjectInfo, DEFAULT_CHUNK_SIZE
+
+
+class DelegatingStorageHandler(StorageHandler):
+    """
+    Base class for handlers that wrap another StorageHandler.
+    Every operation is forwarded to the wrapped handler; subclasses override only what they change.
+    Handler-specific methods that are not part of the StorageHandler API (e.g. `GCSHandler.list_objects`)
+    are forwarded as well.
+    """
+
+    def __init__(self, handler: StorageHandler):
+        if not isinstance(handler, StorageHandler):
+            raise TypeError("handler must be an instance of StorageHandler")
+        self._handler = handler
+
+    @property
+    def handler(self) -> StorageHandler:
+        return self._handler
+
+    def __getattr__(self, name: str):
+        # only called for attributes not found on the wrapper itself
+        if name == '_handler':
+            raise AttributeError(name)
+        return getattr(self._handler, name)
+
+    @property
+    def supports_ranged_reads(self) -> bool:
+        # wrappers that fall back to the whole-object default (e.g. compression) lose the support of their handler
+        return super().supports_ranged_reads and self._handler.supports_ranged_reads
+
+    def download(self, remote_relative_path: str) -> bytes:
+        return self._handler.download(remote_relative_path)
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        return self._handler.upload(compressed_data, remote_relative_path)
+
+    def exists(self, remote_relative_path: str) -> bool:
+        return self._handler.exists(remote_relative_path)
+
+    def size(self, remote_relative_path: str) -> int:
+        return self._handler.size(remote_relative_path)
+
+    def list_object_info(self, prefix: str) -> Iterator[ObjectInfo]:
+        return self._handler.list_object_info(prefix)
+
+    def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        return self._handler.download_range(remote_relative_path, start, end)
+
+    def open_read(self, remote_relative_path: str) -> BinaryIO:
+        return self._handler.open_read(remote_relative_path)
+
+    def iter_download(self, remote_relative_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        return self._handler.iter_download(remote_relative_path, chunk_size)
+
+    def download_to_file(self, remote_relative_path: str, local_path: str | Path):
+        return self._handler.download_to_file(remote_relative_path, local_path)
+
+    def upload_from_stream(self, stream: BinaryIO, remote_relative_path: str) -> bool:
+        return self._handler.upload_from_stream(stream, remote_relative_path)
+
+    def upload_from_file(self, local_path: str | Path, remote_relative_path: str) -> bool:
+        return self._handler.upload_from_file(local_path, remote_relative_path)
@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import io
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+
+from google.api_core.exceptions import NotFound, RequestRangeNotSatisfiable
+
+from dstools.storage.checksums import crc32c_bytes
+
+
+def _md5(data: bytes) -> str:
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+class FakeBucket:
+    """
+    Offline stand-in for `google.cloud.storage.Bucket`, implementing the subset of the bucket and blob API used by
+    GCSHandler. Objects are kept in memory, or as files under `root_dir` if given.
+
+    Every request sleeps `latency` seconds, plus the transferred size divided by `bandwidth` (bytes per second),
+    to simulate a remote store.
+
+    Example:
+        >>> handler = GCSHandler({"bucket": "fake"}, bucket=FakeBucket(latency=0.02, bandwidth=100 * 1024 ** 2))
+    """
+
+    def __init__(
+            self,
+            root_dir: Optional[str | Path] = None,
+            latency: float = 0.0,
+            bandwidth: Optional[float] = None,
+            name: str = 'fake-bucket'
+    ):
+        self.name = name
+        self._root = Path(root_dir).expanduser() if root_dir else None
+        self._latency = latency
+        self._bandwidth = bandwidth
+        self._objects: Dict[str, Tuple[bytes, int]] = {}
+        self._next_generation = 1
+        self._lock = threading.Lock()
+        if self._root is not None:
+            self._root.mkdir(parents=True, exist_ok=True)
+
+    def _simulate_request(self, n_bytes: int = 0):
+        delay = self._latency
+        if self._bandwidth:
+            delay += n_bytes / self._bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    def _read(self, name: str, generation: Optional[int] = None) -> Tuple[bytes, int]:
+        if self._root is not None:
+            path = self._root / name
+            try:
+                data = path.read_bytes()
+                current_generation = path.stat().st_mtime_ns
+            except FileNotFoundError:
+                raise NotFound(f"No such object: {self.name}/{name}")
+        else:
+            with self._lock:
+                if name not in self._objects:
+                    raise NotFound(f"No such object: {self.name}/{name}")
+                data, current_generation = self._objects[name]
+
+        if generation is not None and generation != current_generation:
+            raise NotFound(f"No such object: {self.name}/{name}#{generation}")
+        return data, current_generation
+
+    def _write(self, name: str, data: bytes) -> int:
+        if self._root is not None:
+            path = self._root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+            return path.stat().st_mtime_ns
+
+        with self._lock:
+            generation = self._next_generation
+            self._next_generation += 1
+            self._objects[name] = (bytes(data), generation)
+        return generation
+
+    def _delete(self, name: str):
+        if self._root is not None:
+            try:
+                (self._root / name).unlink()
+            except FileNotFoundError:
+                raise NotFound(f"No such object: {self.name}/{name}")
+            return
+
+        with self._lock:
+            if self._objects.pop(name, None) is None:
+                raise NotFound(f"No such object: {self.name}/{name}")
+
+    def _names(self, prefix: str) -> Iterable[str]:
+        if self._root is not None:
+            names = (
+                path.relative_to(self._root).as_posix()
+                for path in self._root.rglob('*')
+                if path.is_file() and not path.name.endswith('.tmp')
+            )
+        else:
+            with self._lock:
+                names = list(self._objects)
+
+        return sorted(name for name in names if name.startswith(prefix))
+
+    def blob(self, blob_name: str, generation: Optional[int] = None) -> 'FakeBlob':
+        return FakeBlob(self, blob_name, generation)
+
+    def get_blob(self, blob_name: str, generation: Optional[int] = None, timeout=None) -> Optional['FakeBlob']:
+        self._simulate_request()
+        try:
+            data, generation = self._read(blob_name, generation)
+        except NotFound:
+            return None
+
+        blob = FakeBlob(self, blob_name, generation)
+        blob._set_properties(data, generation)
+        return blob
+
+    def list_blobs(self, prefix: Optional[str] = None, timeout=None) -> Iterator['FakeBlob']:
+        self._simulate_request()
+        for name in self._names(prefix or ''):
+            try:
+                data, generation = self._read(name)
+            except NotFound:
+                continue
+
+            blob = FakeBlob(self, name, generation)
+            blob._set_properties(data, generation)
+            yield blob
+
+    def delete_blobs(self, blobs: Iterable['FakeBlob'], on_error=None, timeout=None):
+        for blob in blobs:
+            self._simulate_request()
+            try:
+                self._delete(blob.name)
+            except NotFound:
+                if on_error is None:
+                    raise
+                on_error(blob)
+
+
+class FakeBlob:
+    """Blob of a FakeBucket. Reads pinned to a generation fail with NotFound once the object is overwritten."""
+
+    def __init__(self, bucket: FakeBucket, name: str, generation: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        self.generation = generation
+        self.size: Optional[int] = None
+        self.crc32c: Optional[str] = None
+        self.md5_hash: Optional[str] = None
+
+    def _set_properties(self, data: bytes, generation: int):
+        self.generation = generation
+        self.size = len(data)
+        self.crc32c = crc32c_bytes(data)
+        self.md5_hash = _md5(data)
+
+    def _upload(self, data: bytes):
+        self.bucket._simulate_request(len(data))
+        self._set_properties(data, self.bucket._write(self.name, data))
+
+    def exists(self, timeout=None) -> bool:
+        self.bucket._simulate_request()
+        try:
+            self.bucket._read(self.name, self.generation)
+        except NotFound:
+            return False
+        return True
+
+    def reload(self, timeout=None):
+        self.bucket._simulate_request()
+        data, generation = self.bucket._read(self.name, self.generation)
+        self._set_properties(data, generation)
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, timeout=None) -> bytes:
+        data, generation = self.bucket._read(self.name, self.generation)
+        if start is not None and start >= len(data) > 0:
+            # like GCS, a range starting past the end of a non-empty object is an error, not an empty read
+            self.bucket._simulate_request()
+            raise RequestRangeNotSatisfiable(f"Range start {start} is past the end of {self.name} ({len(data)} bytes)")
+
+        # like GCS, `end` is inclusive
+        content = data[start or 0:None if end is None else end + 1]
+        self.bucket._simulate_request(len(content))
+        self.generation = generation
+        return content
+
+    def download_to_filename(self, filename: str, timeout=None):
+        with open(filename, 'wb') as f:
+            f.write(self.download_as_bytes())
+
+    def open(self, mode: str = 'rb', chunk_size: Optional[int] = None, timeout=None) -> BinaryIO:
+        if mode != 'rb':
+            raise ValueError(f"FakeBlob only supports opening for reading, got mode={mode!r}")
+        return io.BytesIO(self.download_as_bytes())
+
+    def upload_from_string(self, data: bytes, timeout=None):
+        self._upload(bytes(data))
+
+    def upload_from_file(self, file_obj: BinaryIO, size: Optional[int] = None, timeout=None):
+        self._upload(file_obj.read() if size is None else file_obj.read(size))
+
+    def upload_from_filename(self, filename: str, timeout=None):
+        with open(filename, 'rb') as f:
+            self._upload(f.read())
+
+    def compose(self, sources: Iterable['FakeBlob'], timeout=None):
+        # composing happens on the server side, so it costs a request but no transfer
+        self.bucket._simulate_request()
+        data = b''.join(self.bucket._read(source.name)[0] for source in sources)
+        self._set_properties(data, self.bucket._write(self.name, data))
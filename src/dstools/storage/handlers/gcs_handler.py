@@ -1,29 +1,233 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, Iterator
+from dataclasses import dataclass, asdict
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 
+from google.api_core.exceptions import RequestRangeNotSatisfiable
+from google.auth.transport.requests import AuthorizedSession
 from google.cloud import storage
-from google.cloud.storage import Blob
+from google.cloud.storage import Blob, Bucket
+from google.oauth2 import service_account
 from globalog import LOG
+from requests.adapters import HTTPAdapter
 
 
-from dstools.storage.handlers.storage_handler import StorageHandler
+from dstools.storage.checksums import crc32c_bytes, crc32c_file
+from dstools.storage.handlers.storage_handler import StorageHandler, ObjectInfo, DEFAULT_CHUNK_SIZE, check_range
+
+
+DEFAULT_PARALLEL_THRESHOLD = 256 * 1024 * 1024
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+
+_Timeout = Union[float, Tuple[float, float]]
+
+# GCS allows composing at most 32 source objects in a single request
+_MAX_COMPOSE_SOURCES = 32
+_PARTS_SUFFIX = '.__parts__'
 
 
 def get_src_root() -> Path:
     return Path(__file__).parent
 
 
+def _split_ranges(start: int, size: int, part_size: int) -> List[Tuple[int, int]]:
+    return [(offset, min(offset + part_size, size)) for offset in range(start, size, part_size)]
+
+
+def _check_crc32c(blob: Blob, crc32c: str):
+    """Raise if the content assembled from ranged reads doesn't match the checksum of the object."""
+    if blob.crc32c is not None and crc32c != blob.crc32c:
+        raise IOError(f"Checksum mismatch downloading {blob.name}: crc32c {crc32c}, expected {blob.crc32c}")
+
+
+@dataclass
+class ConnectionStats:
+    clients: int = 0
+    pool_size: int = 0
+    requests: int = 0
+    connections_opened: int = 0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Fraction of requests that were served on an already open connection."""
+        if not self.requests:
+            return 0.0
+        return max(self.requests - self.connections_opened, 0) / self.requests
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), 'reuse_ratio': self.reuse_ratio}
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests, and reads the number of opened connections from its urllib3 pools."""
+
+    def __init__(self, pool_size: int):
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._requests = 0
+        self._counter_lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._counter_lock:
+            self._requests += 1
+        return super().send(request, **kwargs)
+
+    @property
+    def requests_count(self) -> int:
+        return self._requests
+
+    @property
+    def connections_opened(self) -> int:
+        pools = self.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+
 class GCSHandler(StorageHandler):
-    def __init__(self, storage_config: dict[str, str]):
-        self._bucket_name = storage_config["bucket"]
-        credentials_path = str(storage_config["credentials_path"])
-        self._client = storage.Client.from_service_account_json(credentials_path)
-        self._bucket = self._client.get_bucket(self._bucket_name)
+    """
+    Storage handler for a Google Cloud Storage bucket.
+
+    Large objects are transferred in parts: payloads of at least `parallel_threshold` bytes are uploaded as
+    `part_size` parts in parallel and composed into the target object, and downloaded with parallel ranged reads
+    into a preallocated buffer or file. Set `parallel_threshold` to 0 in the storage config to disable it.
+
+    storage_config keys:
+        bucket: bucket name
+        credentials_path: path to a service account json
+        parallel_threshold: (optional) minimal object size in bytes for parallel transfers
+        part_size: (optional) size in bytes of each part of a parallel transfer
+        max_workers: (optional) number of threads used by a single parallel transfer
+        pool_size: (optional) maximal number of pooled HTTP connections per client
+        timeout: (optional) request timeout in seconds, or a [connect, read] pair
+        client_per_thread: (optional) create a separate client, and connection pool, for each thread
+
+    The client and bucket are created lazily on first use, so constructing a handler does no network I/O.
+    The connection pool should be at least as large as the number of threads using the handler concurrently
+    (e.g. the `max_concurrency` of an AsyncStorageHandler), otherwise connections are discarded and reopened.
+    """
+
+    def __init__(self, storage_config: dict, bucket: Optional[Bucket] = None):
+        """
+        bucket: (optional) a ready bucket object to use instead of connecting with the configured credentials,
+            e.g. a FakeBucket for offline tests and benchmarks.
+        """
+        self._bucket_name = storage_config["bucket"] if bucket is None else bucket.name
+        self._credentials_path = None if bucket is not None else str(storage_config["credentials_path"])
+        self._client: Optional[storage.Client] = None
+        self._bucket_instance: Optional[Bucket] = bucket
+        self._init_lock = threading.Lock()
+        self._pool_size = int(storage_config.get("pool_size", DEFAULT_POOL_SIZE))
+        timeout = storage_config.get("timeout", DEFAULT_TIMEOUT)
+        self._timeout: _Timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) else float(timeout)
+        self._client_per_thread = bool(storage_config.get("client_per_thread", False)) and bucket is None
+        self._thread_local = threading.local()
+        self._adapters: List[_CountingHTTPAdapter] = []
+        self._adapters_lock = threading.Lock()
+        self._parallel_threshold = int(storage_config.get("parallel_threshold", DEFAULT_PARALLEL_THRESHOLD))
+        self._part_size = int(storage_config.get("part_size", DEFAULT_PART_SIZE))
+        self._max_workers = int(storage_config.get("max_workers", DEFAULT_MAX_WORKERS))
+        if self._part_size <= 0:
+            raise ValueError(f"part_size must be a positive integer, got {self._part_size}")
+
+    def _create_client(self) -> storage.Client:
+        LOG.debug(f"Create GCS client for bucket {self._bucket_name} with a pool of {self._pool_size} connections")
+        credentials = service_account.Credentials.from_service_account_file(
+            self._credentials_path,
+            scopes=storage.Client.SCOPE
+        )
+        session = AuthorizedSession(credentials)
+        adapter = _CountingHTTPAdapter(self._pool_size)
+        session.mount('https://', adapter)
+        with self._adapters_lock:
+            self._adapters.append(adapter)
+
+        return storage.Client(project=credentials.project_id, credentials=credentials, _http=session)
+
+    @property
+    def _bucket(self) -> Bucket:
+        if self._client_per_thread:
+            bucket = getattr(self._thread_local, 'bucket', None)
+            if bucket is None:
+                bucket = self._create_client().bucket(self._bucket_name)
+                self._thread_local.bucket = bucket
+            return bucket
+
+        if self._bucket_instance is None:
+            with self._init_lock:
+                if self._bucket_instance is None:
+                    self._client = self._create_client()
+                    # unlike `get_bucket`, this does not make a request
+                    self._bucket_instance = self._client.bucket(self._bucket_name)
+
+        return self._bucket_instance
+
+    def connection_stats(self) -> ConnectionStats:
+        """Connection reuse stats over all clients of this handler."""
+        with self._adapters_lock:
+            adapters = list(self._adapters)
+
+        return ConnectionStats(
+            clients=len(adapters),
+            pool_size=self._pool_size,
+            requests=sum(adapter.requests_count for adapter in adapters),
+            connections_opened=sum(adapter.connections_opened for adapter in adapters)
+        )
+
+    def _is_large(self, size: int) -> bool:
+        return 0 < self._parallel_threshold <= size
 
     def download(self, remote_relative_path: str) -> bytes:
-        blob = self._bucket.blob(remote_relative_path)
         LOG.debug(f"Download from {remote_relative_path}")
-        content = blob.download_as_bytes()
+        if self._parallel_threshold <= 0:
+            content = self._bucket.blob(remote_relative_path).download_as_bytes(timeout=self._timeout)
+        else:
+            content = self._download_maybe_parallel(remote_relative_path)
+        LOG.debug(f"Downloaded {len(content)} bytes from GCS at {remote_relative_path}.")
+        return content
+
+    def _download_maybe_parallel(self, remote_relative_path: str) -> bytes:
+        # the metadata gives the size, and pins the generation so every part is read from the same version
+        blob = self._bucket.get_blob(remote_relative_path, timeout=self._timeout)
+        if blob is None or not self._is_large(blob.size):
+            # a whole-object read, which the client validates against the object's checksum
+            # (or raises its usual NotFound error)
+            return (blob or self._bucket.blob(remote_relative_path)).download_as_bytes(timeout=self._timeout)
+
+        LOG.debug(f"Download {blob.size} bytes from {blob.name} in parallel parts of {self._part_size} bytes")
+        buffer = bytearray(blob.size)
+        view = memoryview(buffer)
+
+        def download_part(part_range: Tuple[int, int]):
+            start, end = part_range
+            view[start:end] = blob.download_as_bytes(start=start, end=end - 1, timeout=self._timeout)
+
+        self._run_parallel(download_part, _split_ranges(0, blob.size, self._part_size))
+        # the client doesn't validate partial responses, so the assembled object is checked here
+        content = bytes(buffer)
+        _check_crc32c(blob, crc32c_bytes(content))
+        return content
+
+    def _run_parallel(self, func, items: Iterable):
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='gcs-parts') as pool:
+            # consume the results to propagate the first exception
+            list(pool.map(func, items))
+
+    def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        check_range(start, end)
+        if end is not None and end <= start:
+            return b''
+
+        blob = self._bucket.blob(remote_relative_path)
+        LOG.debug(f"Download range [{start}, {end}) from {remote_relative_path}")
+        try:
+            # GCS ranges are inclusive on both ends
+            content = blob.download_as_bytes(start=start, end=None if end is None else end - 1, timeout=self._timeout)
+        except RequestRangeNotSatisfiable:
+            # like a python slice, a range past the end of the object is empty
+            content = b''
         LOG.debug(f"Downloaded {len(content)} bytes from GCS at {remote_relative_path}.")
         return content
 
@@ -31,7 +235,13 @@ class GCSHandler(StorageHandler):
         try:
             blob = self._bucket.blob(remote_relative_path)
             LOG.debug(f"Upload {len(content)} bytes to GCS at {remote_relative_path}")
-            blob.upload_from_string(content)
+            if self._is_large(len(content)):
+                def upload_part(part_blob: Blob, start: int, end: int):
+                    part_blob.upload_from_string(content[start:end], timeout=self._timeout)
+
+                self._upload_composite(remote_relative_path, len(content), upload_part)
+            else:
+                blob.upload_from_string(content, timeout=self._timeout)
             LOG.debug(f"Uploaded {remote_relative_path} to GCS.")
         except Exception as e:
             LOG.error(f"Failed to upload {remote_relative_path} to GCS.", exc_info=e)
@@ -39,17 +249,141 @@ class GCSHandler(StorageHandler):
 
         return True
 
+    def open_read(self, remote_relative_path: str) -> BinaryIO:
+        blob = self._bucket.blob(remote_relative_path)
+        return blob.open('rb', chunk_size=DEFAULT_CHUNK_SIZE, timeout=self._timeout)
+
+    def iter_download(self, remote_relative_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        blob = self._bucket.blob(remote_relative_path)
+        with blob.open('rb', chunk_size=chunk_size, timeout=self._timeout) as stream:
+            chunk = stream.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = stream.read(chunk_size)
+
+    def download_to_file(self, remote_relative_path: str, local_path: str | Path):
+        LOG.debug(f"Download from {remote_relative_path} to {local_path}")
+        if self._parallel_threshold <= 0:
+            self._bucket.blob(remote_relative_path).download_to_filename(str(local_path), timeout=self._timeout)
+        else:
+            self._download_to_file_maybe_parallel(remote_relative_path, local_path)
+        LOG.debug(f"Downloaded {remote_relative_path} from GCS to {local_path}.")
+
+    def _download_to_file_maybe_parallel(self, remote_relative_path: str, local_path: str | Path):
+        blob = self._bucket.get_blob(remote_relative_path, timeout=self._timeout)
+        if blob is None:
+            # let the client raise its usual NotFound error
+            self._bucket.blob(remote_relative_path).download_to_filename(str(local_path), timeout=self._timeout)
+            return
+
+        if not self._is_large(blob.size):
+            blob.download_to_filename(str(local_path), timeout=self._timeout)
+            return
+
+        LOG.debug(f"Download {blob.size} bytes from {remote_relative_path} in parallel parts of {self._part_size} bytes")
+        with open(local_path, 'wb') as f:
+            f.truncate(blob.size)
+            fd = f.fileno()
+
+            def download_part(part_range: Tuple[int, int]):
+                start, end = part_range
+                os.pwrite(fd, blob.download_as_bytes(start=start, end=end - 1, timeout=self._timeout), start)
+
+            self._run_parallel(download_part, _split_ranges(0, blob.size, self._part_size))
+        _check_crc32c(blob, crc32c_file(local_path))
+
+    def _upload_composite(self, remote_relative_path: str, size: int, upload_part):
+        """
+        Upload `size` bytes as parallel parts and compose them into the target object.
+        `upload_part(part_blob, start, end)` uploads the bytes in [start, end) to the given part blob.
+        """
+        ranges = _split_ranges(0, size, self._part_size)
+        LOG.debug(f"Upload {size} bytes to {remote_relative_path} in {len(ranges)} parallel parts")
+        part_prefix = f"{remote_relative_path}{_PARTS_SUFFIX}"
+        part_blobs = [self._bucket.blob(f"{part_prefix}/{i:05d}") for i in range(len(ranges))]
+        temporary_blobs = list(part_blobs)
+        try:
+            self._run_parallel(
+                lambda part: upload_part(part[0], *part[1]),
+                zip(part_blobs, ranges)
+            )
+
+            # compose in levels of at most 32 sources until a single compose into the target is possible
+            sources = part_blobs
+            level = 0
+            while len(sources) > _MAX_COMPOSE_SOURCES:
+                groups = [sources[i:i + _MAX_COMPOSE_SOURCES] for i in range(0, len(sources), _MAX_COMPOSE_SOURCES)]
+                composed = [self._bucket.blob(f"{part_prefix}/c{level}-{i:05d}") for i in range(len(groups))]
+                temporary_blobs.extend(composed)
+                self._run_parallel(
+                    lambda group: group[0].compose(group[1], timeout=self._timeout),
+                    zip(composed, groups)
+                )
+                sources = composed
+                level += 1
+
+            self._bucket.blob(remote_relative_path).compose(sources, timeout=self._timeout)
+        finally:
+            self._bucket.delete_blobs(temporary_blobs, on_error=lambda blob: None, timeout=self._timeout)
+
+    def upload_from_stream(self, stream: BinaryIO, remote_relative_path: str) -> bool:
+        try:
+            blob = self._bucket.blob(remote_relative_path)
+            LOG.debug(f"Upload stream to GCS at {remote_relative_path}")
+            blob.upload_from_file(stream, timeout=self._timeout)
+            LOG.debug(f"Uploaded {remote_relative_path} to GCS.")
+        except Exception as e:
+            LOG.error(f"Failed to upload {remote_relative_path} to GCS.", exc_info=e)
+            return False
+
+        return True
+
+    def upload_from_file(self, local_path: str | Path, remote_relative_path: str) -> bool:
+        try:
+            blob = self._bucket.blob(remote_relative_path)
+            LOG.debug(f"Upload {local_path} to GCS at {remote_relative_path}")
+            size = os.path.getsize(local_path)
+            if self._is_large(size):
+                self._upload_composite(remote_relative_path, size, self._file_part_uploader(local_path))
+            else:
+                blob.upload_from_filename(str(local_path), timeout=self._timeout)
+            LOG.debug(f"Uploaded {remote_relative_path} to GCS.")
+        except Exception as e:
+            LOG.error(f"Failed to upload {remote_relative_path} to GCS.", exc_info=e)
+            return False
+
+        return True
+
+    def _file_part_uploader(self, local_path: str | Path):
+        def upload_part(part_blob: Blob, start: int, end: int):
+            with open(local_path, 'rb') as f:
+                f.seek(start)
+                part_blob.upload_from_file(f, size=end - start, timeout=self._timeout)
+
+        return upload_part
+
     def exists(self, remote_relative_path: str) -> bool:
         """Check if the resource exists in GCS without downloading the full content."""
         blob = self._bucket.blob(remote_relative_path)
-        return blob.exists()
+        return blob.exists(timeout=self._timeout)
 
     def size(self, remote_relative_path: str) -> int:
-        blob = self._bucket.get_blob(remote_relative_path)
+        blob = self._bucket.get_blob(remote_relative_path, timeout=self._timeout)
         return blob.size
 
     def list_objects(self, prefix: str) -> Iterator[Blob]:
-        yield from self._bucket.list_blobs(prefix=prefix)
+        yield from self._bucket.list_blobs(prefix=prefix, timeout=self._timeout)
+
+    def list_object_info(self, prefix: str) -> Iterator[ObjectInfo]:
+        for blob in self.list_objects(prefix):
+            updated = getattr(blob, 'updated', None)
+            yield ObjectInfo(
+                path=blob.name,
+                size=blob.size,
+                crc32c=blob.crc32c,
+                md5=blob.md5_hash,
+                updated=updated.timestamp() if updated else None
+            )
 
 if __name__ == '__main__':
     config = get_gcs_config()
@@ -0,0 +1,274 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+from globalog import LOG
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+
+from dstools.storage.handlers.async_handler import AsyncStorageHandler, DEFAULT_MAX_CONCURRENCY
+from dstools.storage.handlers.instrumented_handler import StorageMetrics, track_optional
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+try:
+    from google.api_core import exceptions as gcp_exceptions
+    _GCP_TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+        gcp_exceptions.TooManyRequests,
+        gcp_exceptions.InternalServerError,
+        gcp_exceptions.BadGateway,
+        gcp_exceptions.ServiceUnavailable,
+        gcp_exceptions.GatewayTimeout,
+    )
+except ImportError:
+    _GCP_TRANSIENT_ERRORS = ()
+
+_T = TypeVar('_T')
+
+TRANSIENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    ConnectionError,
+    TimeoutError,
+    RequestsConnectionError,
+    RequestsTimeout,
+    *_GCP_TRANSIENT_ERRORS
+)
+
+# while too few latencies were measured to compute the hedge threshold, pending calls re-check it at this interval
+_THRESHOLD_RECHECK_SECONDS = 0.01
+
+
+class LatencyTracker:
+    """Sliding window of the most recent call latencies (in seconds)."""
+
+    def __init__(self, window: int = 1000):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Return the q-th quantile (0 <= q <= 1) of the recorded latencies, or None if nothing was recorded."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+        if not latencies:
+            return None
+
+        index = min(int(q * len(latencies)), len(latencies) - 1)
+        return latencies[index]
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    retries: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class HedgedAsyncStorageHandler(AsyncStorageHandler):
+    """
+    AsyncStorageHandler that reduces tail latency of downloads.
+
+    Hedging: if a download takes longer than the `hedge_percentile` of the recent latencies of the same operation
+    (`download` and `download_range` are tracked separately), a duplicate request is fired and whichever finishes
+    first is used. The threshold is read when the hedge timer fires, so calls started before `min_samples` latencies
+    were measured are hedged too once it is known. The number of hedges is capped at `max_hedge_ratio` of all
+    downloads, and hedges run on their own `max_hedge_concurrency` threads rather than queueing behind the primary
+    calls they are meant to bypass; a hedge is skipped when all of them are busy.
+
+    Retries: downloads that fail with a transient error are retried up to `max_retries` times,
+    with exponential backoff and full jitter.
+
+    Only reads are hedged and retried; uploads behave as in AsyncStorageHandler.
+    """
+
+    def __init__(
+            self,
+            handler: StorageHandler,
+            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+            executor: Optional[ThreadPoolExecutor] = None,
+            hedge_percentile: float = 0.95,
+            min_samples: int = 20,
+            max_hedge_ratio: float = 0.1,
+            latency_window: int = 1000,
+            max_retries: int = 3,
+            retry_base_delay: float = 0.1,
+            retry_max_delay: float = 5.0,
+            transient_errors: Tuple[Type[BaseException], ...] = TRANSIENT_ERRORS,
+            metrics: Optional[StorageMetrics] = None,
+            max_hedge_concurrency: Optional[int] = None
+    ):
+        super().__init__(handler, max_concurrency=max_concurrency, executor=executor, metrics=metrics)
+        if not 0 < hedge_percentile < 1:
+            raise ValueError(f"hedge_percentile must be in (0, 1), got {hedge_percentile}")
+        if max_hedge_concurrency is None:
+            max_hedge_concurrency = max(1, max_concurrency // 4)
+        if max_hedge_concurrency < 1:
+            raise ValueError(f"max_hedge_concurrency must be a positive integer, got {max_hedge_concurrency}")
+
+        self._hedge_percentile = hedge_percentile
+        self._min_samples = min_samples
+        self._max_hedge_ratio = max_hedge_ratio
+        self._max_retries = max_retries
+        self._retry_base_delay = retry_base_delay
+        self._retry_max_delay = retry_max_delay
+        self._transient_errors = transient_errors
+        self._latency_trackers = {
+            operation: LatencyTracker(latency_window) for operation in ('download', 'download_range')
+        }
+        self._max_hedge_concurrency = max_hedge_concurrency
+        self._hedge_executor = ThreadPoolExecutor(max_workers=max_hedge_concurrency, thread_name_prefix='async-hedge')
+        self._hedge_semaphores = weakref.WeakKeyDictionary()
+        self._stats = HedgeStats()
+
+    @property
+    def stats(self) -> HedgeStats:
+        return HedgeStats(**asdict(self._stats))
+
+    @property
+    def latencies(self) -> LatencyTracker:
+        """Latencies of whole-object downloads, see `latency_tracker` for the other operations."""
+        return self._latency_trackers['download']
+
+    def latency_tracker(self, operation: str) -> LatencyTracker:
+        """Latencies of an operation: 'download' or 'download_range'."""
+        tracker = self._latency_trackers.get(operation)
+        if tracker is None:
+            raise ValueError(f"Unknown operation: {operation}. Expected one of {sorted(self._latency_trackers)}")
+        return tracker
+
+    def hedge_threshold(self, operation: str = 'download') -> Optional[float]:
+        """The latency (in seconds) after which a duplicate request is fired, or None while there are too few samples."""
+        tracker = self.latency_tracker(operation)
+        if len(tracker) < self._min_samples:
+            return None
+        return tracker.percentile(self._hedge_percentile)
+
+    def _can_hedge(self) -> bool:
+        return self._stats.hedges < self._max_hedge_ratio * self._stats.requests
+
+    def _hedge_semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        with self._semaphores_lock:
+            semaphore = self._hedge_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._hedge_semaphores[loop] = asyncio.Semaphore(self._max_hedge_concurrency)
+            return semaphore
+
+    async def _run_hedge(self, func: Callable[[], _T]) -> _T:
+        """Run a hedge call on the hedge executor, within the hedge concurrency budget."""
+        return await self._run_in_slot(self._hedge_semaphore(asyncio.get_running_loop()), self._hedge_executor, func)
+
+    async def _timed(
+            self,
+            operation: str,
+            func: Callable[..., _T],
+            *args,
+            started: Optional[asyncio.Event] = None,
+            hedge: bool = False
+    ) -> _T:
+        """Run the call on the executor and record its latency, excluding the time spent waiting for a slot."""
+        loop = asyncio.get_running_loop()
+        tracker = self.latency_tracker(operation)
+
+        def timed_call() -> _T:
+            if started is not None:
+                loop.call_soon_threadsafe(started.set)
+            start = time.perf_counter()
+            result = func(*args)
+            tracker.record(time.perf_counter() - start)
+            return result
+
+        return await (self._run_hedge(timed_call) if hedge else self.run(timed_call))
+
+    async def _hedged(self, operation: str, func: Callable[..., _T], *args) -> _T:
+        self._stats.requests += 1
+        loop = asyncio.get_running_loop()
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(self._timed(operation, func, *args, started=started))
+        # the hedge timer starts once the primary call leaves the queue
+        started_waiter = asyncio.ensure_future(started.wait())
+        await asyncio.wait({primary, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        started_waiter.cancel()
+        started_at = loop.time()
+
+        while True:
+            # read when the timer fires: the threshold is unknown, or has changed, since the call started
+            threshold = self.hedge_threshold(operation)
+            elapsed = loop.time() - started_at
+            if threshold is not None and elapsed >= threshold:
+                break
+
+            timeout = _THRESHOLD_RECHECK_SECONDS if threshold is None else threshold - elapsed
+            done, _ = await asyncio.wait({primary}, timeout=timeout)
+            if done:
+                return await primary
+
+        if not self._can_hedge() or self._hedge_semaphore(loop).locked():
+            return await primary
+
+        self._stats.hedges += 1
+        hedge = asyncio.ensure_future(self._timed(operation, func, *args, hedge=True))
+        pending = {primary, hedge}
+        first_error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._stats.hedge_wins += 1
+                        return task.result()
+                    first_error = first_error or task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise first_error
+
+    async def _with_retries(self, call: Callable[[], Awaitable[_T]]) -> _T:
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except self._transient_errors as e:
+                if attempt >= self._max_retries:
+                    raise
+
+                delay = random.uniform(0, min(self._retry_max_delay, self._retry_base_delay * 2 ** attempt))
+                LOG.debug(f"Transient storage error ({type(e).__name__}), retry {attempt + 1} in {delay:.3f}s")
+                self._stats.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def download(self, remote_relative_path: str) -> bytes:
+        with track_optional(self._metrics, 'async_download') as tracker:
+            content = await self._with_retries(
+                lambda: self._hedged('download', self.handler.download, remote_relative_path)
+            )
+            tracker.add_bytes(len(content))
+        return content
+
+    async def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        with track_optional(self._metrics, 'async_download_range') as tracker:
+            content = await self._with_retries(
+                lambda: self._hedged('download_range', self.handler.download_range, remote_relative_path, start, end)
+            )
+            tracker.add_bytes(len(content))
+        return content
+
+    def close(self, wait: bool = True):
+        super().close(wait)
+        self._hedge_executor.shutdown(wait=wait)
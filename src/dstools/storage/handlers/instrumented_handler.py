@@ -0,0 +1,228 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import BinaryIO, ContextManager, Dict, Iterator, Optional
+
+from dstools.storage.handlers.delegating_handler import DelegatingStorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler, DEFAULT_CHUNK_SIZE
+
+# upper bounds (in seconds) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _OperationMetrics:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a latency quantile as the upper bound of the histogram bucket that contains it."""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'total_seconds': self.total_seconds,
+            'mean_seconds': self.total_seconds / self.count if self.count else None,
+            'max_seconds': self.max_seconds,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99),
+            'in_flight': self.in_flight,
+            'peak_in_flight': self.peak_in_flight,
+            'latency_histogram': {
+                **{f"le_{bound}": n for bound, n in zip(LATENCY_BUCKETS, self.buckets)},
+                'le_inf': self.buckets[-1],
+            },
+        }
+
+
+class OperationTracker:
+    """Handle given by `StorageMetrics.track` to report the bytes moved by the tracked operation."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.failed = False
+
+    def add_bytes(self, n: int):
+        self.bytes += n
+
+    def fail(self):
+        """Count the operation as an error without raising, e.g. an upload that returned False."""
+        self.failed = True
+
+    def add_status(self, status, n_bytes: int):
+        """
+        Record the status returned by an upload: an error if it is False, the bytes otherwise
+        (handlers that return nothing, None, report failures by raising).
+        """
+        if status is False:
+            self.fail()
+        else:
+            self.add_bytes(n_bytes)
+
+
+class StorageMetrics:
+    """
+    Thread-safe per-operation storage metrics: latency histograms, bytes moved, error counts and in-flight gauges.
+    Recording an operation costs a lock and a couple of clock reads, so it is cheap enough to leave on.
+    """
+
+    def __init__(self):
+        self._operations: Dict[str, _OperationMetrics] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+
+    def _operation(self, operation: str) -> _OperationMetrics:
+        metrics = self._operations.get(operation)
+        if metrics is None:
+            metrics = self._operations.setdefault(operation, _OperationMetrics())
+        return metrics
+
+    @contextmanager
+    def track(self, operation: str) -> Iterator[OperationTracker]:
+        """Measure an operation; exceptions, and failures reported with `tracker.fail()`, are counted as errors."""
+        with self._lock:
+            metrics = self._operation(operation)
+            metrics.in_flight += 1
+            metrics.peak_in_flight = max(metrics.peak_in_flight, metrics.in_flight)
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+        tracker = OperationTracker()
+        failed = False
+        start = time.perf_counter()
+        try:
+            yield tracker
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                metrics.in_flight -= 1
+                self._in_flight -= 1
+                metrics.count += 1
+                metrics.errors += failed or tracker.failed
+                metrics.bytes += tracker.bytes
+                metrics.total_seconds += elapsed
+                metrics.max_seconds = max(metrics.max_seconds, elapsed)
+                metrics.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'peak_in_flight': self._peak_in_flight,
+                'operations': {name: metrics.to_dict() for name, metrics in sorted(self._operations.items())},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._peak_in_flight = self._in_flight
+
+    def report(self, filename: str = 'storage_metrics'):
+        """Write a snapshot as json through the global Reporter (no-op unless the reporter is initialized)."""
+        from dstools.reporting.reporter import report, ReportWriter
+
+        @report(filename)
+        def write_snapshot(writer: ReportWriter):
+            writer.write_json(self.snapshot())
+
+        write_snapshot()
+
+
+def track_optional(metrics: Optional[StorageMetrics], operation: str) -> ContextManager[OperationTracker]:
+    """`metrics.track(operation)`, or a no-op tracker when metrics are disabled."""
+    if metrics is None:
+        return nullcontext(OperationTracker())
+    return metrics.track(operation)
+
+
+class InstrumentedStorageHandler(DelegatingStorageHandler):
+    """Records metrics for every operation of the wrapped handler into a StorageMetrics instance."""
+
+    def __init__(self, handler: StorageHandler, metrics: Optional[StorageMetrics] = None):
+        super().__init__(handler)
+        self._metrics = metrics or StorageMetrics()
+
+    @property
+    def metrics(self) -> StorageMetrics:
+        return self._metrics
+
+    def download(self, remote_relative_path: str) -> bytes:
+        with self._metrics.track('download') as tracker:
+            content = self._handler.download(remote_relative_path)
+            tracker.add_bytes(len(content))
+        return content
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        with self._metrics.track('upload') as tracker:
+            status = self._handler.upload(compressed_data, remote_relative_path)
+            tracker.add_status(status, len(compressed_data))
+        return status
+
+    def exists(self, remote_relative_path: str) -> bool:
+        with self._metrics.track('exists'):
+            return self._handler.exists(remote_relative_path)
+
+    def size(self, remote_relative_path: str) -> int:
+        with self._metrics.track('size'):
+            return self._handler.size(remote_relative_path)
+
+    def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        with self._metrics.track('download_range') as tracker:
+            content = self._handler.download_range(remote_relative_path, start, end)
+            tracker.add_bytes(len(content))
+        return content
+
+    def open_read(self, remote_relative_path: str) -> BinaryIO:
+        # only opening is measured, reads from the stream are up to the caller
+        with self._metrics.track('open_read'):
+            return self._handler.open_read(remote_relative_path)
+
+    def iter_download(self, remote_relative_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        with self._metrics.track('iter_download') as tracker:
+            for chunk in self._handler.iter_download(remote_relative_path, chunk_size):
+                tracker.add_bytes(len(chunk))
+                yield chunk
+
+    def download_to_file(self, remote_relative_path: str, local_path: str | Path):
+        with self._metrics.track('download_to_file') as tracker:
+            self._handler.download_to_file(remote_relative_path, local_path)
+            tracker.add_bytes(os.path.getsize(local_path))
+
+    def upload_from_stream(self, stream: BinaryIO, remote_relative_path: str) -> bool:
+        with self._metrics.track('upload_from_stream') as tracker:
+            status = self._handler.upload_from_stream(stream, remote_relative_path)
+            if status is False:
+                tracker.fail()
+        return status
+
+    def upload_from_file(self, local_path: str | Path, remote_relative_path: str) -> bool:
+        with self._metrics.track('upload_from_file') as tracker:
+            status = self._handler.upload_from_file(local_path, remote_relative_path)
+            tracker.add_status(status, os.path.getsize(local_path))
+        return status
@@ -1,16 +1,69 @@
+import shutil
 from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
 
 from dstools.common.io_utils import read_bytes, write_bytes
-from dstools.storage.handlers.storage_handler import StorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler, ObjectInfo, check_range
 
 
 class LocalStorageHandler(StorageHandler):
 
     def __init__(self, root_dir: Path):
-        self._root = root_dir
+        self._root = Path(root_dir)
+
+    def _local_path(self, remote_relative_path: str, create_parent: bool = False) -> Path:
+        path = self._root / remote_relative_path
+        if create_parent:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        return path
 
     def download(self, remote_relative_path: str) -> bytes:
-        return read_bytes(self._root / remote_relative_path)
+        return read_bytes(self._local_path(remote_relative_path))
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        write_bytes(self._local_path(remote_relative_path, create_parent=True), compressed_data)
+        return True
+
+    def exists(self, remote_relative_path: str) -> bool:
+        return self._local_path(remote_relative_path).is_file()
+
+    def size(self, remote_relative_path: str) -> int:
+        return self._local_path(remote_relative_path).stat().st_size
+
+    def list_object_info(self, prefix: str) -> Iterator[ObjectInfo]:
+        # like object storage, the prefix is matched as a string, not as a directory
+        prefix_path = self._root / prefix
+        search_root = prefix_path if prefix.endswith('/') or prefix_path.is_dir() else prefix_path.parent
+        if not search_root.is_dir():
+            return
+
+        for path in sorted(search_root.rglob('*')):
+            remote_relative_path = path.relative_to(self._root).as_posix()
+            if not path.is_file() or not remote_relative_path.startswith(prefix):
+                continue
+
+            stat = path.stat()
+            yield ObjectInfo(path=remote_relative_path, size=stat.st_size, updated=stat.st_mtime)
+
+    def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        check_range(start, end)
+        with open(self._local_path(remote_relative_path), 'rb') as f:
+            f.seek(start)
+            if end is None:
+                return f.read()
+            return f.read(max(end - start, 0))
+
+    def open_read(self, remote_relative_path: str) -> BinaryIO:
+        return open(self._local_path(remote_relative_path), 'rb')
+
+    def download_to_file(self, remote_relative_path: str, local_path: str | Path):
+        shutil.copyfile(self._local_path(remote_relative_path), local_path)
+
+    def upload_from_stream(self, stream: BinaryIO, remote_relative_path: str) -> bool:
+        with open(self._local_path(remote_relative_path, create_parent=True), 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        return True
 
-    def upload(self, compressed_data: bytes, remote_relative_path: str):
-        return write_bytes(self._root / remote_relative_path, compressed_data)
+    def upload_from_file(self, local_path: str | Path, remote_relative_path: str) -> bool:
+        shutil.copyfile(local_path, self._local_path(remote_relative_path, create_parent=True))
+        return True
@@ -1,5 +1,33 @@
+import io
+import json
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+from dstools.common.io_utils import read_bytes, write_bytes
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def check_range(start: int, end: Optional[int]):
+    if start < 0:
+        raise ValueError("'start' must be a non-negative integer")
+
+    if end is not None and end < 0:
+        raise ValueError("'end' must be a non-negative integer, or None to read until the end of the object.")
+
+
+@dataclass(frozen=True)
+class ObjectInfo:
+    """Listing entry of a stored object. Checksums are base64 encoded, as reported by GCS, when available."""
+    path: str
+    size: int
+    crc32c: Optional[str] = None
+    md5: Optional[str] = None
+    updated: Optional[float] = None
+
 
 class StorageHandler(ABC):
     @abstractmethod
@@ -12,10 +40,121 @@ class StorageHandler(ABC):
         """Upload the compressed data to the remote path."""
         raise NotImplementedError()
 
+    def exists(self, remote_relative_path: str) -> bool:
+        """Check if the object exists without downloading its content."""
+        raise NotImplementedError(f"{type(self).__name__} does not support existence checks")
+
+    def size(self, remote_relative_path: str) -> int:
+        """Return the size of the object in bytes."""
+        raise NotImplementedError(f"{type(self).__name__} does not support size queries")
+
+    def list_object_info(self, prefix: str) -> Iterator[ObjectInfo]:
+        """List the objects under the prefix, with their sizes and, where the storage provides them, checksums."""
+        raise NotImplementedError(f"{type(self).__name__} does not support listing objects")
+
+    @property
+    def supports_ranged_reads(self) -> bool:
+        """Whether `download_range` reads only the requested bytes, rather than downloading the whole object."""
+        return type(self).download_range is not StorageHandler.download_range
+
+    def download_range(self, remote_relative_path: str, start: int, end: Optional[int] = None) -> bytes:
+        """
+        Download the bytes in [start, end) of the remote object.
+        `end` is exclusive, like a python slice; None reads until the end of the object.
+        The default implementation downloads the whole object; handlers that support ranged reads should override it.
+        """
+        check_range(start, end)
+        return self.download(remote_relative_path)[start:end]
+
+    # Streaming API. The defaults below fall back to whole-object copies through `download`/`upload`;
+    # handlers with native streaming support should override them.
+
+    def open_read(self, remote_relative_path: str) -> BinaryIO:
+        """Open the remote object as a readable binary stream. The caller is responsible for closing it."""
+        return io.BytesIO(self.download(remote_relative_path))
+
+    def iter_download(self, remote_relative_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the content of the remote object in chunks of up to `chunk_size` bytes."""
+        with self.open_read(remote_relative_path) as stream:
+            chunk = stream.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = stream.read(chunk_size)
+
+    def download_to_file(self, remote_relative_path: str, local_path: str | Path):
+        """Download the remote object into a local file."""
+        write_bytes(local_path, self.download(remote_relative_path))
+
+    def upload_from_stream(self, stream: BinaryIO, remote_relative_path: str) -> bool:
+        """Upload the remaining content of a readable binary stream to the remote path."""
+        return self.upload(stream.read(), remote_relative_path)
+
+    def upload_from_file(self, local_path: str | Path, remote_relative_path: str) -> bool:
+        """Upload a local file to the remote path."""
+        return self.upload(read_bytes(local_path), remote_relative_path)
+
 
 class StorageHandlerFactory:
+    _handlers: Dict[Tuple[str, str], StorageHandler] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(storage_type: str, storage_config: dict) -> Tuple[str, str]:
+        return storage_type.upper(), json.dumps(storage_config, sort_keys=True, default=str)
+
+    @staticmethod
+    def get_handler(storage_type: str, storage_config: dict, shared: bool = True) -> StorageHandler:
+        """
+        Get a storage handler of the given type.
+
+        By default, handlers are shared: calls with the same storage type and an equal config return the same
+        instance, so connections and clients are set up once per process. Pass shared=False for a new instance.
+
+        The storage config may contain a 'compression' section, e.g. {"codec": "zlib:6", "min_size": 1024},
+        in which case objects are transparently compressed, and a 'cache' section,
+        e.g. {"cache_dir": "~/.dono/cache", "max_bytes": 10737418240}, in which case the handler is wrapped with an
+        on-disk read-through cache (of decompressed objects).
+        """
+        if not shared:
+            return StorageHandlerFactory._build_handler(storage_type, storage_config)
+
+        key = StorageHandlerFactory._cache_key(storage_type, storage_config)
+        with StorageHandlerFactory._lock:
+            handler = StorageHandlerFactory._handlers.get(key)
+            if handler is None:
+                handler = StorageHandlerFactory._build_handler(storage_type, storage_config)
+                StorageHandlerFactory._handlers[key] = handler
+
+        return handler
+
+    @staticmethod
+    def clear_cache():
+        """Forget all shared handlers."""
+        with StorageHandlerFactory._lock:
+            StorageHandlerFactory._handlers.clear()
+
     @staticmethod
-    def get_handler(storage_type: str, storage_config: dict) -> StorageHandler:
+    def _build_handler(storage_type: str, storage_config: dict) -> StorageHandler:
+        storage_config = dict(storage_config)
+        cache_config = storage_config.pop('cache', None)
+        compression_config = storage_config.pop('compression', None)
+        handler = StorageHandlerFactory._create_handler(storage_type, storage_config)
+
+        if compression_config:
+            from dstools.compression.registry import get_compressor
+            from dstools.storage.handlers.compressing_handler import CompressingStorageHandler
+            compression_config = dict(compression_config)
+            compressor = get_compressor(compression_config.pop('codec'))
+            handler = CompressingStorageHandler(handler, compressor, **compression_config)
+
+        if cache_config:
+            from dstools.storage.handlers.caching_handler import CachingStorageHandler
+            handler = CachingStorageHandler(handler, **cache_config)
+
+        return handler
+
+    @staticmethod
+    def _create_handler(storage_type: str, storage_config: dict) -> StorageHandler:
         storage_type = storage_type.upper()
         if storage_type == "S3":
             from dstools.storage.handlers.s3_handler import S3StorageHandler
@@ -26,9 +165,20 @@ class StorageHandlerFactory:
         elif storage_type == "SSH":
             from dstools.storage.handlers.ssh_handler import SSHStorageHandler
             return SSHStorageHandler(storage_config)
+        elif storage_type in ("MEMORY", "FAKE"):
+            # a GCSHandler over an offline fake bucket, kept in memory or under 'root_dir'
+            from dstools.storage.handlers.fake_gcs import FakeBucket
+            from dstools.storage.handlers.gcs_handler import GCSHandler
+            bucket = FakeBucket(
+                root_dir=storage_config.get('root_dir'),
+                latency=float(storage_config.get('latency', 0.0)),
+                bandwidth=storage_config.get('bandwidth'),
+                name=storage_config.get('bucket', 'fake-bucket')
+            )
+            return GCSHandler(storage_config, bucket=bucket)
         elif storage_type == "LOCAL":
             from dstools.storage.handlers.local_handler import LocalStorageHandler
             return LocalStorageHandler(storage_config['root_dir'])
 
         else:
-            raise ValueError(f"Unsupported storage type: {storage_type}")
\ No newline at end of file
+            raise ValueError(f"Unsupported storage type: {storage_type}")
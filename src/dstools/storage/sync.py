@@ -0,0 +1,272 @@
+"""
+Incremental mirroring between a storage prefix and a local directory.
+
+Both directions list the remote prefix once, compare every object by size and checksum (crc32c where the storage
+provides it) against a local manifest, and transfer only new or changed objects, in parallel.
+The manifest (`.dstools-sync-manifest.json` in the local directory by default) records, per relative path, the
+remote fingerprint and the local file's size and mtime, so unchanged local files are not re-hashed. It is saved
+periodically during a sync, so an interrupted sync resumes where it stopped.
+
+A prefix is a directory: `images` covers `images/a.png` but not `images_v2/b.png`.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from globalog import LOG
+
+from dstools.storage.checksums import crc32c_file
+from dstools.storage.handlers.storage_handler import StorageHandler, ObjectInfo
+
+SYNC_MANIFEST_NAME = '.dstools-sync-manifest.json'
+DEFAULT_SYNC_WORKERS = 16
+
+# the manifest is saved during a sync at this interval: each save rewrites all of it, so it isn't done per transfer
+_SAVE_EVERY_SECONDS = 10.0
+
+
+@dataclass
+class SyncResult:
+    transferred: List[str] = field(default_factory=list)
+    skipped: int = 0
+    failed: List[str] = field(default_factory=list)
+    transferred_bytes: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'transferred': len(self.transferred),
+            'skipped': self.skipped,
+            'failed': len(self.failed),
+            'transferred_bytes': self.transferred_bytes,
+            'seconds': self.seconds,
+        }
+
+
+class _SyncManifest:
+    """relative path -> {'size', 'crc32c', 'updated', 'local_size', 'local_mtime_ns'}"""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # serializes the writes, so that a save never replaces the file with an older snapshot
+        self._save_lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        if path.exists():
+            with open(path) as f:
+                self._entries = json.load(f)
+
+    def get(self, relative_path: str) -> Optional[dict]:
+        return self._entries.get(relative_path)
+
+    def set(self, relative_path: str, remote: ObjectInfo, local_file: Path):
+        stat = local_file.stat()
+        with self._lock:
+            self._entries[relative_path] = {
+                'size': remote.size,
+                'crc32c': remote.crc32c,
+                'updated': remote.updated,
+                'local_size': stat.st_size,
+                'local_mtime_ns': stat.st_mtime_ns,
+            }
+            due = time.monotonic() - self._saved_at >= _SAVE_EVERY_SECONDS
+            if due:
+                # claimed here, so the other workers don't save too meanwhile
+                self._saved_at = time.monotonic()
+        if due:
+            self.save()
+
+    def local_file_unchanged(self, relative_path: str, local_file: Path) -> bool:
+        entry = self.get(relative_path)
+        if entry is None:
+            return False
+
+        try:
+            stat = local_file.stat()
+        except FileNotFoundError:
+            return False
+        return stat.st_size == entry['local_size'] and stat.st_mtime_ns == entry['local_mtime_ns']
+
+    def save(self):
+        tmp_path = self._path.with_name(f"{self._path.name}.tmp")
+        with self._save_lock:
+            # the workers only wait for the copy, not for the serialization and the write
+            with self._lock:
+                entries = dict(self._entries)
+                self._saved_at = time.monotonic()
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self._path)
+
+
+def _same_remote(entry: dict, remote: ObjectInfo) -> bool:
+    if entry['size'] != remote.size:
+        return False
+    if remote.crc32c is not None or entry['crc32c'] is not None:
+        return entry['crc32c'] == remote.crc32c
+    return entry['updated'] == remote.updated
+
+
+def _directory_prefix(prefix: str) -> str:
+    """The prefix as a directory: objects are listed under `prefix/`, not under every key starting with `prefix`."""
+    if not prefix or prefix.endswith('/'):
+        return prefix
+    return f"{prefix}/"
+
+
+def _relative_path(remote_path: str, prefix: str) -> Optional[str]:
+    """Path of the object relative to the directory prefix, or None if it is outside of it."""
+    if not remote_path.startswith(prefix):
+        return None
+    return remote_path[len(prefix):].lstrip('/')
+
+
+def sync_down(
+        handler: StorageHandler,
+        prefix: str,
+        local_dir: str | Path,
+        manifest_path: Optional[str | Path] = None,
+        max_workers: int = DEFAULT_SYNC_WORKERS
+) -> SyncResult:
+    """Mirror the objects under `prefix` into `local_dir`, downloading only new or changed objects."""
+    start = time.perf_counter()
+    prefix = _directory_prefix(prefix)
+    local_dir = Path(local_dir)
+    local_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _SyncManifest(Path(manifest_path) if manifest_path else local_dir / SYNC_MANIFEST_NAME)
+    result = SyncResult()
+
+    to_download: List[ObjectInfo] = []
+    for remote in handler.list_object_info(prefix):
+        relative_path = _relative_path(remote.path, prefix)
+        if not relative_path or relative_path.endswith('/'):
+            continue
+
+        entry = manifest.get(relative_path)
+        unchanged = (
+            entry is not None
+            and _same_remote(entry, remote)
+            and manifest.local_file_unchanged(relative_path, local_dir / relative_path)
+        )
+        if unchanged:
+            result.skipped += 1
+        else:
+            to_download.append(remote)
+
+    result_lock = threading.Lock()
+
+    def download(remote: ObjectInfo):
+        relative_path = _relative_path(remote.path, prefix)
+        local_file = local_dir / relative_path
+        local_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = local_file.with_name(f".{local_file.name}.part")
+        try:
+            handler.download_to_file(remote.path, tmp_file)
+            os.replace(tmp_file, local_file)
+        except Exception as e:
+            LOG.error(f"Failed to download {remote.path} to {local_file}", exc_info=e)
+            tmp_file.unlink(missing_ok=True)
+            with result_lock:
+                result.failed.append(remote.path)
+            return
+
+        manifest.set(relative_path, remote, local_file)
+        with result_lock:
+            result.transferred.append(remote.path)
+            result.transferred_bytes += remote.size
+
+    LOG.info(f"Sync {prefix} -> {local_dir}: {len(to_download)} to download, {result.skipped} unchanged")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sync-down') as pool:
+            list(pool.map(download, to_download))
+    finally:
+        manifest.save()
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def sync_up(
+        handler: StorageHandler,
+        local_dir: str | Path,
+        prefix: str,
+        manifest_path: Optional[str | Path] = None,
+        max_workers: int = DEFAULT_SYNC_WORKERS
+) -> SyncResult:
+    """Mirror the files under `local_dir` to `prefix`, uploading only new or changed files."""
+    start = time.perf_counter()
+    prefix = _directory_prefix(prefix)
+    local_dir = Path(local_dir)
+    manifest_path = Path(manifest_path) if manifest_path else local_dir / SYNC_MANIFEST_NAME
+    manifest = _SyncManifest(manifest_path)
+    result = SyncResult()
+
+    remote_objects = {}
+    for info in handler.list_object_info(prefix):
+        relative_path = _relative_path(info.path, prefix)
+        if relative_path:
+            remote_objects[relative_path] = info
+    local_files = [
+        path for path in sorted(local_dir.rglob('*'))
+        if path.is_file() and path != manifest_path and not path.name.endswith('.part')
+    ]
+
+    # checksums hashed while comparing, reused by the uploads
+    local_checksums: Dict[str, str] = {}
+
+    def local_crc32c(relative_path: str, local_file: Path) -> str:
+        entry = manifest.get(relative_path)
+        if entry is not None and entry.get('crc32c') and manifest.local_file_unchanged(relative_path, local_file):
+            return entry['crc32c']
+        crc32c = local_checksums[relative_path] = crc32c_file(local_file)
+        return crc32c
+
+    def needs_upload(local_file: Path) -> bool:
+        relative_path = local_file.relative_to(local_dir).as_posix()
+        remote = remote_objects.get(relative_path)
+        if remote is None or remote.size != local_file.stat().st_size:
+            return True
+
+        if remote.crc32c is not None:
+            return remote.crc32c != local_crc32c(relative_path, local_file)
+
+        # no remote checksum: trust the previous sync if neither the remote size nor the local file changed since
+        entry = manifest.get(relative_path)
+        return not (
+            entry is not None
+            and entry['size'] == remote.size
+            and manifest.local_file_unchanged(relative_path, local_file)
+        )
+
+    result_lock = threading.Lock()
+
+    def upload(local_file: Path):
+        relative_path = local_file.relative_to(local_dir).as_posix()
+        remote_path = f"{prefix}{relative_path}"
+        crc32c = local_checksums.get(relative_path) or crc32c_file(local_file)
+        if handler.upload_from_file(local_file, remote_path) is False:
+            with result_lock:
+                result.failed.append(remote_path)
+            return
+
+        size = local_file.stat().st_size
+        manifest.set(relative_path, ObjectInfo(remote_path, size, crc32c=crc32c), local_file)
+        with result_lock:
+            result.transferred.append(remote_path)
+            result.transferred_bytes += size
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sync-up') as pool:
+            to_upload = [path for path, needed in zip(local_files, pool.map(needs_upload, local_files)) if needed]
+            result.skipped = len(local_files) - len(to_upload)
+            LOG.info(f"Sync {local_dir} -> {prefix}: {len(to_upload)} to upload, {result.skipped} unchanged")
+            list(pool.map(upload, to_upload))
+    finally:
+        manifest.save()
+    result.seconds = time.perf_counter() - start
+    return result
@@ -0,0 +1,53 @@
+import io
+import os
+
+import pytest
+
+from dstools.compression.block_parallel_compressor import BlockParallelCompressor, read_block_index
+from dstools.compression.registry import get_compressor
+from dstools.compression.zlib_compressor import ZlibCompressor
+
+DATA = os.urandom(10_000) + b'text ' * 5000
+
+
+@pytest.mark.parametrize('data', [b'', b'x', DATA], ids=['empty', 'one-byte', 'multi-block'])
+def test_round_trip(data):
+    compressor = BlockParallelCompressor(ZlibCompressor(), block_size=4096, max_workers=3)
+    compressed = compressor.compress(data)
+    assert compressor.decompress(compressed) == data
+
+    stream = io.BytesIO()
+    with compressor.compress_writer(stream) as writer:
+        for i in range(0, len(data), 1000):
+            writer.write(data[i:i + 1000])
+    assert stream.getvalue() == compressed
+
+    stream.seek(0)
+    with compressor.decompress_reader(stream) as reader:
+        assert reader.read() == data
+
+
+def test_index_covers_every_block():
+    compressed = BlockParallelCompressor(ZlibCompressor(), block_size=4096).compress(DATA)
+    codec_name, entries = read_block_index(compressed)
+
+    assert codec_name == 'zlib'
+    assert [entry.size for entry in entries] == [4096] * (len(DATA) // 4096) + [len(DATA) % 4096]
+    assert read_block_index(BlockParallelCompressor().compress(b''))[1] == []
+
+
+def test_decompresses_regardless_of_own_codec():
+    compressed = BlockParallelCompressor(get_compressor('lzma:1'), block_size=4096).compress(DATA)
+    assert BlockParallelCompressor(ZlibCompressor()).decompress(compressed) == DATA
+
+
+def test_truncated_stream_raises():
+    compressed = BlockParallelCompressor(ZlibCompressor(), block_size=4096).compress(DATA)
+    with pytest.raises(ValueError):
+        with BlockParallelCompressor().decompress_reader(io.BytesIO(compressed[:5000])) as reader:
+            reader.read()
+
+
+def test_invalid_block_size():
+    with pytest.raises(ValueError):
+        BlockParallelCompressor(block_size=0)
@@ -0,0 +1,13 @@
+import os
+
+from dstools.compression.codec_benchmark import sample_bytes, sample_path
+
+
+def test_file_sample_matches_sample_of_content(tmp_path):
+    data = os.urandom(100_003)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(data)
+
+    assert sample_path(path, 1600) == sample_bytes(data, 1600)
+    assert sample_path(path, 1000) == sample_bytes(data, 1000)
+    assert sample_path(path, len(data)) == data
@@ -0,0 +1,63 @@
+import io
+import os
+
+import pytest
+
+from dstools.compression.compressor import Compressor
+from dstools.compression.registry import get_compressor
+
+DATA = os.urandom(50_000) + b'text ' * 50_000
+
+
+class _NonStreamingCompressor(Compressor):
+    """Compresses whole buffers only, like codecs without incremental support."""
+
+    def compress(self, data: bytes) -> bytes:
+        return data[::-1]
+
+    def decompress(self, data: bytes) -> bytes:
+        return data[::-1]
+
+
+@pytest.fixture(params=['zlib:1', 'lzma:0', 'snappy', 'non-streaming'])
+def compressor(request) -> Compressor:
+    if request.param == 'non-streaming':
+        return _NonStreamingCompressor()
+    return get_compressor(request.param)
+
+
+def test_compressobj_output_decompresses(compressor):
+    compressobj = compressor.compressobj()
+    if compressobj is None:
+        assert compressor.decompressobj() is None
+        return
+
+    compressed = b''.join(compressobj.compress(DATA[i:i + 7000]) for i in range(0, len(DATA), 7000))
+    compressed += compressobj.flush()
+    decompressobj = compressor.decompressobj()
+    assert b''.join(decompressobj.decompress(compressed[i:i + 999]) for i in range(0, len(compressed), 999)) == DATA
+
+
+@pytest.mark.parametrize('data', [b'', DATA], ids=['empty', 'data'])
+def test_stream_round_trip(compressor, data):
+    compressed = io.BytesIO()
+    compressor.compress_stream(io.BytesIO(data), compressed, chunk_size=4096)
+    assert not compressed.closed
+
+    compressed.seek(0)
+    decompressed = io.BytesIO()
+    compressor.decompress_stream(compressed, decompressed, chunk_size=4096)
+    assert decompressed.getvalue() == data
+
+
+def test_writer_and_reader(compressor):
+    compressed = io.BytesIO()
+    with compressor.compress_writer(compressed) as writer:
+        writer.write(DATA[:100])
+        writer.write(DATA[100:])
+    assert not compressed.closed
+
+    compressed.seek(0)
+    with compressor.decompress_reader(compressed) as reader:
+        assert reader.read(100) == DATA[:100]
+        assert reader.read() == DATA[100:]
@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import struct
+
+import pytest
+
+from dstools.compression import indexed_archive
+from dstools.compression.indexed_archive import IndexedArchiveReader, write_indexed_archive
+from dstools.compression.zlib_compressor import ZlibCompressor
+from dstools.storage.handlers.compressing_handler import CompressingStorageHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'words'
+    (folder / 'sub' / 'empty').mkdir(parents=True)
+    (folder / 'a.txt').write_bytes(b'alpha ' * 1000)
+    (folder / 'sub' / 'b.bin').write_bytes(os.urandom(300_000))
+    (folder / 'sub' / 'c.txt').write_bytes(b'')
+    return folder
+
+
+def archive_bytes(folder, **kwargs) -> bytes:
+    stream = io.BytesIO()
+    write_indexed_archive(folder, stream, ZlibCompressor(), **kwargs)
+    return stream.getvalue()
+
+
+def test_list_and_read(folder):
+    reader = IndexedArchiveReader.from_stream(io.BytesIO(archive_bytes(folder)))
+
+    assert reader.root == 'words'
+    assert [entry.path for entry in reader.entries()] == ['a.txt', 'sub/b.bin', 'sub/c.txt']
+    assert reader.entry('sub/b.bin').size == 300_000
+    for path in ('a.txt', 'sub/b.bin', 'sub/c.txt'):
+        assert reader.read(path) == (folder / path).read_bytes()
+    with pytest.raises(KeyError):
+        reader.entry('missing.txt')
+
+
+def test_extract_single_file_reads_only_its_member(folder, tmp_path):
+    data = archive_bytes(folder)
+    reads = []
+
+    def read_range(start, end):
+        reads.append((start, end))
+        return data[start:end]
+
+    reader = IndexedArchiveReader(read_range, len(data))
+    entry = reader.entry('a.txt')
+    reads.clear()
+
+    target = reader.extract('a.txt', tmp_path / 'out')
+
+    assert target == tmp_path / 'out' / 'words' / 'a.txt'
+    assert target.read_bytes() == (folder / 'a.txt').read_bytes()
+    assert reads == [(entry.offset, entry.offset + entry.compressed_size)]
+
+
+def test_extract_all_from_file(folder, tmp_path, monkeypatch):
+    # reads span several bounded preads
+    monkeypatch.setattr(indexed_archive, '_PREAD_CHUNK_SIZE', 1000)
+    archive_path = tmp_path / 'archive'
+    archive_path.write_bytes(archive_bytes(folder))
+
+    with IndexedArchiveReader.from_file(archive_path) as reader:
+        reader.extract_all(tmp_path / 'out')
+
+    for path in ('a.txt', 'sub/b.bin', 'sub/c.txt'):
+        assert (tmp_path / 'out' / 'words' / path).read_bytes() == (folder / path).read_bytes()
+    assert (tmp_path / 'out' / 'words' / 'sub' / 'empty').is_dir()
+
+
+def test_skip_prefix(folder):
+    (folder / '.rvs-complete').touch()
+    (folder / 'sub' / '.rvs-manifest.json').write_text('{}')
+
+    reader = IndexedArchiveReader.from_stream(io.BytesIO(archive_bytes(folder, skip_prefix='.rvs-')))
+
+    assert [entry.path for entry in reader.entries()] == ['a.txt', 'sub/b.bin', 'sub/c.txt']
+
+
+@pytest.mark.parametrize('data', [
+    b'DSIA\x01',
+    b'not an archive at all, not even close to one',
+], ids=['too-short', 'bad-trailer'])
+def test_corrupt_archive(data):
+    with pytest.raises(ValueError, match='Not an indexed archive'):
+        IndexedArchiveReader.from_stream(io.BytesIO(data))
+
+
+@pytest.mark.parametrize('path', ['../escaped.txt', '/etc/escaped.txt', 'sub/../../escaped.txt'])
+def test_extract_rejects_unsafe_paths(folder, tmp_path, path):
+    data = archive_bytes(folder)
+    trailer = struct.Struct('<QQ4s')
+    index_offset, index_length, magic = trailer.unpack(data[-trailer.size:])
+    index = json.loads(data[index_offset:index_offset + index_length])
+    index['entries'][0]['path'] = path
+    index_bytes = json.dumps(index).encode('utf-8')
+    data = data[:index_offset] + index_bytes + trailer.pack(index_offset, len(index_bytes), magic)
+    reader = IndexedArchiveReader.from_stream(io.BytesIO(data))
+
+    with pytest.raises(ValueError, match='Unsafe path'):
+        reader.extract(path, tmp_path / 'out')
+    with pytest.raises(ValueError, match='Unsafe path'):
+        reader.extract_all(tmp_path / 'out')
+    assert not (tmp_path / 'escaped.txt').exists()
+
+
+def test_from_storage_fetches_members_in_few_requests(folder, tmp_path, monkeypatch):
+    monkeypatch.setattr(indexed_archive, '_STORAGE_WINDOW_SIZE', 128 * 1024)
+    handler = LocalStorageHandler(tmp_path / 'remote')
+    handler.upload(archive_bytes(folder), 'archive')
+    ranges = []
+    download_range = handler.download_range
+    monkeypatch.setattr(handler, 'download_range', lambda *args: ranges.append(args) or download_range(*args))
+
+    with IndexedArchiveReader.from_storage(handler, 'archive') as reader:
+        ranges.clear()
+        assert reader.read('sub/b.bin') == (folder / 'sub' / 'b.bin').read_bytes()
+
+    # ~300 KB of incompressible content, in 128 KB windows
+    assert len(ranges) == 3
+
+
+def test_from_storage_without_ranged_reads_downloads_once(folder, tmp_path, monkeypatch):
+    local = LocalStorageHandler(tmp_path / 'remote')
+    handler = CompressingStorageHandler(local, ZlibCompressor())
+    handler.upload(archive_bytes(folder), 'archive')
+    downloads = []
+    download = local.download
+    monkeypatch.setattr(local, 'download', lambda path: downloads.append(path) or download(path))
+
+    assert not handler.supports_ranged_reads
+    with IndexedArchiveReader.from_storage(handler, 'archive') as reader:
+        reader.extract_all(tmp_path / 'out')
+
+    assert downloads == ['archive']
+    assert (tmp_path / 'out' / 'words' / 'a.txt').read_bytes() == (folder / 'a.txt').read_bytes()
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+
+import pytest
+
+from dstools.common.file_lock import FileLock
+from dstools.resource_management import resource
+from dstools.resource_management.resource import (
+    COMPLETE_MARKER,
+    LOCAL_MANIFEST_NAME,
+    Resource,
+    ResourceMeta,
+    install_lock_path,
+)
+from dstools.resource_management.resource_config import ResourceConfig
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    config = ResourceConfig(
+        resources_root=str(tmp_path / 'resources'),
+        remote_root='remote',
+        remote_storage_type='LOCAL',
+        storage_config={'root_dir': str(tmp_path / 'store')},
+    )
+    monkeypatch.setattr(resource, 'get_config', lambda: config)
+    monkeypatch.setattr(ResourceMeta, '_instances', {})
+    return config
+
+
+@pytest.fixture(params=[False, True], ids=['archive', 'manifest'])
+def words(request):
+    class Words(Resource, resource_name='words', version='1', manifest=request.param, lazy=True):
+        pass
+
+    return Words
+
+
+def uploaded(resource_class):
+    """Upload a small version of the resource, and remove it locally."""
+    local_path = resource_class._resource_local_path()
+    (local_path / 'sub').mkdir(parents=True)
+    (local_path / 'a.txt').write_bytes(b'alpha ' * 1000)
+    (local_path / 'sub' / 'b.bin').write_bytes(os.urandom(5000))
+    contents = {path: (local_path / path).read_bytes() for path in ('a.txt', 'sub/b.bin')}
+    resource_class().upload()
+
+    for path in sorted(local_path.rglob('*'), reverse=True):
+        path.rmdir() if path.is_dir() else path.unlink()
+    local_path.rmdir()
+    ResourceMeta._instances.clear()
+    return local_path, contents
+
+
+def test_install_moves_staging_folder_into_place(words):
+    local_path, contents = uploaded(words)
+    # leftovers of an interrupted install
+    local_path.mkdir()
+    (local_path / 'stray.txt').write_bytes(b'partial')
+    (local_path.parent / f'.{local_path.name}.install-crashed').mkdir()
+
+    words().load()
+
+    assert (local_path / COMPLETE_MARKER).exists()
+    assert (local_path / LOCAL_MANIFEST_NAME).exists()
+    assert {path: (local_path / path).read_bytes() for path in contents} == contents
+    if not words._manifest_mode:
+        # archives are extracted aside and replace partial installs as a whole, manifests repair them in place
+        assert not (local_path / 'stray.txt').exists()
+        assert not list(local_path.parent.glob(f'.{local_path.name}.install-*'))
+
+
+def test_load_waits_for_the_install_lock(words):
+    local_path, _ = uploaded(words)
+    done = threading.Event()
+    loader = threading.Thread(target=lambda: (words().load(), done.set()))
+
+    with FileLock(install_lock_path(local_path)):
+        loader.start()
+        assert not done.wait(0.3)
+        assert not local_path.exists()
+
+    loader.join(10)
+    assert done.is_set()
+    assert (local_path / COMPLETE_MARKER).exists()
+
+
+def test_install_on_storage_without_existence_checks(words, monkeypatch):
+    local_path, contents = uploaded(words)
+
+    def exists(self, remote_relative_path):
+        raise NotImplementedError()
+
+    monkeypatch.setattr(LocalStorageHandler, 'exists', exists)
+    words().load()
+
+    assert {path: (local_path / path).read_bytes() for path in contents} == contents
+    assert (local_path / COMPLETE_MARKER).exists()
+
+
+def test_verify_detects_and_repairs_damaged_files(words):
+    local_path, contents = uploaded(words)
+    words().load()
+    assert words().verify() == []
+
+    (local_path / 'a.txt').write_bytes(b'ALPHA ' * 1000)
+    (local_path / 'sub' / 'b.bin').unlink()
+    assert words().verify(repair=False) == ['a.txt', 'sub/b.bin']
+    assert not (local_path / 'sub' / 'b.bin').exists()
+
+    assert words().verify() == ['a.txt', 'sub/b.bin']
+    assert {path: (local_path / path).read_bytes() for path in contents} == contents
+    assert (local_path / COMPLETE_MARKER).exists()
+    assert words().verify(full=True) == []
+
+
+def test_quick_verify_trusts_unchanged_mtimes(words):
+    local_path, _ = uploaded(words)
+    words().load()
+    stat = (local_path / 'a.txt').stat()
+    (local_path / 'a.txt').write_bytes(b'ALPHA ' * 1000)
+    os.utime(local_path / 'a.txt', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert words().verify() == []
+    assert words().verify(full=True) == ['a.txt']
+    assert (local_path / 'a.txt').read_bytes() == b'alpha ' * 1000
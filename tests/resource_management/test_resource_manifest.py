@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from dstools.resource_management.resource_manifest import (
+    LOCAL_MANIFEST_NAME,
+    ResourceManifest,
+    install_from_manifest,
+    upload_manifest,
+    verify_folder,
+)
+from dstools.storage.handlers.content_addressed_handler import ContentAddressedStorageHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+
+BLOBS = 'words/blobs'
+
+
+@pytest.fixture
+def handler(tmp_path):
+    return LocalStorageHandler(tmp_path / 'remote')
+
+
+@pytest.fixture
+def manifest(tmp_path, handler):
+    folder = tmp_path / 'source'
+    (folder / 'sub').mkdir(parents=True)
+    (folder / 'a.txt').write_bytes(b'alpha')
+    (folder / 'sub' / 'b.txt').write_bytes(b'beta')
+    manifest = ResourceManifest.from_folder(folder, 'words', '1')
+    upload_manifest(handler, folder, manifest, 'words/V1.manifest.json', BLOBS)
+    return manifest
+
+
+def blob_path(manifest, path):
+    return ContentAddressedStorageHandler(LocalStorageHandler('.'), prefix=BLOBS).digest_path(
+        manifest.files[path].sha256
+    )
+
+
+def test_install_and_verify(tmp_path, handler, manifest):
+    target = tmp_path / 'V1'
+    stats = install_from_manifest(handler, manifest, target, BLOBS)
+
+    assert stats.downloaded == 2
+    assert (target / 'sub' / 'b.txt').read_bytes() == b'beta'
+    saved = ResourceManifest.load(target / LOCAL_MANIFEST_NAME)
+    assert verify_folder(target, saved) == []
+
+    (target / 'a.txt').write_bytes(b'ALPHA')
+    assert verify_folder(target, saved) == ['a.txt']
+    (target / 'sub' / 'b.txt').unlink()
+    assert verify_folder(target, saved, full=True) == ['a.txt', 'sub/b.txt']
+
+
+def test_corrupted_blob_is_not_installed(tmp_path, handler, manifest):
+    # same size, other content
+    handler.upload(b'BETA', blob_path(manifest, 'sub/b.txt'))
+
+    with pytest.raises(IOError, match='Checksum mismatch'):
+        install_from_manifest(handler, manifest, tmp_path / 'V1', BLOBS)
+    assert not (tmp_path / 'V1' / 'sub' / 'b.txt').exists()
+    assert not (tmp_path / 'V1' / LOCAL_MANIFEST_NAME).exists()
+
+
+def test_existing_files_are_kept_only_if_intact(tmp_path, handler, manifest):
+    target = tmp_path / 'V1'
+    target.mkdir()
+    (target / 'a.txt').write_bytes(b'alpha')
+    # a file of the right size, but not the right content, e.g. of an interrupted install
+    (target / 'sub').mkdir()
+    (target / 'sub' / 'b.txt').write_bytes(b'\0\0\0\0')
+
+    stats = install_from_manifest(handler, manifest, target, BLOBS)
+
+    assert (stats.kept, stats.downloaded) == (1, 1)
+    assert (target / 'sub' / 'b.txt').read_bytes() == b'beta'
+
+
+def test_only_unchanged_files_of_other_versions_are_reused(tmp_path, handler, manifest):
+    previous = tmp_path / 'V0'
+    install_from_manifest(handler, manifest, previous, BLOBS)
+    # modified after its install, with the same size
+    (previous / 'a.txt').write_bytes(b'ALPHA')
+    os.utime(previous / 'a.txt', (1, 1))
+
+    stats = install_from_manifest(handler, manifest, tmp_path / 'V1', BLOBS, reuse_folders=[previous])
+
+    assert (stats.reused, stats.downloaded) == (1, 1)
+    assert (tmp_path / 'V1' / 'a.txt').read_bytes() == b'alpha'
+    assert (tmp_path / 'V1' / 'sub' / 'b.txt').read_bytes() == b'beta'
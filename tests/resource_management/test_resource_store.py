@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+from dstools.common.file_lock import FileLock
+from dstools.resource_management.resource import COMPLETE_MARKER, use_lock_path
+from dstools.resource_management.resource_store import ResourceStore, parse_size
+
+DAY = 86400
+
+
+def install(root, name, version, size, last_access=None):
+    path = root / name / f'V{version}'
+    path.mkdir(parents=True)
+    (path / 'data').write_bytes(b'x' * size)
+    (path / COMPLETE_MARKER).touch()
+    if last_access is not None:
+        lock_path = use_lock_path(path)
+        lock_path.touch()
+        os.utime(lock_path, (last_access, last_access))
+    return path
+
+
+def test_versions_does_not_create_use_locks(tmp_path):
+    month_ago = time.time() - 30 * DAY
+    never_used = install(tmp_path, 'words', '1', 10)
+    os.utime(never_used, (month_ago, month_ago))
+    install(tmp_path, 'words', '2', 10, last_access=month_ago)
+
+    for _ in range(2):
+        versions = ResourceStore(tmp_path).versions()
+        assert [v.last_access for v in versions] == pytest.approx([month_ago, month_ago])
+        assert not any(v.in_use for v in versions)
+    assert not use_lock_path(never_used).exists()
+
+
+def test_in_use_versions_are_detected_and_never_evicted(tmp_path):
+    now = time.time()
+    old = install(tmp_path, 'words', '1', 100, last_access=now - 3 * DAY)
+    used = install(tmp_path, 'words', '2', 100, last_access=now - 2 * DAY)
+    recent = install(tmp_path, 'names', '1', 100, last_access=now - DAY)
+
+    with FileLock(use_lock_path(used), shared=True):
+        assert [v.in_use for v in ResourceStore(tmp_path).versions()] == [False, False, True]
+        evicted = ResourceStore(tmp_path).gc(budget=150)
+
+    # the least recently used version that is not in use goes first
+    assert [(v.name, v.version) for v in evicted] == [('words', '1'), ('names', '1')]
+    assert not old.exists() and not recent.exists()
+    assert (used / 'data').exists()
+
+
+def test_gc_dry_run_and_budget(tmp_path):
+    now = time.time()
+    first = install(tmp_path, 'a', '1', 100, last_access=now - 2 * DAY)
+    install(tmp_path, 'b', '1', 100, last_access=now - DAY)
+    store = ResourceStore(tmp_path)
+
+    assert store.gc(budget=1000) == []
+    assert [v.path for v in store.gc(budget=150, dry_run=True)] == [first]
+    assert first.exists()
+    assert store.disk_usage() == {'a': 100, 'b': 100}
+
+
+@pytest.mark.skipif(os.geteuid() == 0, reason='root ignores file permissions')
+def test_read_only_root(tmp_path):
+    path = install(tmp_path, 'words', '1', 10)
+    for folder in (path, path.parent, tmp_path):
+        folder.chmod(0o555)
+    try:
+        store = ResourceStore(tmp_path)
+        assert [v.in_use for v in store.versions()] == [False]
+        assert store.gc(budget=0) == []
+    finally:
+        for folder in (tmp_path, path.parent, path):
+            folder.chmod(0o755)
+
+
+@pytest.mark.parametrize('text, size', [('1048576', 1048576), ('512M', 512 * 1024 ** 2), ('1.5K', 1536), ('50GB', 50 * 1024 ** 3)])
+def test_parse_size(text, size):
+    assert parse_size(text) == size
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from dstools.storage.handlers.caching_handler import CachingStorageHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+
+
+@pytest.fixture
+def remote(tmp_path):
+    return LocalStorageHandler(tmp_path / 'remote')
+
+
+@pytest.fixture
+def handler(remote, tmp_path):
+    return CachingStorageHandler(remote, tmp_path / 'cache', max_bytes=1000)
+
+
+def cached_paths(handler):
+    return sorted(path.name for path in (handler.cache_dir / 'objects').rglob('*') if path.is_file())
+
+
+def test_hits_and_misses(handler, remote):
+    remote.upload(b'content', 'obj')
+
+    assert handler.download('obj') == b'content'
+    assert handler.download('obj') == b'content'
+    assert handler.download_range('obj', 2, 5) == b'nte'
+    assert (handler.stats.hits, handler.stats.misses) == (2, 1)
+
+    # served from the cache, even once the remote object is gone
+    remote._local_path('obj').unlink()
+    assert handler.download('obj') == b'content'
+
+
+def test_evicts_least_recently_used(handler, remote):
+    for name in ('a', 'b', 'c', 'd'):
+        remote.upload(name.encode() * 300, name)
+    handler.download('a')
+    handler.download('b')
+    handler.download('c')
+    # 'a' becomes the most recently used
+    handler.download('a')
+
+    handler.download('d')
+
+    assert handler.stats.evictions >= 1
+    assert sum(path.stat().st_size for path in (handler.cache_dir / 'objects').rglob('*') if path.is_file()) <= 1000
+    assert handler.download('a') == b'a' * 300
+    assert handler.stats.hits == 2
+
+
+def test_budget_is_shared_between_handlers_of_one_directory(remote, tmp_path):
+    handlers = [CachingStorageHandler(remote, tmp_path / 'cache', max_bytes=1000) for _ in range(4)]
+    for i in range(24):
+        remote.upload(bytes([i]) * 100, f'obj{i}')
+        handlers[i % 4].download(f'obj{i}')
+
+    # each handler may overshoot by the bytes it wrote since its last rescan
+    assert len(cached_paths(handlers[0])) * 100 <= 1000 * (1 + 0.05 * 4)
+
+
+def test_uploads_invalidate(handler, remote):
+    remote.upload(b'old', 'obj')
+    assert handler.download('obj') == b'old'
+
+    assert handler.upload(b'new', 'obj')
+    assert handler.download('obj') == b'new'
+
+
+def test_read_during_upload_does_not_keep_old_content(handler, remote, monkeypatch):
+    remote.upload(b'old', 'obj')
+    upload = remote.upload
+
+    def slow_upload(content, path):
+        # another thread reads, and caches, the previous content while the upload is in flight
+        reader = threading.Thread(target=handler.download, args=(path,))
+        reader.start()
+        reader.join()
+        return upload(content, path)
+
+    monkeypatch.setattr(remote, 'upload', slow_upload)
+    handler.upload(b'new', 'obj')
+
+    assert handler.download('obj') == b'new'
+
+
+def test_large_objects_are_not_cached(handler, remote):
+    remote.upload(b'x' * 2000, 'big')
+
+    assert handler.download('big') == b'x' * 2000
+    assert cached_paths(handler) == []
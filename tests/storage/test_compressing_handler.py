@@ -0,0 +1,37 @@
+import pytest
+
+from dstools.compression.zlib_compressor import ZlibCompressor
+from dstools.storage.handlers.compressing_handler import CompressingStorageHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorageHandler(tmp_path)
+
+
+@pytest.fixture
+def handler(local):
+    return CompressingStorageHandler(local, ZlibCompressor())
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    b'short',
+    b'compressible ' * 1000,
+    b'DSZ2 starts like a header ' * 100,
+], ids=['empty', 'short', 'compressible', 'magic'])
+def test_size_is_the_decoded_size(handler, content):
+    handler.upload(content, 'obj')
+
+    assert handler.download('obj') == content
+    assert handler.size('obj') == len(content)
+
+
+def test_ranges_sized_from_size(handler, local):
+    content = bytes(range(256)) * 64
+    handler.upload(content, 'obj')
+    size = handler.size('obj')
+
+    assert local.size('obj') < size
+    assert handler.download_range('obj', size - 100, size) == content[-100:]
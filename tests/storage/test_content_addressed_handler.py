@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from dstools.storage.handlers.async_handler import AsyncStorageHandler
+from dstools.storage.handlers.content_addressed_handler import ContentAddressedStorageHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+
+
+class _ConcurrencyRecordingHandler(LocalStorageHandler):
+    """Local handler with existence checks, that records the peak number of concurrent calls."""
+
+    def __init__(self, root_dir):
+        super().__init__(root_dir)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.peak = 0
+
+    def _call(self, func, *args):
+        with self._lock:
+            self._in_flight += 1
+            self.peak = max(self.peak, self._in_flight)
+        try:
+            time.sleep(0.005)
+            return func(*args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def exists(self, remote_relative_path: str) -> bool:
+        return self._call(lambda: self._local_path(remote_relative_path).exists())
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        return self._call(super().upload, compressed_data, remote_relative_path)
+
+
+@pytest.fixture
+def remote(tmp_path):
+    return _ConcurrencyRecordingHandler(tmp_path / 'remote')
+
+
+def test_put_many_deduplicates(remote):
+    store = ContentAddressedStorageHandler(remote)
+
+    paths = store.put_many([b'a', b'b', b'a'], ['.txt'] * 3)
+
+    assert paths[0] == paths[2] != paths[1]
+    assert remote.download(paths[1]) == b'b'
+    # another suffix is another path
+    assert store.put_many([b'b', b'c'])[0] != paths[1]
+    assert store.stats.uploaded == 4
+    assert store.stats.skipped == 1
+
+
+def test_put_many_async_stays_within_the_async_concurrency(remote):
+    store = ContentAddressedStorageHandler(remote, max_workers=16)
+    async_storage = AsyncStorageHandler(remote, max_concurrency=3)
+    contents = [bytes([i]) for i in range(40)]
+
+    async def put():
+        return await asyncio.gather(*(store.put_many_async(async_storage, contents[i::4]) for i in range(4)))
+
+    batches = asyncio.run(put())
+    async_storage.close()
+
+    assert sorted(path for batch in batches for path in batch) == sorted(store.put_many(contents))
+    assert store.stats.uploaded == 40
+    assert remote.peak <= 3
+
+
+def test_shared_executor_bounds_concurrent_calls(remote):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        store = ContentAddressedStorageHandler(remote, executor=executor)
+        with ThreadPoolExecutor(max_workers=4) as callers:
+            list(callers.map(lambda i: store.put_many([bytes([i, j]) for j in range(10)]), range(4)))
+
+    assert store.stats.uploaded == 40
+    assert remote.peak <= 2
+
+
+def test_failed_uploads_raise(remote, monkeypatch):
+    store = ContentAddressedStorageHandler(remote)
+    monkeypatch.setattr(remote, 'upload', lambda content, path: False)
+
+    with pytest.raises(IOError, match='Failed to upload 1 content-addressed blobs'):
+        store.put_many([b'a'])
+    # a failed blob is not remembered as stored
+    assert store.exists_many([store.content_path(b'a')]) == [False]
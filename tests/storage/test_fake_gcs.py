@@ -0,0 +1,58 @@
+import pytest
+from google.api_core.exceptions import NotFound, RequestRangeNotSatisfiable
+
+from dstools.storage.handlers.fake_gcs import FakeBucket
+
+
+@pytest.fixture(params=['memory', 'disk'])
+def bucket(request, tmp_path):
+    return FakeBucket(tmp_path / 'bucket' if request.param == 'disk' else None)
+
+
+def test_upload_and_download(bucket):
+    bucket.blob('a/b').upload_from_string(b'hello')
+
+    assert bucket.blob('a/b').download_as_bytes() == b'hello'
+    assert bucket.get_blob('a/b').size == 5
+    assert bucket.get_blob('missing') is None
+
+
+def test_ranged_reads_have_inclusive_end(bucket):
+    bucket.blob('obj').upload_from_string(b'0123456789')
+
+    assert bucket.blob('obj').download_as_bytes(start=2, end=4) == b'234'
+    assert bucket.blob('obj').download_as_bytes(start=8) == b'89'
+    assert bucket.blob('obj').download_as_bytes(start=5, end=100) == b'56789'
+
+
+@pytest.mark.parametrize('start', [10, 11])
+def test_range_past_the_end_is_not_satisfiable(bucket, start):
+    bucket.blob('obj').upload_from_string(b'0123456789')
+
+    with pytest.raises(RequestRangeNotSatisfiable):
+        bucket.blob('obj').download_as_bytes(start=start)
+
+
+def test_ranged_read_of_empty_object(bucket):
+    bucket.blob('empty').upload_from_string(b'')
+
+    assert bucket.blob('empty').download_as_bytes(start=0, end=9) == b''
+
+
+def test_pinned_generation_fails_after_overwrite(bucket):
+    bucket.blob('obj').upload_from_string(b'v1')
+    pinned = bucket.get_blob('obj')
+    bucket.blob('obj').upload_from_string(b'v2 is longer')
+
+    with pytest.raises(NotFound):
+        pinned.download_as_bytes()
+
+
+def test_compose_and_list(bucket):
+    bucket.blob('parts/0').upload_from_string(b'abc')
+    bucket.blob('parts/1').upload_from_string(b'def')
+    bucket.blob('whole').compose([bucket.blob('parts/0'), bucket.blob('parts/1')])
+    bucket.delete_blobs([bucket.blob('parts/0'), bucket.blob('parts/1')])
+
+    assert bucket.blob('whole').download_as_bytes() == b'abcdef'
+    assert [blob.name for blob in bucket.list_blobs()] == ['whole']
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from dstools.storage.handlers.fake_gcs import FakeBlob, FakeBucket
+from dstools.storage.handlers.gcs_handler import GCSHandler
+
+PART_SIZE = 1024
+
+
+@pytest.fixture
+def bucket():
+    return FakeBucket()
+
+
+@pytest.fixture
+def handler(bucket):
+    return GCSHandler({'parallel_threshold': 4 * PART_SIZE, 'part_size': PART_SIZE, 'max_workers': 4}, bucket=bucket)
+
+
+@pytest.mark.parametrize('size', [
+    0,
+    1,
+    PART_SIZE - 1,
+    PART_SIZE,
+    PART_SIZE + 1,
+    2 * PART_SIZE,
+    4 * PART_SIZE,  # the parallel threshold
+    4 * PART_SIZE + 1,
+    40 * PART_SIZE + 7,  # more parts than a single compose accepts
+])
+def test_upload_download_roundtrip(handler, bucket, size, tmp_path):
+    content = os.urandom(size)
+
+    assert handler.upload(content, 'obj')
+    assert handler.download('obj') == content
+    assert handler.size('obj') == size
+
+    local_file = tmp_path / 'downloaded'
+    handler.download_to_file('obj', local_file)
+    assert local_file.read_bytes() == content
+
+    # the parts of parallel uploads are deleted once composed
+    assert [blob.name for blob in bucket.list_blobs()] == ['obj']
+
+
+@pytest.mark.parametrize('size', [0, PART_SIZE, 4 * PART_SIZE, 40 * PART_SIZE + 7])
+def test_upload_from_file(handler, bucket, size, tmp_path):
+    content = os.urandom(size)
+    local_file = tmp_path / 'payload'
+    local_file.write_bytes(content)
+
+    assert handler.upload_from_file(local_file, 'obj')
+    assert handler.download('obj') == content
+    assert [blob.name for blob in bucket.list_blobs()] == ['obj']
+
+
+def test_download_without_parallel_transfers(bucket):
+    handler = GCSHandler({'parallel_threshold': 0, 'part_size': PART_SIZE}, bucket=bucket)
+    content = os.urandom(10 * PART_SIZE)
+
+    assert handler.upload(content, 'obj')
+    assert handler.download('obj') == content
+
+
+def test_download_range(handler):
+    content = bytes(range(256)) * 8
+    handler.upload(content, 'obj')
+
+    assert handler.download_range('obj', 10, 20) == content[10:20]
+    assert handler.download_range('obj', 2000) == content[2000:]
+    assert handler.download_range('obj', 20, 10) == b''
+    # like a python slice, a range past the end is empty
+    assert handler.download_range('obj', len(content)) == b''
+    assert handler.download_range('obj', len(content) + 5, len(content) + 10) == b''
+
+
+def _record_ranges(monkeypatch):
+    ranges = []
+    download_as_bytes = FakeBlob.download_as_bytes
+
+    def recording(blob, start=None, end=None, timeout=None):
+        ranges.append((start, end))
+        return download_as_bytes(blob, start=start, end=end, timeout=timeout)
+
+    monkeypatch.setattr(FakeBlob, 'download_as_bytes', recording)
+    return ranges
+
+
+@pytest.mark.parametrize('size', [0, 1, PART_SIZE, 4 * PART_SIZE - 1])
+def test_download_below_threshold_reads_whole_object(handler, monkeypatch, size):
+    # whole-object reads are the ones the client validates against the object checksum
+    content = os.urandom(size)
+    handler.upload(content, 'obj')
+    ranges = _record_ranges(monkeypatch)
+
+    assert handler.download('obj') == content
+    assert ranges == [(None, None)]
+
+
+def test_parallel_download_checks_crc32c(handler, monkeypatch, tmp_path):
+    handler.upload(os.urandom(8 * PART_SIZE), 'obj')
+    download_as_bytes = FakeBlob.download_as_bytes
+
+    def corrupting(blob, start=None, end=None, timeout=None):
+        content = download_as_bytes(blob, start=start, end=end, timeout=timeout)
+        return bytes([content[0] ^ 1]) + content[1:] if start == PART_SIZE else content
+
+    monkeypatch.setattr(FakeBlob, 'download_as_bytes', corrupting)
+    with pytest.raises(IOError, match='Checksum mismatch'):
+        handler.download('obj')
+    with pytest.raises(IOError, match='Checksum mismatch'):
+        handler.download_to_file('obj', tmp_path / 'downloaded')
@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dstools.storage.handlers.async_handler import AsyncStorageHandler
+from dstools.storage.handlers.hedged_handler import HedgedAsyncStorageHandler
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+
+class _SlowFirstCallsHandler(StorageHandler):
+    """Downloads take 1ms, except the first attempt of every `slow_every`-th path, which takes 0.5s."""
+
+    def __init__(self, slow_every: int = 20):
+        self._slow_every = slow_every
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def download(self, remote_relative_path: str) -> bytes:
+        with self._lock:
+            attempt = self._attempts[remote_relative_path] = self._attempts.get(remote_relative_path, 0) + 1
+        slow = attempt == 1 and int(remote_relative_path) % self._slow_every == 0
+        time.sleep(0.5 if slow else 0.001)
+        return remote_relative_path.encode()
+
+    def download_range(self, remote_relative_path: str, start: int, end=None) -> bytes:
+        time.sleep(0.001)
+        return b'r'
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        return True
+
+
+def test_first_batch_is_hedged():
+    handler = HedgedAsyncStorageHandler(_SlowFirstCallsHandler(), max_concurrency=16, min_samples=10)
+
+    async def batch():
+        return await asyncio.gather(*[handler.download(str(i)) for i in range(200)])
+
+    start = time.perf_counter()
+    contents = asyncio.run(batch())
+    elapsed = time.perf_counter() - start
+    handler.close()
+
+    assert contents == [str(i).encode() for i in range(200)]
+    # the slow calls were started before any latency was measured, and are still hedged
+    assert handler.stats.hedges >= 5
+    assert handler.stats.hedge_wins >= 5
+    assert elapsed < 0.5
+
+
+def test_latencies_are_tracked_per_operation():
+    handler = HedgedAsyncStorageHandler(_SlowFirstCallsHandler(slow_every=10 ** 9), min_samples=1000)
+
+    async def calls():
+        await asyncio.gather(*[handler.download(str(i)) for i in range(5)])
+        await asyncio.gather(*[handler.download_range('x', 0, 1) for _ in range(3)])
+
+    asyncio.run(calls())
+    handler.close()
+
+    assert len(handler.latency_tracker('download')) == 5
+    assert len(handler.latency_tracker('download_range')) == 3
+
+
+class _InFlightHandler(StorageHandler):
+    """Counts the calls running at once; downloads of 'slow' block until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def download(self, remote_relative_path: str) -> bytes:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if remote_relative_path == 'slow':
+                self.release.wait(5)
+            else:
+                time.sleep(0.01)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return remote_relative_path.encode()
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        return True
+
+
+def test_cancelled_call_keeps_its_slot_until_its_thread_returns():
+    storage = _InFlightHandler()
+    executor = ThreadPoolExecutor(max_workers=4)
+    handler = AsyncStorageHandler(storage, max_concurrency=1, executor=executor)
+
+    async def calls():
+        slow = asyncio.ensure_future(handler.download('slow'))
+        await asyncio.sleep(0.05)
+        slow.cancel()
+        fast = asyncio.ensure_future(handler.download('fast'))
+        await asyncio.sleep(0.05)
+        assert not fast.done()
+        storage.release.set()
+        return await fast
+
+    assert asyncio.run(calls()) == b'fast'
+    handler.close()
+    executor.shutdown()
+    assert storage.max_in_flight == 1
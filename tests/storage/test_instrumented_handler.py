@@ -0,0 +1,77 @@
+import asyncio
+
+from dstools.storage.handlers.async_handler import AsyncStorageHandler
+from dstools.storage.handlers.instrumented_handler import InstrumentedStorageHandler, StorageMetrics
+from dstools.storage.handlers.storage_handler import StorageHandler
+
+
+class _FailingUploadsHandler(StorageHandler):
+    """Reports failed uploads by returning False, like the handlers of this package."""
+
+    def download(self, remote_relative_path: str) -> bytes:
+        return b'content'
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str) -> bool:
+        return not remote_relative_path.startswith('fail')
+
+
+def test_upload_returning_false_is_an_error(tmp_path):
+    handler = InstrumentedStorageHandler(_FailingUploadsHandler())
+    local_file = tmp_path / 'payload'
+    local_file.write_bytes(b'12345')
+
+    assert handler.upload(b'abc', 'ok')
+    assert not handler.upload(b'abc', 'fail')
+    assert not handler.upload_from_file(local_file, 'fail/file')
+    with open(local_file, 'rb') as stream:
+        assert not handler.upload_from_stream(stream, 'fail/stream')
+
+    operations = handler.metrics.snapshot()['operations']
+    assert operations['upload']['count'] == 2
+    assert operations['upload']['errors'] == 1
+    assert operations['upload']['bytes'] == 3
+    assert operations['upload_from_file']['errors'] == 1
+    assert operations['upload_from_stream']['errors'] == 1
+
+
+def test_async_upload_returning_false_is_an_error():
+    metrics = StorageMetrics()
+    handler = AsyncStorageHandler(_FailingUploadsHandler(), metrics=metrics)
+
+    async def uploads():
+        return await handler.upload_many([(b'abc', 'ok'), (b'abc', 'fail')])
+
+    assert asyncio.run(uploads()) == [True, False]
+    handler.close()
+    assert metrics.snapshot()['operations']['async_upload']['errors'] == 1
+
+
+class _SilentUploadsHandler(StorageHandler):
+    """Returns nothing from uploads, and reports failures by raising."""
+
+    def download(self, remote_relative_path: str) -> bytes:
+        return b'content'
+
+    def upload(self, compressed_data: bytes, remote_relative_path: str):
+        return None
+
+    def upload_from_stream(self, stream, remote_relative_path: str):
+        stream.read()
+        return None
+
+
+def test_upload_returning_none_is_a_success(tmp_path):
+    handler = InstrumentedStorageHandler(_SilentUploadsHandler())
+    local_file = tmp_path / 'payload'
+    local_file.write_bytes(b'12345')
+
+    handler.upload(b'abc', 'obj')
+    handler.upload_from_file(local_file, 'file')
+    with open(local_file, 'rb') as stream:
+        handler.upload_from_stream(stream, 'stream')
+
+    operations = handler.metrics.snapshot()['operations']
+    assert operations['upload']['errors'] == 0
+    assert operations['upload']['bytes'] == 3
+    assert operations['upload_from_file']['errors'] == 0
+    assert operations['upload_from_stream']['errors'] == 0
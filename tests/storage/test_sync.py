@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from dstools.storage import sync
+from dstools.storage.handlers.fake_gcs import FakeBucket
+from dstools.storage.handlers.gcs_handler import GCSHandler
+from dstools.storage.handlers.local_handler import LocalStorageHandler
+from dstools.storage.sync import SYNC_MANIFEST_NAME, sync_down, sync_up
+
+
+@pytest.fixture
+def handler(tmp_path):
+    return LocalStorageHandler(tmp_path / 'remote')
+
+
+@pytest.mark.parametrize('prefix', ['images', 'images/'])
+def test_sync_down_stays_within_the_prefix_directory(handler, tmp_path, prefix):
+    handler.upload(b'a', 'images/a.png')
+    handler.upload(b'c', 'images/sub/c.png')
+    handler.upload(b'b', 'images_v2/b.png')
+
+    result = sync_down(handler, prefix, tmp_path / 'local')
+
+    assert sorted(result.transferred) == ['images/a.png', 'images/sub/c.png']
+    assert (tmp_path / 'local' / 'a.png').read_bytes() == b'a'
+    assert not (tmp_path / 'local' / '_v2').exists()
+    assert sync_down(handler, prefix, tmp_path / 'local').skipped == 2
+
+
+def test_sync_up_roundtrip(handler, tmp_path):
+    local_dir = tmp_path / 'local'
+    (local_dir / 'sub').mkdir(parents=True)
+    (local_dir / 'a.txt').write_bytes(b'a')
+    (local_dir / 'sub' / 'b.txt').write_bytes(b'b')
+    handler.upload(b'other', 'data_v2/a.txt')
+
+    assert sorted(sync_up(handler, local_dir, 'data').transferred) == ['data/a.txt', 'data/sub/b.txt']
+    assert handler.download('data/sub/b.txt') == b'b'
+    assert sync_up(handler, local_dir, 'data').skipped == 2
+
+
+def test_interrupted_sync_keeps_its_progress(handler, tmp_path, monkeypatch):
+    monkeypatch.setattr(sync, '_SAVE_EVERY_SECONDS', 0)
+    for i in range(6):
+        handler.upload(f'{i}'.encode(), f'data/{i}.txt')
+
+    original_download = handler.download_to_file
+
+    def failing_download(remote_relative_path, local_path):
+        if remote_relative_path == 'data/5.txt':
+            # saved during the sync, not only when it ends
+            assert len(json.loads((tmp_path / 'local' / SYNC_MANIFEST_NAME).read_text())) == 5
+            raise KeyboardInterrupt()
+        original_download(remote_relative_path, local_path)
+
+    monkeypatch.setattr(handler, 'download_to_file', failing_download)
+    with pytest.raises(KeyboardInterrupt):
+        sync_down(handler, 'data', tmp_path / 'local', max_workers=1)
+
+    saved = json.loads((tmp_path / 'local' / SYNC_MANIFEST_NAME).read_text())
+    assert sorted(saved) == [f'{i}.txt' for i in range(5)]
+
+    monkeypatch.setattr(handler, 'download_to_file', original_download)
+    result = sync_down(handler, 'data', tmp_path / 'local')
+    assert result.transferred == ['data/5.txt']
+    assert result.skipped == 5
+
+
+def test_sync_up_hashes_each_changed_file_once(tmp_path, monkeypatch):
+    # a store with crc32c checksums, so files of the same size are compared by hash
+    handler = GCSHandler({}, bucket=FakeBucket())
+    local_dir = tmp_path / 'local'
+    local_dir.mkdir()
+    (local_dir / 'a.txt').write_bytes(b'new')
+    handler.upload(b'old', 'data/a.txt')
+    hashed = []
+    crc32c_file = sync.crc32c_file
+    monkeypatch.setattr(sync, 'crc32c_file', lambda path: hashed.append(path) or crc32c_file(path))
+
+    assert sync_up(handler, local_dir, 'data').transferred == ['data/a.txt']
+    assert handler.download('data/a.txt') == b'new'
+    assert len(hashed) == 1